@@ -0,0 +1,152 @@
+import math
+from time import perf_counter
+import numpy as np
+
+from bone_vector import BONE_ROTATIONAL_ROTATION_AXIS, BONE_ROTATIONAL_VECTOR_DIRECTION, BONE_TWISTING_ROTATION_AXIS, BONE_TWISTING_VECTOR_DIRECTION, bone_vector
+from forward import fk
+from inverse import IKResult, TerminationReason, ik
+
+
+def wrap_theta(theta: float) -> float:
+    """Wraps an angle into the range [-pi, pi].
+
+    Args:
+        theta (float): The angle.
+
+    Returns:
+        float: The wrapped angle.
+    """
+    return math.atan2(math.sin(theta), math.cos(theta))
+
+
+def within_limits(bone: bone_vector, theta: float) -> bool:
+    """Checks if the given angle is allowed for the given bone.
+
+    Args:
+        bone (bone_vector): The bone.
+        theta (float): The angle.
+
+    Returns:
+        bool: True if the angle is within the limits (or there are none).
+    """
+    if bone.theta_min is not None and theta < bone.theta_min:
+        return False
+    if bone.theta_max is not None and theta > bone.theta_max:
+        return False
+    return True
+
+
+def classify(start_bone: bone_vector) -> tuple[bone_vector, bone_vector, bone_vector] or None:
+    """Checks if the chain is a twisting base followed by two rotational bones.
+
+    Args:
+        start_bone (bone_vector): The first bone of the chain.
+
+    Returns:
+        tuple[bone_vector, bone_vector, bone_vector] or None: The three bones, or None if the chain has another shape.
+    """
+
+    # Collects the bones.
+    bones: list[bone_vector] = []
+    current: bone_vector or None = start_bone
+    while current is not None:
+        bones.append(current)
+        current = current.next
+
+    if len(bones) != 3:
+        return None
+
+    base, lower, upper = bones
+
+    # The base must twist around the vertical, and may only extend along it.
+    if tuple(base.rotation_axis) != BONE_TWISTING_ROTATION_AXIS or tuple(base.vector_direction) != BONE_TWISTING_VECTOR_DIRECTION:
+        return None
+
+    # The other two must pitch in the same plane.
+    for bone in (lower, upper):
+        if tuple(bone.rotation_axis) != BONE_ROTATIONAL_ROTATION_AXIS or tuple(bone.vector_direction) != BONE_ROTATIONAL_VECTOR_DIRECTION:
+            return None
+        if bone.vector_length <= 0.0:
+            return None
+
+    return base, lower, upper
+
+
+def solve_analytic(start_bone: bone_vector, target: np.array) -> list[tuple[float, float, float]] or None:
+    """Computes the closed-form joint angles for a twist + two-pitch chain.
+
+    Args:
+        start_bone (bone_vector): The first bone of the chain.
+        target (np.array): The target position.
+
+    Returns:
+        list[tuple[float, float, float]] or None: The solutions within the joint limits (both base and elbow branches),
+            or None if the chain cannot be solved analytically. Unreachable targets give the closest reachable pose.
+    """
+
+    bones = classify(start_bone)
+    if bones is None:
+        return None
+
+    base, lower, upper = bones
+    l1: float = lower.vector_length
+    l2: float = upper.vector_length
+
+    # The base yaw, the twisting bone itself only moves the arm up.
+    radial: float = math.hypot(target[0], target[2])
+    height: float = target[1] - base.vector_length
+    yaw: float = math.atan2(target[0], target[2]) if radial > 0.0 else base.theta
+
+    # The elbow angle from the law of cosines, clamped for unreachable targets.
+    cos_elbow: float = (radial ** 2 + height ** 2 - l1 ** 2 - l2 ** 2) / (2.0 * l1 * l2)
+    cos_elbow = min(1.0, max(-1.0, cos_elbow))
+    elbow: float = math.acos(cos_elbow)
+
+    solutions: list[tuple[float, float, float]] = []
+    for base_branch in (1.0, -1.0):
+        # The mirrored base branch faces away from the target, and reaches over the top.
+        base_theta: float = wrap_theta(yaw if base_branch > 0.0 else yaw + math.pi)
+        if not within_limits(base, base_theta):
+            continue
+
+        reach: float = radial * base_branch
+        for elbow_branch in (1.0, -1.0):
+            upper_theta: float = elbow * elbow_branch
+            lower_theta: float = wrap_theta(math.atan2(reach, height) - math.atan2(l2 * math.sin(upper_theta), l1 + l2 * math.cos(upper_theta)))
+            if not within_limits(lower, lower_theta) or not within_limits(upper, upper_theta):
+                continue
+
+            solutions.append((base_theta, lower_theta, upper_theta))
+
+    return solutions
+
+
+def ik_analytic(start_bone: bone_vector, end_bone: bone_vector, target: np.array, fallback: callable = ik, **kwargs) -> IKResult:
+    """Performs closed-form inverse kinematics, falls back to an iterative solver for other chains.
+
+    Args:
+        start_bone (bone_vector): The first bone of the chain.
+        end_bone (bone_vector): The last bone of the chain.
+        target (np.array): The target position.
+        fallback (callable, optional): The solver for chains we cannot classify. Defaults to ik.
+        **kwargs: Passed to the fallback solver.
+
+    Returns:
+        IKResult: The remaining error and solver statistics.
+    """
+    start_time: float = perf_counter()
+
+    solutions = solve_analytic(start_bone, target)
+    if not solutions:
+        return fallback(start_bone, end_bone, target, **kwargs)
+
+    # Picks the solution closest to the current pose, so the arm does not flip between branches.
+    bones: tuple[bone_vector, bone_vector, bone_vector] = (start_bone, start_bone.next, end_bone)
+    current: tuple[float, float, float] = tuple(bone.theta for bone in bones)
+    best = min(solutions, key=lambda solution: sum(abs(wrap_theta(a - b)) for a, b in zip(solution, current)))
+
+    for bone, theta in zip(bones, best):
+        bone.set_theta(theta)
+
+    error: float = np.linalg.norm(target - fk(end_bone))
+    return IKResult(error, 0, 1, perf_counter() - start_time, TerminationReason.Analytic)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+import math
+from time import perf_counter
+import numpy as np
+
+from analytic import ik_analytic, wrap_theta
+from bone_vector import bone_vector
+from helpers import rotation
+from inverse import IKResult, ik_dls
+
+ARC_TABLE_DEFAULT_SAMPLES: int = 720
+
+# The solving time per lookup (one control tick), in seconds. A budget by count would not bound the tick,
+#  an entry off the arm's reach falls back to ik_dls and takes milliseconds instead of microseconds.
+ARC_TABLE_DEFAULT_BUDGET_S: float = 0.0015
+
+
+def arc_points(angles: np.array, position: np.array, orientation: list[float], radius: float) -> np.array:
+    """Computes the points on the arc for an array of angles.
+
+    Args:
+        angles (np.array): The (N,) angles.
+        position (np.array): The center of the arc.
+        orientation (list[float]): The x, y and z rotation of the arc.
+        radius (float): The radius of the arc.
+
+    Returns:
+        np.array: The (N, 3) points.
+    """
+    angles = np.asarray(angles, dtype=float)
+    circle: np.array = np.stack([ np.cos(angles) * radius, np.sin(angles) * radius, np.zeros(angles.shape) ], axis=-1)
+    return np.add(position, circle @ rotation.xyz(orientation[0], orientation[1], orientation[2]).T)
+
+
+class ArcTable:
+    """A table of joint angles over a full turn of the arc, played back by interpolation.
+
+    When the arc changes, the entries are re-solved within a time budget per lookup: first the ones being
+    played, then the closest ones to them, so a lookup never solves the whole table at once.
+    """
+
+    def __init__(self, samples: int = ARC_TABLE_DEFAULT_SAMPLES, budget: float = ARC_TABLE_DEFAULT_BUDGET_S) -> None:
+        """Initializes a new, empty, arc table.
+
+        Args:
+            samples (int, optional): The number of entries over a full turn. Defaults to ARC_TABLE_DEFAULT_SAMPLES.
+            budget (float, optional): The time spent re-solving per lookup in seconds, the entries being played are solved regardless. Defaults to ARC_TABLE_DEFAULT_BUDGET_S.
+        """
+        self.samples = samples
+        self.budget = budget
+        self.angles: np.array = np.linspace(0.0, 2.0 * math.pi, samples, endpoint=False)
+
+        self.thetas: np.array or None = None
+        self.points: np.array or None = None
+        self.errors: np.array or None = None
+
+        # The entries not solved for the current arc yet, they still hold the solution of the previous arc.
+        self.stale: np.array = np.ones(samples, dtype=bool)
+
+        # The arc the table was compiled for, the start and end do not matter since it covers a full turn.
+        self.parameters: tuple or None = None
+        self.dirty = True
+        self.compilations: int = 0
+        self.solves: int = 0
+
+    def invalidate(self) -> None:
+        """Marks the arc as modified, the table gets checked (and retargeted if needed) on the next lookup.
+        """
+        self.dirty = True
+
+    def complete(self) -> bool:
+        return self.thetas is not None and not self.stale.any()
+
+    def retarget(self, start_bone: bone_vector, position: np.array, orientation: list[float], radius: float) -> None:
+        """Moves the table to a new arc, marks every entry stale without solving any.
+
+        Args:
+            start_bone (bone_vector): The first bone of the chain.
+            position (np.array): The center of the arc.
+            orientation (list[float]): The x, y and z rotation of the arc.
+            radius (float): The radius of the arc.
+        """
+        joints: int = 0
+        current: bone_vector or None = start_bone
+        while current is not None:
+            joints += 1
+            current = current.next
+
+        # The old entries are the starting points of the new ones, unless the chain changed.
+        if self.thetas is None or self.thetas.shape[1] != joints:
+            self.thetas = np.tile([ np.nan ] * joints, (self.samples, 1))
+            self.errors = np.full(self.samples, np.inf)
+
+        self.points = arc_points(self.angles, position, orientation, radius)
+        self.stale[:] = True
+        self.parameters = (tuple(float(value) for value in position), tuple(float(value) for value in orientation), float(radius))
+        self.compilations += 1
+
+    def refine(self, start_bone: bone_vector, end_bone: bone_vector, indices: np.array, deadline: float or None = None) -> None:
+        """Solves the given stale entries, each one starting from its old solution if there is one.
+
+        Args:
+            start_bone (bone_vector): The first bone of the chain.
+            end_bone (bone_vector): The last bone of the chain.
+            indices (np.array): The entries, in the order to solve them.
+            deadline (float or None, optional): The perf_counter() time after which no more entries are started. Defaults to None.
+        """
+        bones: list[bone_vector] = []
+        current: bone_vector or None = start_bone
+        while current is not None:
+            bones.append(current)
+            current = current.next
+
+        for index in indices:
+            if not self.stale[index]:
+                continue
+            if deadline is not None and perf_counter() >= deadline:
+                break
+
+            # Small arc edits barely move the solutions, otherwise the previously solved entry is the closest.
+            if not np.isnan(self.thetas[index, 0]):
+                for bone, theta in zip(bones, self.thetas[index]):
+                    bone.set_theta(float(theta))
+
+            result: IKResult = ik_analytic(start_bone, end_bone, self.points[index], fallback=ik_dls)
+            self.thetas[index] = [ bone.theta for bone in bones ]
+            self.errors[index] = result.error
+            self.stale[index] = False
+            self.solves += 1
+
+    def compile(self, start_bone: bone_vector, end_bone: bone_vector, position: np.array, orientation: list[float], radius: float) -> None:
+        """Solves every entry of the table at once.
+
+        Args:
+            start_bone (bone_vector): The first bone of the chain.
+            end_bone (bone_vector): The last bone of the chain.
+            position (np.array): The center of the arc.
+            orientation (list[float]): The x, y and z rotation of the arc.
+            radius (float): The radius of the arc.
+        """
+        self.retarget(start_bone, position, orientation, radius)
+        self.refine(start_bone, end_bone, np.arange(self.samples))
+        self.dirty = False
+
+    def lookup(self, start_bone: bone_vector, end_bone: bone_vector, angle: float, position: np.array, orientation: list[float], radius: float) -> tuple[np.array, np.array, float]:
+        """Gets the interpolated joint angles at an angle on the arc, re-solves part of the table first if the arc changed.
+
+        Args:
+            start_bone (bone_vector): The first bone of the chain.
+            end_bone (bone_vector): The last bone of the chain.
+            angle (float): The angle on the arc.
+            position (np.array): The center of the arc.
+            orientation (list[float]): The x, y and z rotation of the arc.
+            radius (float): The radius of the arc.
+
+        Returns:
+            tuple[np.array, np.array, float]: The joint angles, the point on the arc, and the error of the closest entry.
+        """
+        if self.dirty or self.thetas is None:
+            parameters: tuple = (tuple(float(value) for value in position), tuple(float(value) for value in orientation), float(radius))
+            if parameters != self.parameters or self.thetas is None:
+                self.retarget(start_bone, position, orientation, radius)
+            self.dirty = False
+
+        # Finds the two entries around the angle.
+        offset: float = (angle % (2.0 * math.pi)) / (2.0 * math.pi) * self.samples
+        lower: int = int(offset) % self.samples
+        upper: int = (lower + 1) % self.samples
+        fraction: float = offset - math.floor(offset)
+
+        # Solves the entries being played, then the stale ones closest to them until the budget is spent.
+        if self.stale.any():
+            deadline: float = perf_counter() + self.budget
+            self.refine(start_bone, end_bone, [ lower, upper ])
+            stale: np.array = np.flatnonzero(self.stale)
+            if stale.shape[0] > 0 and perf_counter() < deadline:
+                distance: np.array = np.abs(stale - lower)
+                distance = np.minimum(distance, self.samples - distance)
+                self.refine(start_bone, end_bone, stale[np.argsort(distance, kind='stable')], deadline)
+
+        # Interpolates along the shortest way around, so twisting joints do not spin at +-pi.
+        delta: np.array = np.array([ wrap_theta(value) for value in self.thetas[upper] - self.thetas[lower] ])
+        thetas: np.array = self.thetas[lower] + fraction * delta
+        point: np.array = self.points[lower] + fraction * (self.points[upper] - self.points[lower])
+        error: float = float(self.errors[lower if fraction < 0.5 else upper])
+        return thetas, point, error
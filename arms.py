@@ -0,0 +1,217 @@
+from __future__ import annotations
+from time import perf_counter
+import numpy as np
+
+from bone_vector import bone_vector
+from compact_chain import Chain
+from forward import fk
+from inverse import IKResult, ik_dls_batch
+from metrics import registry
+
+
+class Arm:
+    """A named arm: its own chain and joint state, where its base stands, and optionally its PHY."""
+
+    def __init__(self, name: str, start_bone: bone_vector, base_position: np.array or None = None, base_rotation: np.array or None = None, phy: any = None) -> None:
+        """Initializes a new arm.
+
+        Args:
+            name (str): The unique name of the arm.
+            start_bone (bone_vector): The first bone of the chain of this arm, not shared with other arms.
+            base_position (np.array or None, optional): The world position of the base. Defaults to the origin.
+            base_rotation (np.array or None, optional): The world rotation of the base. Defaults to the identity.
+            phy (any, optional): The Phy that drives the motors of this arm. Defaults to None.
+        """
+        self.name = name
+        self.start = start_bone
+        self.phy = phy
+
+        self.bones: list[bone_vector] = []
+        current: bone_vector or None = start_bone
+        while current is not None:
+            self.bones.append(current)
+            current = current.next
+        self.end: bone_vector = self.bones[-1]
+
+        self.base_position: np.array = np.zeros(3) if base_position is None else np.asarray(base_position, dtype=float)
+        self.base_rotation: np.array = np.identity(3) if base_rotation is None else np.asarray(base_rotation, dtype=float)
+
+        # The current target in world space, and the outcome of the last solve.
+        self.target: np.array or None = None
+        self.result: IKResult or None = None
+        self.solve_time: float = 0.0
+
+    def from_template(name: str, template: bone_vector, base_position: np.array or None = None, base_rotation: np.array or None = None, phy: any = None) -> Arm:
+        """Constructs an arm with its own copy of a chain.
+
+        Args:
+            name (str): The unique name of the arm.
+            template (bone_vector): The first bone of the chain to copy.
+            base_position (np.array or None, optional): The world position of the base. Defaults to the origin.
+            base_rotation (np.array or None, optional): The world rotation of the base. Defaults to the identity.
+            phy (any, optional): The Phy that drives the motors of this arm. Defaults to None.
+
+        Returns:
+            Arm: The resulting arm.
+        """
+        return Arm(name, bone_vector.from_spec(template.to_spec()), base_position, base_rotation, phy)
+
+    def thetas(self) -> np.array:
+        return np.array([ bone.theta for bone in self.bones ])
+
+    def set_thetas(self, thetas: np.array) -> None:
+        for bone, theta in zip(self.bones, thetas):
+            if bone.theta != theta:
+                bone.set_theta(float(theta))
+
+    def to_local(self, position: np.array) -> np.array:
+        """Transforms a world position into the frame of the base.
+
+        Args:
+            position (np.array): The world position.
+
+        Returns:
+            np.array: The position relative to the base.
+        """
+        return self.base_rotation.T @ (np.asarray(position, dtype=float) - self.base_position)
+
+    def to_world(self, position: np.array) -> np.array:
+        return self.base_position + self.base_rotation @ position
+
+    def position(self) -> np.array:
+        """Gets the world position of the end effector.
+
+        Returns:
+            np.array: The FK Position in world space.
+        """
+        return self.to_world(fk(self.end))
+
+    def set_target(self, target: np.array or None) -> None:
+        self.target = None if target is None else np.asarray(target, dtype=float)
+
+
+class ArmRegistry:
+    """All the arms of a line, arms with the same geometry get solved together in one batched step."""
+
+    def __init__(self) -> None:
+        self.arms: dict[str, Arm] = {}
+
+        # The shared geometry of every group, by chain fingerprint.
+        self.chains: dict[str, Chain] = {}
+        self.fingerprints: dict[str, str] = {}
+
+        # The timings of the last solve, by fingerprint.
+        self.group_times: dict[str, float] = {}
+        self.solve_time: float = 0.0
+
+    def __len__(self) -> int:
+        return len(self.arms)
+
+    def __getitem__(self, name: str) -> Arm:
+        return self.arms[name]
+
+    def register(self, arm: Arm) -> Arm:
+        """Adds an arm.
+
+        Args:
+            arm (Arm): The arm, its name must be unique.
+
+        Returns:
+            Arm: The same arm.
+        """
+        if arm.name in self.arms:
+            raise ValueError(f'An arm named \'{arm.name}\' is already registered')
+
+        fingerprint: str = arm.start.fingerprint()
+        if fingerprint not in self.chains:
+            self.chains[fingerprint] = Chain.from_bones(arm.start)
+
+        self.arms[arm.name] = arm
+        self.fingerprints[arm.name] = fingerprint
+        return arm
+
+    def remove(self, name: str) -> Arm:
+        arm: Arm = self.arms.pop(name)
+        fingerprint: str = self.fingerprints.pop(name)
+
+        # Drops the geometry once its last arm is gone.
+        if fingerprint not in self.fingerprints.values():
+            del self.chains[fingerprint]
+            self.group_times.pop(fingerprint, None)
+        return arm
+
+    def groups(self) -> dict[str, list[Arm]]:
+        """Groups the arms by chain geometry.
+
+        Returns:
+            dict[str, list[Arm]]: The arms of every fingerprint, in registration order.
+        """
+        result: dict[str, list[Arm]] = {}
+        for name, arm in self.arms.items():
+            result.setdefault(self.fingerprints[name], []).append(arm)
+        return result
+
+    def solve(self, write: bool = True, **kwargs) -> dict[str, IKResult]:
+        """Solves the current target of every arm, one batched damped-least-squares step per group.
+
+        Args:
+            write (bool, optional): If the new angles should be written to the PHY of each arm. Defaults to True.
+            **kwargs: Passed to ik_dls_batch.
+
+        Returns:
+            dict[str, IKResult]: The result of every arm that has a target, by name.
+        """
+        start_time: float = perf_counter()
+        results: dict[str, IKResult] = {}
+
+        for fingerprint, arms in self.groups().items():
+            arms = [ arm for arm in arms if arm.target is not None ]
+            if len(arms) == 0:
+                continue
+
+            # Every arm solves in its own base frame, starting from its own pose.
+            group_start: float = perf_counter()
+            thetas: np.array = np.array([ arm.thetas() for arm in arms ])
+            targets: np.array = np.array([ arm.to_local(arm.target) for arm in arms ])
+            solved, group_results = ik_dls_batch(self.chains[fingerprint], thetas, targets, **kwargs)
+
+            for arm, arm_thetas, result in zip(arms, solved, group_results):
+                arm.set_thetas(arm_thetas)
+                arm.result = result
+                results[arm.name] = result
+
+            # The batch is one solve, every arm gets its share.
+            group_time: float = perf_counter() - group_start
+            self.group_times[fingerprint] = group_time
+            for arm in arms:
+                arm.solve_time = group_time / len(arms)
+                registry.observe_ik(arm.result, prefix=f'arm.{arm.name}')
+
+            if write:
+                for arm in arms:
+                    if arm.phy is not None:
+                        arm.phy.write_chain(arm.start)
+
+        self.solve_time = perf_counter() - start_time
+        registry.observe('arms.solve_time', self.solve_time)
+        return results
+
+    def stats(self) -> dict:
+        """Gets the outcome and timings of the last solve.
+
+        Returns:
+            dict: The total solve time, the size and time of every group, and the result of every arm.
+        """
+        groups: dict[str, list[Arm]] = self.groups()
+        return {
+            'solve_time': self.solve_time,
+            'groups': { fingerprint: { 'arms': [ arm.name for arm in arms ], 'solve_time': self.group_times.get(fingerprint) } for fingerprint, arms in groups.items() },
+            'arms': {
+                name: {
+                    'error': None if arm.result is None else arm.result.error,
+                    'iterations': None if arm.result is None else arm.result.iterations,
+                    'reason': None if arm.result is None else arm.result.reason.name,
+                    'solve_time': arm.solve_time
+                } for name, arm in self.arms.items()
+            }
+        }
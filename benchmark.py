@@ -0,0 +1,498 @@
+"""
+Headless benchmarks for the hot paths: FK, IK, rotation math, the FK pass of the renderer and PHY encoding, checks.py has the pass/fail checks.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from time import perf_counter_ns, time
+import numpy as np
+
+from analytic import ik_analytic
+from arms import Arm, ArmRegistry
+from bone_vector import bone_vector
+from chain import chain_init
+from compiler import compiled_fk
+from forward import fk, fk_batch, fk_points
+from helpers import rad, rotation
+from inverse import IKResult, ik, ik_dls, ik_multistart
+from parallel import solve_parallel
+from recorder import Recorder, Recording, Replayer
+from retiming import joint_limits, retime
+from solution_cache import SolutionCache
+
+BENCHMARK_DEFAULT_OUTPUT: str = 'bench_results.json'
+BENCHMARK_DEFAULT_REPEATS: int = 2000
+BENCHMARK_DEFAULT_TARGETS: int = 200
+BENCHMARK_DEFAULT_SEED: int = 0
+BENCHMARK_DEFAULT_TOLERANCE: float = 0.2
+
+# Cold start: the time from launching Python to the first solved target, and the modules that must stay unloaded (see checks.py).
+BENCHMARK_STARTUP_RUNS: int = 5
+BENCHMARK_STARTUP_BUDGET_S: float = 0.3
+BENCHMARK_STARTUP_SCRIPT: str = 'import numpy as np; import chain; from analytic import ik_analytic; import main, phy, headless, recorder, retiming, window, renderer; print(len(chain.chain_bones)); bones = chain.chain_init(); ik_analytic(bones[\'chain_bottom\'], bones[\'chain_top\'], np.array([ 10.0, 30.0, 20.0 ]))'
+BENCHMARK_STARTUP_LAZY_MODULES: tuple[str, ...] = ('pygame', 'OpenGL', 'serial')
+
+# How much longer than one ik_dls solve ik_multistart may take on the reachable targets (p50), its batch iterates
+#  about as fast as ik_dls and stops with the first seed that converges, the rest is building the seeds.
+BENCHMARK_MULTISTART_RATIO: float = 1.5
+
+
+# The chain, built in main.
+chain_bottom: bone_vector or None = None
+chain_top: bone_vector or None = None
+
+
+class FakeSerial:
+    """Stands in for a serial port, only counts what gets written."""
+
+    def __init__(self) -> None:
+        self.bytes_written: int = 0
+        self.writes: int = 0
+
+    def write(self, data: bytes) -> int:
+        self.bytes_written += len(data)
+        self.writes += 1
+        return len(data)
+
+
+def summarize(samples_ns: list[int]) -> dict[str, float]:
+    """Computes the latency statistics of a list of samples.
+
+    Args:
+        samples_ns (list[int]): The samples, in nanoseconds.
+
+    Returns:
+        dict[str, float]: The statistics, in microseconds.
+    """
+    samples_us: np.array = np.array(samples_ns, dtype=float) / 1000.0
+    return {
+        'count': int(samples_us.shape[0]),
+        'mean_us': float(np.mean(samples_us)),
+        'p50_us': float(np.percentile(samples_us, 50)),
+        'p90_us': float(np.percentile(samples_us, 90)),
+        'p99_us': float(np.percentile(samples_us, 99)),
+        'max_us': float(np.max(samples_us))
+    }
+
+
+def measure(function: callable, repeats: int) -> dict[str, float]:
+    """Measures the latency of a function without arguments.
+
+    Args:
+        function (callable): The function.
+        repeats (int): The number of calls.
+
+    Returns:
+        dict[str, float]: The statistics.
+    """
+    samples: list[int] = []
+    for i in range(0, repeats):
+        start: int = perf_counter_ns()
+        function()
+        samples.append(perf_counter_ns() - start)
+    return summarize(samples)
+
+
+def bones() -> list[bone_vector]:
+    result: list[bone_vector] = []
+    current: bone_vector or None = chain_bottom
+    while current is not None:
+        result.append(current)
+        current = current.next
+    return result
+
+
+def set_thetas(thetas: np.array) -> None:
+    for bone, theta in zip(bones(), thetas):
+        bone.set_theta(float(theta))
+
+
+def random_thetas(rng: np.random.Generator, count: int) -> np.array:
+    """Samples joint angles within the limits of the chain.
+
+    Args:
+        rng (np.random.Generator): The random generator.
+        count (int): The number of configurations.
+
+    Returns:
+        np.array: The (count, J) joint angles.
+    """
+    lower: list[float] = [ -math.pi if bone.theta_min is None else bone.theta_min for bone in bones() ]
+    upper: list[float] = [ math.pi if bone.theta_max is None else bone.theta_max for bone in bones() ]
+    return rng.uniform(lower, upper, size=(count, len(lower)))
+
+
+def benchmark_targets(rng: np.random.Generator, count: int) -> dict[str, np.array]:
+    """Generates the fixed target sets, reachable ones come from FK of random poses.
+
+    Args:
+        rng (np.random.Generator): The random generator.
+        count (int): The number of targets per set.
+
+    Returns:
+        dict[str, np.array]: The reachable and unreachable targets.
+    """
+    reach: float = sum(bone.vector_length for bone in bones())
+    directions: np.array = rng.normal(size=(count, 3))
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    return {
+        'reachable': fk_batch(chain_bottom, random_thetas(rng, count)),
+        'unreachable': directions * reach * rng.uniform(1.2, 2.0, size=(count, 1))
+    }
+
+
+def benchmark_fk(rng: np.random.Generator, repeats: int) -> dict:
+    thetas: np.array = random_thetas(rng, repeats)
+    results: dict = {}
+
+    # A full evaluation, every angle changed.
+    samples: list[int] = []
+    for row in thetas:
+        set_thetas(row)
+        start: int = perf_counter_ns()
+        fk(chain_top)
+        samples.append(perf_counter_ns() - start)
+    results['fk'] = summarize(samples)
+
+    # The FK pass of Window.draw_chain.
+    results['fk_points'] = measure(lambda: fk_points(chain_top), repeats)
+
+    # All configurations in one vectorized pass.
+    start: int = perf_counter_ns()
+    fk_batch(chain_bottom, thetas)
+    results['fk_batch'] = { 'count': repeats, 'total_us': (perf_counter_ns() - start) / 1000.0 }
+    return results
+
+
+def benchmark_rotation(rng: np.random.Generator, repeats: int) -> dict:
+    axis: tuple[float, float, float] = (0.0, 1.0, 0.0)
+    general_axis: tuple[float, float, float] = (0.6, 0.8, 0.0)
+
+    # The stacked kernels get a thousand angles per call, written into the same buffer.
+    thetas: np.array = rng.uniform(-math.pi, math.pi, 1000)
+    out: np.array = np.empty((thetas.shape[0], 3, 3))
+    return {
+        'along_axis': measure(lambda: rotation.along_axis(axis, 0.3), repeats),
+        'along_axis_general': measure(lambda: rotation.along_axis(general_axis, 0.3), repeats),
+        'xyz': measure(lambda: rotation.xyz(-0.7, 0.1, 0.2), repeats),
+        'along_axis_stack_1000': measure(lambda: rotation.along_axis(axis, thetas, out=out), max(1, repeats // 100)),
+        'xyz_stack_1000': measure(lambda: rotation.xyz(thetas, 0.1, 0.2, out=out), max(1, repeats // 100))
+    }
+
+
+def benchmark_compiler(repeats: int) -> dict:
+    function: callable = compiled_fk(chain_top)
+    thetas: list[float] = [ 0.1, 0.2, 0.3 ]
+    return {
+        'compiled_fk': measure(lambda: function(thetas), repeats),
+        'compiled_fk_lookup': measure(lambda: compiled_fk(chain_top), repeats)
+    }
+
+
+def benchmark_ik(rng: np.random.Generator, targets: dict[str, np.array], repeats: int) -> dict:
+    solvers: dict[str, callable] = {
+        'ik': ik,
+        'ik_dls': ik_dls,
+        'ik_multistart': ik_multistart,
+        'ik_analytic': ik_analytic
+    }
+
+    results: dict = {}
+    for solver_name, solver in solvers.items():
+        for target_name, target_set in targets.items():
+            samples: list[int] = []
+            errors: list[float] = []
+            iterations: list[int] = []
+            evaluations: list[int] = []
+            reasons: dict[str, int] = {}
+            for target in target_set:
+                chain_bottom.reset_chain()
+                start: int = perf_counter_ns()
+                result: IKResult = solver(chain_bottom, chain_top, target)
+                samples.append(perf_counter_ns() - start)
+                errors.append(result.error)
+                iterations.append(result.iterations)
+                evaluations.append(result.fk_evaluations)
+                reasons[result.reason.name] = reasons.get(result.reason.name, 0) + 1
+
+            summary: dict = summarize(samples)
+            summary['error_mean'] = float(np.mean(errors))
+            summary['error_p90'] = float(np.percentile(errors, 90))
+            summary['success_rate'] = float(np.mean(np.array(errors) < 0.1))
+            summary['iterations_mean'] = float(np.mean(iterations))
+            summary['iterations_p90'] = float(np.percentile(iterations, 90))
+            summary['fk_evaluations_mean'] = float(np.mean(evaluations))
+            summary['reasons'] = reasons
+            results[f'{solver_name}/{target_name}'] = summary
+
+    # The window puts the solution cache in front of ik_analytic, a hit has to be cheaper than solving.
+    cache: SolutionCache = SolutionCache()
+    target: np.array = targets['reachable'][0]
+    cache.solve(chain_bottom, chain_top, target, solver=ik_analytic)
+    results['solution_cache/hit'] = measure(lambda: cache.solve(chain_bottom, chain_top, target, solver=ik_analytic), repeats)
+    results['solution_cache/solve'] = measure(lambda: ik_analytic(chain_bottom, chain_top, target), repeats)
+    results['solution_cache/hit']['hits'] = cache.hits
+
+    chain_bottom.reset_chain()
+    return results
+
+
+def benchmark_parallel(targets: dict[str, np.array]) -> dict:
+    # Enough targets to keep every worker busy for a while.
+    target_set: np.array = np.tile(targets['reachable'], (20, 1))
+
+    results: dict = {}
+    workers: int = 1
+    while True:
+        start: int = perf_counter_ns()
+        _, solved = solve_parallel(chain_bottom, target_set, solver=ik_dls, workers=workers)
+        duration: float = (perf_counter_ns() - start) / 1e9
+        results[f'workers_{workers}'] = {
+            'count': len(solved),
+            'total_s': duration,
+            'targets_per_second': len(solved) / duration,
+            'success_rate': float(np.mean([ result.error < 0.1 for result in solved ]))
+        }
+
+        if workers >= (os.cpu_count() or 1):
+            break
+        workers = min(workers * 2, os.cpu_count() or 1)
+
+    return results
+
+
+def benchmark_arms(targets: dict[str, np.array], repeats: int) -> dict:
+    results: dict = {}
+    for count in (1, 2, 4, 8, 16):
+        arms: ArmRegistry = ArmRegistry()
+        for index in range(count):
+            arms.register(Arm.from_template(f'arm{index}', chain_bottom, base_position=np.array([ 100.0 * index, 0.0, 0.0 ])))
+
+        def solve() -> None:
+            # Every arm starts from the zero pose, with its own target.
+            for index, arm in enumerate(arms.arms.values()):
+                arm.set_thetas(np.zeros(len(arm.bones)))
+                arm.set_target(arm.to_world(targets['reachable'][index % targets['reachable'].shape[0]]))
+            arms.solve()
+
+        def solve_serial() -> None:
+            # The same work as one ik_dls call per arm.
+            for index, arm in enumerate(arms.arms.values()):
+                arm.set_thetas(np.zeros(len(arm.bones)))
+                ik_dls(arm.start, arm.end, targets['reachable'][index % targets['reachable'].shape[0]])
+
+        results[f'batched_{count}'] = measure(solve, max(1, repeats // 100))
+        results[f'serial_{count}'] = measure(solve_serial, max(1, repeats // 100))
+    return results
+
+
+def import_times(script: str) -> tuple[list[tuple[str, int, int]], str]:
+    """Runs a script in a fresh interpreter with -X importtime.
+
+    Args:
+        script (str): The Python source to run.
+
+    Returns:
+        tuple[list[tuple[str, int, int]], str]: The name, own and cumulative time in microseconds of every import, and the output of the script.
+    """
+    directory: str = os.path.dirname(os.path.abspath(__file__))
+    process: subprocess.CompletedProcess = subprocess.run([ sys.executable, '-X', 'importtime', '-c', script ], cwd=directory, check=True, capture_output=True, text=True)
+
+    # Lines look like 'import time: self [us] | cumulative | imported package'.
+    imports: list[tuple[str, int, int]] = []
+    for line in process.stderr.splitlines():
+        fields: list[str] = line.removeprefix('import time:').split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        imports.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return imports, process.stdout
+
+
+def benchmark_startup() -> dict:
+    directory: str = os.path.dirname(os.path.abspath(__file__))
+
+    # Every run is a fresh interpreter, the way the controller restarts.
+    samples: list[int] = []
+    for _ in range(BENCHMARK_STARTUP_RUNS):
+        start: int = perf_counter_ns()
+        subprocess.run([ sys.executable, '-c', BENCHMARK_STARTUP_SCRIPT ], cwd=directory, check=True, stdout=subprocess.DEVNULL)
+        samples.append(perf_counter_ns() - start)
+    results: dict = summarize(samples)
+
+    # Breaks the imports down, what may be imported at all is up to checks.py.
+    imports, _ = import_times(BENCHMARK_STARTUP_SCRIPT)
+    results['imports_top'] = { name: { 'self_us': own, 'cumulative_us': cumulative } for name, own, cumulative in sorted(imports, key=lambda entry: -entry[1])[:15] }
+    results['budget_s'] = BENCHMARK_STARTUP_BUDGET_S
+    results['within_budget'] = results['p50_us'] / 1e6 <= BENCHMARK_STARTUP_BUDGET_S
+    return results
+
+
+def benchmark_phy(repeats: int) -> dict:
+    # Only imported here, the rest of the suite should not need pyserial.
+    from phy import Phy
+
+    serial: FakeSerial = FakeSerial()
+    phy: Phy = Phy(ser=serial)
+    results: dict = {
+        'move': measure(lambda: phy.move(0, 1.2345), repeats),
+        'write_chain': measure(lambda: phy.write_chain(chain_bottom), repeats)
+    }
+    results['bytes_written'] = serial.bytes_written
+    results['writes'] = serial.writes
+    return results
+
+
+def benchmark_recorder(targets: dict[str, np.array], repeats: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path: str = os.path.join(directory, 'benchmark.rec')
+        recorder: Recorder = Recorder(path, len(bones()), capacity=repeats)
+        target: np.array = targets['reachable'][0]
+        thetas: list[float] = [ bone.theta for bone in bones() ]
+        results: dict = { 'append': measure(lambda: recorder.append(0.0, target, thetas, 0.0, 0.0), repeats) }
+
+        # Records the analytic solves of the reachable targets like the window would, then times replaying them.
+        recorder = Recorder(path, len(bones()), capacity=len(targets['reachable']))
+        chain_bottom.reset_chain()
+        for index, target in enumerate(targets['reachable']):
+            result: IKResult = ik_analytic(chain_bottom, chain_top, target)
+            recorder.append(index * 0.01, target, [ bone.theta for bone in bones() ], result.error, result.wall_time)
+        recorder.close()
+
+        chain_bottom.reset_chain()
+        summary: dict = Replayer(Recording(path), chain_bottom, chain_top, solver=ik_analytic).summary()
+        results['replay'] = { 'records': summary['records'], 'total_us': summary['duration'] * 1e6 }
+        chain_bottom.reset_chain()
+    return results
+
+
+def benchmark_retiming(rng: np.random.Generator, repeats: int) -> dict:
+    velocity, acceleration = joint_limits()
+    jump: np.array = np.array([ [ 0.0, 0.0, 0.0 ], [ math.pi, rad(90), rad(-120) ] ])
+    path: np.array = random_thetas(rng, 50)
+    results: dict = {
+        'jump': measure(lambda: retime(jump, velocity, acceleration), max(1, repeats // 10)),
+        'path': measure(lambda: retime(path, velocity, acceleration), max(1, repeats // 10))
+    }
+
+    results['jump_duration_s'] = float(retime(jump, velocity, acceleration)[0][-1])
+    return results
+
+
+def git_commit() -> str or None:
+    try:
+        return subprocess.run([ 'git', 'rev-parse', 'HEAD' ], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Compares the median latencies to a previous run.
+
+    Args:
+        results (dict): The current results.
+        baseline (dict): The previous results.
+        tolerance (float): The allowed relative slowdown.
+
+    Returns:
+        list[str]: A description of every regression.
+    """
+    regressions: list[str] = []
+    for group, benchmarks in results['benchmarks'].items():
+        for name, result in benchmarks.items():
+            if not isinstance(result, dict) or 'p50_us' not in result:
+                continue
+            previous: dict or None = baseline.get('benchmarks', {}).get(group, {}).get(name)
+            if previous is None or 'p50_us' not in previous:
+                continue
+            if result['p50_us'] > previous['p50_us'] * (1.0 + tolerance):
+                regressions.append(f'{group}/{name}: p50 {previous["p50_us"]:.1f}us -> {result["p50_us"]:.1f}us')
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Runs the headless benchmarks.')
+    parser.add_argument('--output', default=BENCHMARK_DEFAULT_OUTPUT, help='the JSON file to write the results to')
+    parser.add_argument('--repeats', type=int, default=BENCHMARK_DEFAULT_REPEATS, help='the number of calls per micro benchmark')
+    parser.add_argument('--targets', type=int, default=BENCHMARK_DEFAULT_TARGETS, help='the number of IK targets per set')
+    parser.add_argument('--seed', type=int, default=BENCHMARK_DEFAULT_SEED, help='the random seed')
+    parser.add_argument('--only', nargs='*', choices=[ 'startup', 'fk', 'rotation', 'compiler', 'ik', 'parallel', 'arms', 'phy', 'recorder', 'retiming' ], help='only run these groups')
+    parser.add_argument('--baseline', help='a previous results file, fails on regressions')
+    parser.add_argument('--tolerance', type=float, default=BENCHMARK_DEFAULT_TOLERANCE, help='the allowed relative p50 slowdown')
+    args = parser.parse_args()
+
+    global chain_bottom, chain_top
+    bones: dict[str, bone_vector] = chain_init()
+    chain_bottom, chain_top = bones['chain_bottom'], bones['chain_top']
+    rng: np.random.Generator = np.random.default_rng(args.seed)
+    targets: dict[str, np.array] = benchmark_targets(rng, args.targets)
+
+    groups: dict[str, callable] = {
+        'startup': benchmark_startup,
+        'fk': lambda: benchmark_fk(rng, args.repeats),
+        'rotation': lambda: benchmark_rotation(rng, args.repeats),
+        'compiler': lambda: benchmark_compiler(args.repeats),
+        'ik': lambda: benchmark_ik(rng, targets, args.repeats),
+        'parallel': lambda: benchmark_parallel(targets),
+        'arms': lambda: benchmark_arms(targets, args.repeats),
+        'phy': lambda: benchmark_phy(args.repeats),
+        'recorder': lambda: benchmark_recorder(targets, args.repeats),
+        'retiming': lambda: benchmark_retiming(rng, args.repeats)
+    }
+
+    results: dict = {
+        'timestamp': time(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'seed': args.seed,
+        'benchmarks': {}
+    }
+    for name, group in groups.items():
+        if args.only and name not in args.only:
+            continue
+        results['benchmarks'][name] = group()
+        print(f'{name}: done')
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Wrote results to {args.output}')
+
+    # Cold start must stay fast, what it may load is up to checks.py.
+    startup: dict or None = results['benchmarks'].get('startup')
+    if startup is not None and not startup['within_budget']:
+        print(f'Startup took {startup["p50_us"] / 1e6:.3f}s, the budget is {BENCHMARK_STARTUP_BUDGET_S}s')
+        return 1
+
+    # A cache hit that costs more than solving is worse than no cache.
+    ik_results: dict or None = results['benchmarks'].get('ik')
+    if ik_results is not None and ik_results['solution_cache/hit']['p50_us'] >= ik_results['solution_cache/solve']['p50_us']:
+        print(f'A solution cache hit ({ik_results["solution_cache/hit"]["p50_us"]:.1f}us) is not faster than solving ({ik_results["solution_cache/solve"]["p50_us"]:.1f}us)')
+        return 1
+
+    # Multi-start is the interactive fallback, it has to stay close to the latency of a single solve.
+    if ik_results is not None:
+        ratio: float = ik_results['ik_multistart/reachable']['p50_us'] / ik_results['ik_dls/reachable']['p50_us']
+        if ratio > BENCHMARK_MULTISTART_RATIO:
+            print(f'ik_multistart takes {ratio:.2f}x as long as ik_dls, the limit is {BENCHMARK_MULTISTART_RATIO}x')
+            return 1
+
+    # Fails if we got slower than the baseline.
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            regressions: list[str] = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if len(regressions) > 0:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
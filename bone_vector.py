@@ -1,4 +1,5 @@
 from __future__ import annotations
+import hashlib
 import numpy as np
 
 from helpers import rotation
@@ -15,20 +16,103 @@ BONE_ROTATIONAL_VECTOR_DIRECTION: tuple[int, int, int] = (0, 1, 0)
 class bone_vector:
     def __init__(self, theta: float = 0.0, rotation_axis: tuple[float, float, float] = (0.0, 1.0, 0.0), vector_length: float = 0.0, vector_direction: tuple[float, float, float] = (0, 1, 0), next: bone_vector or None = None, theta_min: float or None = None, theta_max: float or None = None) -> None:
         self.theta = theta
-        self.rotation_axis = rotation_axis
-        self.vector_length = vector_length
-        self.vector_direction = vector_direction
         self.next = next
         self.prev = None
-        self.theta_min = theta_min
-        self.theta_max = theta_max
+
+        # The geometry, behind properties so changing it clears the caches that depend on it.
+        self._rotation_axis = rotation_axis
+        self._vector_length = vector_length
+        self._vector_direction = vector_direction
+        self._theta_min = theta_min
+        self._theta_max = theta_max
 
         self.matrix_cache = None
+        self.frame_cache = None
+        self.tip_cache = None
+        self.fingerprint_cache = None
+
+    @property
+    def rotation_axis(self) -> tuple[float, float, float]:
+        return self._rotation_axis
+
+    @rotation_axis.setter
+    def rotation_axis(self, rotation_axis: tuple[float, float, float]) -> None:
+        self._rotation_axis = rotation_axis
+        self.invalidate_chain()
+
+    @property
+    def vector_length(self) -> float:
+        return self._vector_length
+
+    @vector_length.setter
+    def vector_length(self, vector_length: float) -> None:
+        self._vector_length = vector_length
+        self.invalidate_chain()
+
+    @property
+    def vector_direction(self) -> tuple[float, float, float]:
+        return self._vector_direction
+
+    @vector_direction.setter
+    def vector_direction(self, vector_direction: tuple[float, float, float]) -> None:
+        self._vector_direction = vector_direction
+        self.invalidate_chain()
+
+    @property
+    def theta_min(self) -> float or None:
+        return self._theta_min
+
+    @theta_min.setter
+    def theta_min(self, theta_min: float or None) -> None:
+        self._theta_min = theta_min
+        self.invalidate_chain()
+
+    @property
+    def theta_max(self) -> float or None:
+        return self._theta_max
+
+    @theta_max.setter
+    def theta_max(self, theta_max: float or None) -> None:
+        self._theta_max = theta_max
+        self.invalidate_chain()
 
     def set_theta(self, theta: float) -> None:
         self.theta = theta
         self.matrix_cache = None
 
+        # Our own rotation moves everything from us to the tip, so the bone-to-tip
+        #  transforms of us and everything before us are outdated, and so are the
+        #  base-to-bone transforms of everything after us. A cache that is already
+        #  empty means the rest in that direction is empty too.
+        current: bone_vector or None = self
+        while current is not None and current.tip_cache is not None:
+            current.tip_cache = None
+            current = current.prev
+
+        current = self.next
+        while current is not None and current.frame_cache is not None:
+            current.frame_cache = None
+            current = current.next
+
+    def invalidate_chain(self) -> None:
+        """Clears all the cached transforms in the chain from this bone, the geometry setters call it.
+        """
+
+        temp: bone_vector or None = self
+        while temp is not None:
+            temp.matrix_cache = None
+            temp.frame_cache = None
+            temp.tip_cache = None
+            temp.fingerprint_cache = None
+            temp = temp.next
+
+        # The bone-to-tip transforms and fingerprints of the bones before us cover our geometry too.
+        temp = self.prev
+        while temp is not None:
+            temp.tip_cache = None
+            temp.fingerprint_cache = None
+            temp = temp.prev
+
     def vector(self) -> np.array:
         """Generates the untransformed vector of the matrix.
 
@@ -49,6 +133,37 @@ class bone_vector:
         self.matrix_cache = rotation.along_axis(self.rotation_axis, self.theta)
         return self.matrix_cache
 
+    def frame(self) -> tuple[np.array, np.array]:
+        """Gets the cumulative base-to-bone transform, the frame this bone is attached to.
+
+        Returns:
+            tuple[np.array, np.array]: The world rotation of the previous bones, and the world position of this bone.
+        """
+        if self.frame_cache is not None:
+            return self.frame_cache
+
+        if self.prev is None:
+            self.frame_cache = (np.identity(3), np.array([ 0.0, 0.0, 0.0 ]))
+        else:
+            prev_rotation, prev_position = self.prev.frame()
+            frame_rotation: np.array = np.matmul(prev_rotation, self.prev.matrix())
+            self.frame_cache = (frame_rotation, np.add(prev_position, np.matmul(frame_rotation, self.prev.vector())))
+
+        return self.frame_cache
+
+    def tip(self) -> np.array:
+        """Gets the cumulative bone-to-tip transform, the end of the chain as seen from this bone.
+
+        Returns:
+            np.array: The end effector position relative to this bone, in the frame this bone is attached to.
+        """
+        if self.tip_cache is not None:
+            return self.tip_cache
+
+        next_tip: np.array = self.next.tip() if self.next is not None else np.array([ 0.0, 0.0, 0.0 ])
+        self.tip_cache = np.matmul(self.matrix(), np.add(self.vector(), next_tip))
+        return self.tip_cache
+
     def print(self) -> None:
         """Prints the ourselves.
         """
@@ -68,12 +183,74 @@ class bone_vector:
             prev = current
             current = current.next
 
+        # The shape of the chain might have changed.
+        self.invalidate_chain()
+
     def reset_chain(self) -> None:
         temp: bone_vector or None = self
         while temp is not None:
-            temp.theta = 0.0
+            temp.set_theta(0.0)
+            temp = temp.next
+
+    def fingerprint(self) -> str:
+        """Generates a stable fingerprint of the geometry of the chain from this bone, ignoring the angles.
+
+        The fingerprint is kept until the geometry of the chain changes, or invalidate_chain is called.
+
+        Returns:
+            str: The fingerprint.
+        """
+        if self.fingerprint_cache is not None:
+            return self.fingerprint_cache
+
+        geometry: list[tuple] = []
+        temp: bone_vector or None = self
+        while temp is not None:
+            geometry.append((tuple(float(value) for value in temp.rotation_axis), float(temp.vector_length), tuple(float(value) for value in temp.vector_direction), temp.theta_min, temp.theta_max))
             temp = temp.next
 
+        self.fingerprint_cache = hashlib.sha1(repr(geometry).encode()).hexdigest()
+        return self.fingerprint_cache
+
+    def to_spec(self) -> list[dict]:
+        """Snapshots the chain from this bone into plain data, for sending it to another process.
+
+        Returns:
+            list[dict]: The angle and geometry of every bone, from this bone to the end.
+        """
+
+        spec: list[dict] = []
+        temp: bone_vector or None = self
+        while temp is not None:
+            spec.append({
+                'theta': float(temp.theta),
+                'rotation_axis': tuple(float(value) for value in temp.rotation_axis),
+                'vector_length': float(temp.vector_length),
+                'vector_direction': tuple(float(value) for value in temp.vector_direction),
+                'theta_min': temp.theta_min,
+                'theta_max': temp.theta_max
+            })
+            temp = temp.next
+
+        return spec
+
+    def from_spec(spec: list[dict]) -> bone_vector:
+        """Builds a new, linked, chain from a snapshot made by to_spec.
+
+        Args:
+            spec (list[dict]): The bones, from the start to the end.
+
+        Returns:
+            bone_vector: The first bone of the new chain.
+        """
+
+        next: bone_vector or None = None
+        for values in reversed(spec):
+            next = bone_vector(next=next, **values)
+
+        next.link()
+        return next
+
     def print_chain(self) -> None:
         """Prints the entire bone-vector chain from this bone.
         """
@@ -1,28 +1,61 @@
 from helpers import generalize_unit, rad
 from bone_vector import bone_vector
 
-chain_top = bone_vector.rotational(
-    vector_length=generalize_unit(34.0, 'mm'),
-    theta=rad(0),
-    theta_min=rad(-120),
-    theta_max=rad(120)
-)
-
-chain_middle = bone_vector.rotational(
-    vector_length=generalize_unit(30.5, 'mm'),
-    next=chain_top,
-    theta=rad(0),
-    theta_min=rad(-90),
-    theta_max=rad(90)
-)
-
-chain_bottom = bone_vector.twisting(
-    theta=rad(0.0),
-    vector_length=generalize_unit(0, 'mm'),
-    next=chain_middle,
-    theta_min=rad(-180.0),
-    theta_max=rad(180.0)
-)
-
-def chain_init() -> None:
-    chain_bottom.link()
+CHAIN_NAMES: tuple[str, ...] = ('chain_bottom', 'chain_middle', 'chain_top')
+
+# The bones of the chain by name, built on first use.
+chain_bones: dict[str, bone_vector] = {}
+
+
+def chain_build() -> dict[str, bone_vector]:
+    """Builds the bones of the chain, once.
+
+    Returns:
+        dict[str, bone_vector]: The bones by name.
+    """
+    if len(chain_bones) > 0:
+        return chain_bones
+
+    chain_top = bone_vector.rotational(
+        vector_length=generalize_unit(34.0, 'mm'),
+        theta=rad(0),
+        theta_min=rad(-120),
+        theta_max=rad(120)
+    )
+
+    chain_middle = bone_vector.rotational(
+        vector_length=generalize_unit(30.5, 'mm'),
+        next=chain_top,
+        theta=rad(0),
+        theta_min=rad(-90),
+        theta_max=rad(90)
+    )
+
+    chain_bottom = bone_vector.twisting(
+        theta=rad(0.0),
+        vector_length=generalize_unit(0, 'mm'),
+        next=chain_middle,
+        theta_min=rad(-180.0),
+        theta_max=rad(180.0)
+    )
+
+    chain_bones.update(chain_bottom=chain_bottom, chain_middle=chain_middle, chain_top=chain_top)
+    return chain_bones
+
+
+def chain_init() -> dict[str, bone_vector]:
+    """Builds (once) and links the chain.
+
+    Returns:
+        dict[str, bone_vector]: The bones by name.
+    """
+    bones: dict[str, bone_vector] = chain_build()
+    bones['chain_bottom'].link()
+    return bones
+
+
+def __getattr__(name: str) -> bone_vector:
+    # The chain_bottom, chain_middle and chain_top globals, built when first imported.
+    if name in CHAIN_NAMES:
+        return chain_build()[name]
+    raise AttributeError(f'module \'{__name__}\' has no attribute \'{name}\'')
@@ -0,0 +1,410 @@
+"""
+Luke's Inverse Kinematics - Headless correctness checks, exits nonzero when one fails, benchmark.py only measures.
+"""
+
+from __future__ import annotations
+import argparse
+import math
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+import numpy as np
+
+from analytic import ik_analytic
+from arc import ArcTable
+from arms import Arm, ArmRegistry
+from benchmark import BENCHMARK_STARTUP_LAZY_MODULES, BENCHMARK_STARTUP_SCRIPT, FakeSerial, import_times
+from bone_vector import bone_vector
+from chain import chain_init
+from compact_chain import Chain
+from compiler import COMPILER_VERIFY_TOLERANCE, compiled_fk, verify
+from forward import fk, fk_batch, fk_points
+from inverse import IKResult, ik, ik_dls, ik_multistart
+from parallel import solve_parallel
+from phy import PHY_PROTOCOL_BINARY, Phy, decode_binary
+from recorder import Recorder, Recording, Replayer
+from retiming import RETIMING_DEFAULT_RATE, Retimer, joint_limits
+from solution_cache import SolutionCache
+
+CHECKS_DEFAULT_SAMPLES: int = 100
+CHECKS_DEFAULT_SEED: int = 0
+
+# The error at which a target counts as solved, the same as the solvers use.
+CHECKS_EPSILON: float = 0.1
+
+# The share of reachable targets ik has to solve from the reset pose, it solves about 83% of them with the per-joint step.
+CHECKS_IK_SUCCESS_RATE: float = 0.8
+
+# The largest difference allowed between two ways of computing the same thing.
+CHECKS_FK_TOLERANCE: float = 1e-9
+CHECKS_REPLAY_TOLERANCE: float = 1e-9
+CHECKS_RETIMING_TOLERANCE: float = 1e-6
+
+
+def chain_list(start_bone: bone_vector) -> list[bone_vector]:
+    bones: list[bone_vector] = []
+    current: bone_vector or None = start_bone
+    while current is not None:
+        bones.append(current)
+        current = current.next
+    return bones
+
+
+def random_thetas(start_bone: bone_vector, rng: np.random.Generator, count: int) -> np.array:
+    """Samples joint angles within the limits of a chain.
+
+    Args:
+        start_bone (bone_vector): The first bone of the chain.
+        rng (np.random.Generator): The random generator.
+        count (int): The number of configurations.
+
+    Returns:
+        np.array: The (count, J) joint angles.
+    """
+    bones: list[bone_vector] = chain_list(start_bone)
+    lower: list[float] = [ -math.pi if bone.theta_min is None else bone.theta_min for bone in bones ]
+    upper: list[float] = [ math.pi if bone.theta_max is None else bone.theta_max for bone in bones ]
+    return rng.uniform(lower, upper, size=(count, len(bones)))
+
+
+def set_thetas(start_bone: bone_vector, thetas: np.array) -> None:
+    for bone, theta in zip(chain_list(start_bone), thetas):
+        bone.set_theta(float(theta))
+
+
+def check_startup(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # Importing the entry points must not load the GUI or serial dependencies, nor build the chain.
+    imports, output = import_times(BENCHMARK_STARTUP_SCRIPT)
+    failures: list[str] = [ f'importing the entry points loaded {name}' for name in sorted({ name for name, _, _ in imports if name.split('.')[0] in BENCHMARK_STARTUP_LAZY_MODULES }) ]
+    if output.split()[0] != '0':
+        failures.append(f'importing the entry points built {output.split()[0]} bones, the chain should wait for chain_init')
+    return failures
+
+
+def check_fk(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # The cached fk, the FK pass of the renderer, the batched one and a cold chain must all agree.
+    failures: list[str] = []
+    thetas: np.array = random_thetas(start_bone, rng, samples)
+    batched: np.array = fk_batch(start_bone, thetas)
+    cold: bone_vector = bone_vector.from_spec(start_bone.to_spec())
+    cold_end: bone_vector = chain_list(cold)[-1]
+
+    # Anything with a matrix, a vector and the links is a bone to fk, with or without the cached transforms.
+    plain: list[SimpleNamespace] = [ SimpleNamespace(matrix=bone.matrix, vector=bone.vector, prev=None, next=None) for bone in chain_list(cold) ]
+    for previous, bone in zip(plain, plain[1:]):
+        previous.next, bone.prev = bone, previous
+    plain_end: SimpleNamespace = plain[-1]
+    bones: list[bone_vector] = chain_list(start_bone)
+    for row, expected in zip(thetas, batched):
+        # Changes a single joint first, so the caches of the others get reused.
+        bones[int(rng.integers(len(bones)))].set_theta(float(rng.uniform(-math.pi, math.pi)))
+        fk(end_bone)
+        set_thetas(start_bone, row)
+        set_thetas(cold, row)
+        cold.invalidate_chain()
+
+        for name, position in (('fk', fk(end_bone)), ('fk_points', fk_points(end_bone)[-1]), ('cold fk', fk(cold_end)), ('uncached fk', fk(plain_end))):
+            deviation: float = float(np.max(np.abs(position - expected)))
+            if deviation > CHECKS_FK_TOLERANCE:
+                failures.append(f'{name} deviates from fk_batch by {deviation} at {row.tolist()}')
+    return failures[:10]
+
+
+def check_geometry(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # Editing the geometry of a bone clears every cache that depends on it, without invalidating by hand.
+    failures: list[str] = []
+    copy: bone_vector = bone_vector.from_spec(start_bone.to_spec())
+    bones: list[bone_vector] = chain_list(copy)
+    for thetas in random_thetas(copy, rng, samples):
+        set_thetas(copy, thetas)
+        fingerprint: str = copy.fingerprint()
+        fk(bones[-1])
+        compiled_fk(bones[-1])(thetas.tolist())
+
+        bone: bone_vector = bones[int(rng.integers(len(bones)))]
+        bone.vector_length = float(rng.uniform(10.0, 40.0))
+        expected: np.array = fk_batch(copy, thetas)[0]
+        for name, position in (('fk', fk(bones[-1])), ('compiled fk', compiled_fk(bones[-1])(thetas.tolist()))):
+            deviation: float = float(np.max(np.abs(position - expected)))
+            if deviation > CHECKS_FK_TOLERANCE:
+                failures.append(f'{name} deviates by {deviation} after changing a bone length')
+        if copy.fingerprint() == fingerprint:
+            failures.append('the fingerprint did not change with a bone length')
+
+
+        # The limits are part of the fingerprint too.
+        fingerprint = copy.fingerprint()
+        bone.theta_min = -float(rng.uniform(0.5, 3.0))
+        if copy.fingerprint() == fingerprint:
+            failures.append('the fingerprint did not change with a joint limit')
+    return failures[:10]
+
+
+def check_compiler(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # The compiled FK has to match the generic one, for every prefix of the chain.
+    failures: list[str] = []
+    for index, bone in enumerate(chain_list(start_bone)):
+        deviation: float = verify(bone, samples)
+        if deviation > COMPILER_VERIFY_TOLERANCE:
+            failures.append(f'the compiled FK up to bone {index} deviates from the generic FK by {deviation}')
+    return failures
+
+
+def check_ik(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # Every solver reports the error the chain is left at, and stays within the joint limits.
+    failures: list[str] = []
+    targets: np.array = fk_batch(start_bone, random_thetas(start_bone, rng, samples))
+    bones: list[bone_vector] = chain_list(start_bone)
+    for solver in (ik, ik_dls, ik_multistart, ik_analytic):
+        solved: int = 0
+        for target in targets:
+            start_bone.reset_chain()
+            result: IKResult = solver(start_bone, end_bone, target)
+            error: float = float(np.linalg.norm(target - fk(end_bone)))
+            solved += error < CHECKS_EPSILON
+            if abs(error - result.error) > CHECKS_FK_TOLERANCE:
+                failures.append(f'{solver.__name__} reported an error of {result.error}, the chain is at {error}')
+            for bone in bones:
+                if (bone.theta_min is not None and bone.theta < bone.theta_min - CHECKS_FK_TOLERANCE) or (bone.theta_max is not None and bone.theta > bone.theta_max + CHECKS_FK_TOLERANCE):
+                    failures.append(f'{solver.__name__} left a joint at {bone.theta}, outside [{bone.theta_min}, {bone.theta_max}]')
+
+        # The arm is a twist and two pitches, the closed form reaches everything that FK reached.
+        if solver is ik_analytic and solved < targets.shape[0]:
+            failures.append(f'ik_analytic solved {solved} of {targets.shape[0]} reachable targets')
+        if solver is ik and solved < CHECKS_IK_SUCCESS_RATE * targets.shape[0]:
+            failures.append(f'ik solved {solved} of {targets.shape[0]} reachable targets, less than {CHECKS_IK_SUCCESS_RATE:.0%}')
+
+    start_bone.reset_chain()
+    return failures[:10]
+
+
+def check_compact_chain(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # The views of a compact chain solve like the linked chain it was built from, to the same angles.
+    failures: list[str] = []
+    chain: Chain = Chain.from_bones(start_bone)
+    if chain.start.fingerprint() != start_bone.fingerprint():
+        failures.append('the compact chain has another fingerprint than the linked chain')
+
+    targets: np.array = fk_batch(start_bone, random_thetas(start_bone, rng, samples))
+    for solver in (ik, ik_dls, ik_multistart, ik_analytic):
+        solved: int = 0
+        for target in targets:
+            start_bone.reset_chain()
+            chain.reset_chain()
+            result: IKResult = solver(chain.start, chain.end, target)
+            error: float = float(np.linalg.norm(target - fk(chain.end)))
+            solved += error < CHECKS_EPSILON
+            if abs(error - result.error) > CHECKS_FK_TOLERANCE or abs(error - float(np.linalg.norm(target - fk_batch(chain, chain.thetas)[0]))) > CHECKS_FK_TOLERANCE:
+                failures.append(f'{solver.__name__} on a compact chain reported an error of {result.error}, the chain is at {error}')
+
+            # The random seeds of ik_multistart differ between calls, the others are deterministic.
+            if solver is not ik_multistart:
+                solver(start_bone, end_bone, target)
+                deviation: float = float(np.max(np.abs(chain.thetas - [ bone.theta for bone in chain_list(start_bone) ])))
+                if deviation > CHECKS_FK_TOLERANCE:
+                    failures.append(f'{solver.__name__} solved a compact chain {deviation} away from the linked chain')
+
+        if solver is ik_analytic and solved < targets.shape[0]:
+            failures.append(f'ik_analytic solved {solved} of {targets.shape[0]} reachable targets on a compact chain')
+
+    start_bone.reset_chain()
+    return failures[:10]
+
+
+def check_solution_cache(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # A hit must put the chain on a pose that reaches the target, wherever the chain was.
+    failures: list[str] = []
+    cache: SolutionCache = SolutionCache()
+    for target in fk_batch(start_bone, random_thetas(start_bone, rng, samples)):
+        start_bone.reset_chain()
+        cache.solve(start_bone, end_bone, target, solver=ik_analytic)
+        set_thetas(start_bone, random_thetas(start_bone, rng, 1)[0])
+        result: IKResult = cache.solve(start_bone, end_bone, target, solver=ik_analytic)
+        error: float = float(np.linalg.norm(target - fk(end_bone)))
+        if error > CHECKS_EPSILON or abs(error - result.error) > CHECKS_FK_TOLERANCE:
+            failures.append(f'a cached solution left the chain {error} from the target, reported {result.error}')
+    if cache.hits != samples:
+        failures.append(f'{cache.hits} of {samples} repeated targets hit the cache')
+
+    # Another solver may pick another branch, so it never gets the solutions of this one.
+    hits: int = cache.hits
+    cache.solve(start_bone, end_bone, target, solver=ik_dls)
+    if cache.hits != hits:
+        failures.append('a solution of ik_analytic was served to ik_dls')
+
+    start_bone.reset_chain()
+    return failures[:10]
+
+
+def check_arc(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # A lookup starts no solve past its budget, only the entries being played are solved regardless.
+    failures: list[str] = []
+    reach: float = sum(bone.vector_length for bone in chain_list(start_bone))
+    position: np.array = np.array([ 0.0, 0.0, 0.0 ])
+    orientation: list[float] = [ math.pi / 2, 0.0, 0.0 ]
+
+    # Half of this arc is out of reach, those entries take the slow fallback.
+    table: ArcTable = ArcTable(samples, budget=0.0)
+    start_bone.reset_chain()
+    table.lookup(start_bone, end_bone, 0.0, position, orientation, reach * 1.2)
+    if table.solves != 2:
+        failures.append(f'a lookup without budget solved {table.solves} entries, only the two being played should be')
+
+    # With a budget, the lookups get through the whole table.
+    table = ArcTable(samples)
+    for index in range(0, samples):
+        table.lookup(start_bone, end_bone, 2.0 * math.pi * index / samples, position, orientation, reach * 0.8)
+        if table.complete():
+            break
+    if not table.complete():
+        failures.append(f'{samples} lookups left {int(table.stale.sum())} of {samples} entries unsolved')
+
+    start_bone.reset_chain()
+    return failures
+
+
+def check_arms(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # A batched solve of several arms gives every arm what its own ik_dls call would, all from the reset pose.
+    failures: list[str] = []
+    start_bone.reset_chain()
+    targets: np.array = fk_batch(start_bone, random_thetas(start_bone, rng, samples))
+    arms: ArmRegistry = ArmRegistry()
+    for index in range(samples):
+        arms.register(Arm.from_template(f'arm{index}', start_bone, base_position=np.array([ 100.0 * index, 0.0, 0.0 ])))
+        arms[f'arm{index}'].set_target(arms[f'arm{index}'].to_world(targets[index]))
+    results: dict[str, IKResult] = arms.solve(write=False)
+
+    for index, target in enumerate(targets):
+        arm: Arm = arms[f'arm{index}']
+        serial: Arm = Arm.from_template('serial', start_bone)
+        serial.set_thetas(np.zeros(len(serial.bones)))
+        ik_dls(serial.start, serial.end, target)
+        deviation: float = float(np.max(np.abs(arm.thetas() - serial.thetas())))
+        if deviation > CHECKS_FK_TOLERANCE:
+            failures.append(f'{arm.name} solved to {arm.thetas().tolist()} in a batch, {serial.thetas().tolist()} on its own')
+        if abs(float(np.linalg.norm(target - fk(arm.end))) - results[arm.name].error) > CHECKS_FK_TOLERANCE:
+            failures.append(f'{arm.name} reported an error of {results[arm.name].error}')
+    return failures[:10]
+
+
+def check_parallel(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # The answers must not depend on the number of workers or the chunking.
+    targets: np.array = fk_batch(start_bone, random_thetas(start_bone, rng, samples))
+    serial, _ = solve_parallel(start_bone, targets, solver=ik_dls, workers=1)
+    pooled, _ = solve_parallel(start_bone, targets, solver=ik_dls, workers=2, chunk_size=max(1, samples // 4))
+    deviation: float = float(np.max(np.abs(serial - pooled)))
+    return [] if deviation <= CHECKS_FK_TOLERANCE else [ f'solving on 2 workers deviates from 1 worker by {deviation}' ]
+
+
+def check_phy(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # What write_chain sends decodes back to the pulses of every joint.
+    failures: list[str] = []
+    serial: FakeSerial = FakeSerial()
+    phy: Phy = Phy(ser=serial, protocol=PHY_PROTOCOL_BINARY)
+    for thetas in random_thetas(start_bone, rng, samples):
+        set_thetas(start_bone, thetas)
+        expected: list[int] = [ Phy.pulses(index, theta) for index, theta in enumerate(thetas) ]
+        pulses: list[int] = decode_binary(phy.frame({ index: value for index, value in enumerate(expected) }))
+        if pulses != expected:
+            failures.append(f'a binary frame decodes to {pulses}, it was encoded from {expected}')
+
+    phy.write_chain(start_bone)
+    if serial.writes != 1:
+        failures.append(f'write_chain took {serial.writes} binary writes, it should be one frame')
+
+    start_bone.reset_chain()
+    return failures[:10]
+
+
+def check_recorder(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # A recording replayed with the solver that made it must give the same angles.
+    targets: np.array = fk_batch(start_bone, random_thetas(start_bone, rng, samples))
+    with tempfile.TemporaryDirectory() as directory:
+        path: str = os.path.join(directory, 'checks.rec')
+        recorder: Recorder = Recorder(path, len(chain_list(start_bone)), capacity=samples)
+        start_bone.reset_chain()
+        for index, target in enumerate(targets):
+            result: IKResult = ik_analytic(start_bone, end_bone, target)
+            recorder.append(index * 0.01, target, [ bone.theta for bone in chain_list(start_bone) ], result.error, result.wall_time)
+        recorder.close()
+
+        start_bone.reset_chain()
+        summary: dict = Replayer(Recording(path), start_bone, end_bone, solver=ik_analytic).summary()
+        start_bone.reset_chain()
+
+    failures: list[str] = []
+    if summary['records'] != samples:
+        failures.append(f'replayed {summary["records"]} of {samples} records')
+    if summary['theta_difference_max'] > CHECKS_REPLAY_TOLERANCE:
+        failures.append(f'the replay deviates from the recording by {summary["theta_difference_max"]}')
+    return failures
+
+
+def check_retiming(start_bone: bone_vector, end_bone: bone_vector, rng: np.random.Generator, samples: int) -> list[str]:
+    # Streams poses like the control loop would, a new solution every tick, from the reset pose at rest, then lets it settle.
+    velocity, acceleration = joint_limits()
+    path: np.array = random_thetas(start_bone, rng, samples)
+    retimer: Retimer = Retimer()
+    setpoints: list[np.array] = [ np.zeros(path.shape[1]) ] * 2
+    for thetas in list(path) + [ path[-1] ] * int(RETIMING_DEFAULT_RATE * 60):
+        retimer.plan(thetas)
+        setpoint: np.array or None = retimer.next()
+        setpoints.append(setpoints[-1] if setpoint is None else setpoint.copy())
+
+    # Every setpoint stays within the limits, measured from the setpoints themselves.
+    velocities: np.array = np.diff(np.array(setpoints), axis=0) * RETIMING_DEFAULT_RATE
+    accelerations: np.array = np.diff(velocities, axis=0) * RETIMING_DEFAULT_RATE
+    velocity_ratio: float = float(np.max(np.abs(velocities) / velocity))
+    acceleration_ratio: float = float(np.max(np.abs(accelerations) / acceleration))
+
+    failures: list[str] = []
+    if max(velocity_ratio, acceleration_ratio) > 1.0 + CHECKS_RETIMING_TOLERANCE:
+        failures.append(f'the setpoints exceed the joint limits, velocity {velocity_ratio:.6f}, acceleration {acceleration_ratio:.6f}')
+    if not np.allclose(setpoints[-1], path[-1]):
+        failures.append(f'the setpoints settled at {setpoints[-1].tolist()}, not {path[-1].tolist()}')
+    return failures
+
+
+CHECKS: dict[str, callable] = {
+    'startup': check_startup,
+    'fk': check_fk,
+    'geometry': check_geometry,
+    'compiler': check_compiler,
+    'ik': check_ik,
+    'compact_chain': check_compact_chain,
+    'solution_cache': check_solution_cache,
+    'arc': check_arc,
+    'arms': check_arms,
+    'parallel': check_parallel,
+    'phy': check_phy,
+    'recorder': check_recorder,
+    'retiming': check_retiming
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Runs the headless correctness checks.')
+    parser.add_argument('--only', nargs='*', choices=CHECKS.keys(), help='only run these checks')
+    parser.add_argument('--samples', type=int, default=CHECKS_DEFAULT_SAMPLES, help='the number of random configurations per check')
+    parser.add_argument('--seed', type=int, default=CHECKS_DEFAULT_SEED, help='the random seed')
+    args = parser.parse_args()
+
+    bones: dict[str, bone_vector] = chain_init()
+    failed: int = 0
+    for name, check in CHECKS.items():
+        if args.only and name not in args.only:
+            continue
+
+        # Every check gets its own generator, so selecting checks does not change what the others sample.
+        failures: list[str] = check(bones['chain_bottom'], bones['chain_top'], np.random.default_rng(args.seed), args.samples)
+        print(f'{name}: {"ok" if len(failures) == 0 else "FAILED"}')
+        for failure in failures:
+            print(f'  {failure}')
+        failed += len(failures) > 0
+
+    return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
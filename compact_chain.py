@@ -0,0 +1,190 @@
+from __future__ import annotations
+import numpy as np
+
+from bone_vector import bone_vector
+
+
+class ChainBone:
+    """A lightweight view on a single bone of a Chain, behaves like a bone_vector, cached transforms included."""
+
+    __slots__ = ('chain', 'index', 'matrix_cache', 'frame_cache', 'tip_cache', 'fingerprint_cache')
+
+    def __init__(self, chain: Chain, index: int) -> None:
+        self.chain = chain
+        self.index = index
+
+        self.matrix_cache = None
+        self.frame_cache = None
+        self.tip_cache = None
+        self.fingerprint_cache = None
+
+    @property
+    def theta(self) -> float:
+        return float(self.chain.thetas[self.index])
+
+    @theta.setter
+    def theta(self, theta: float) -> None:
+        self.chain.thetas[self.index] = theta
+
+    @property
+    def theta_min(self) -> float or None:
+        return Chain.limit(self.chain.theta_mins[self.index])
+
+    @property
+    def theta_max(self) -> float or None:
+        return Chain.limit(self.chain.theta_maxs[self.index])
+
+    @property
+    def rotation_axis(self) -> tuple[float, float, float]:
+        return self.chain.axis_tuples[self.index]
+
+    @property
+    def vector_direction(self) -> tuple[float, float, float]:
+        return tuple(self.chain.directions[self.index].tolist())
+
+    @property
+    def vector_length(self) -> float:
+        return float(self.chain.lengths[self.index])
+
+    @property
+    def next(self) -> ChainBone or None:
+        return self.chain[self.index + 1] if self.index + 1 < len(self.chain) else None
+
+    @property
+    def prev(self) -> ChainBone or None:
+        return self.chain[self.index - 1] if self.index > 0 else None
+
+    # The caching is the same as for a bone_vector, only the storage differs.
+    def set_theta(self, theta: float) -> None:
+        bone_vector.set_theta(self, theta)
+
+    def invalidate_chain(self) -> None:
+        bone_vector.invalidate_chain(self)
+
+    def reset_chain(self) -> None:
+        bone_vector.reset_chain(self)
+
+    def fingerprint(self) -> str:
+        return bone_vector.fingerprint(self)
+
+    def frame(self) -> tuple[np.array, np.array]:
+        return bone_vector.frame(self)
+
+    def tip(self) -> np.array:
+        return bone_vector.tip(self)
+
+    def vector(self) -> np.array:
+        """Gets the untransformed vector of the bone.
+
+        Returns:
+            np.array: The untransformed vector of the bone.
+        """
+        return self.chain.vectors[self.index]
+
+    def matrix(self) -> np.array:
+        """Generates the rotation matrix of the bone.
+
+        Returns:
+            np.array: The rotation matrix.
+        """
+        return bone_vector.matrix(self)
+
+
+class Chain:
+    """A bone chain stored as contiguous arrays, one row per bone from the base to the end.
+
+    The views run through every solver like a bone_vector chain. Change the angles through them, writing
+    thetas directly skips clearing their cached transforms.
+    """
+
+    __slots__ = ('axes', 'axis_tuples', 'directions', 'lengths', 'vectors', 'thetas', 'theta_mins', 'theta_maxs', 'views')
+
+    def __init__(self, axes: np.array, directions: np.array, lengths: np.array, thetas: np.array or None = None, theta_mins: np.array or None = None, theta_maxs: np.array or None = None) -> None:
+        """Initializes a new chain from the per-bone arrays.
+
+        Args:
+            axes (np.array): The (J, 3) rotation axes.
+            directions (np.array): The (J, 3) vector directions.
+            lengths (np.array): The (J,) vector lengths.
+            thetas (np.array or None, optional): The (J,) angles. Defaults to zeros.
+            theta_mins (np.array or None, optional): The (J,) lower limits, -inf for none. Defaults to no limits.
+            theta_maxs (np.array or None, optional): The (J,) upper limits, inf for none. Defaults to no limits.
+        """
+        self.axes = np.ascontiguousarray(axes, dtype=float)
+
+        # The same axes as tuples, so rotation.along_axis takes its fast paths for the coordinate axes.
+        self.axis_tuples = tuple(tuple(axis) for axis in self.axes.tolist())
+        self.directions = np.ascontiguousarray(directions, dtype=float)
+        self.lengths = np.ascontiguousarray(lengths, dtype=float)
+        self.vectors = self.directions * self.lengths[:, np.newaxis]
+
+        count: int = self.lengths.shape[0]
+        self.thetas = np.zeros(count) if thetas is None else np.array(thetas, dtype=float)
+        self.theta_mins = np.full(count, -np.inf) if theta_mins is None else np.array(theta_mins, dtype=float)
+        self.theta_maxs = np.full(count, np.inf) if theta_maxs is None else np.array(theta_maxs, dtype=float)
+
+        self.views = tuple(ChainBone(self, index) for index in range(count))
+
+    def __len__(self) -> int:
+        return len(self.views)
+
+    def __getitem__(self, index: int) -> ChainBone:
+        return self.views[index]
+
+    @property
+    def start(self) -> ChainBone:
+        return self.views[0]
+
+    @property
+    def end(self) -> ChainBone:
+        return self.views[-1]
+
+    def limit(value: float) -> float or None:
+        """Converts an infinite limit back into the None used by bone_vector.
+
+        Args:
+            value (float): The stored limit.
+
+        Returns:
+            float or None: The limit, or None if there is none.
+        """
+        return None if np.isinf(value) else float(value)
+
+    def from_bones(start: bone_vector) -> Chain:
+        """Constructs a chain from a linked bone_vector chain.
+
+        Args:
+            start (bone_vector): The first bone.
+
+        Returns:
+            Chain: The resulting chain.
+        """
+
+        bones: list[bone_vector] = []
+        current: bone_vector or None = start
+        while current is not None:
+            bones.append(current)
+            current = current.next
+
+        return Chain(
+            axes=[bone.rotation_axis for bone in bones],
+            directions=[bone.vector_direction for bone in bones],
+            lengths=[bone.vector_length for bone in bones],
+            thetas=[bone.theta for bone in bones],
+            theta_mins=[-np.inf if bone.theta_min is None else bone.theta_min for bone in bones],
+            theta_maxs=[np.inf if bone.theta_max is None else bone.theta_max for bone in bones]
+        )
+
+    def write_bones(self, start: bone_vector) -> None:
+        """Copies our angles into a linked bone_vector chain with the same shape.
+
+        Args:
+            start (bone_vector): The first bone.
+        """
+        current: bone_vector or None = start
+        for theta in self.thetas:
+            current.set_theta(float(theta))
+            current = current.next
+
+    def reset_chain(self) -> None:
+        self.start.reset_chain()
@@ -0,0 +1,256 @@
+"""
+Luke's Inverse Kinematics - Compiles straight-line FK functions per chain geometry, run it to check them against fk.
+"""
+
+from __future__ import annotations
+import argparse
+import math
+import sys
+import numpy as np
+
+from bone_vector import bone_vector
+from helpers import ROTATION_X_AXIS, ROTATION_Y_AXIS, ROTATION_Z_AXIS
+
+COMPILER_FUNCTION_NAME: str = 'fk_compiled'
+COMPILER_VERIFY_TOLERANCE: float = 1e-9
+
+# The compiled FK functions, by chain fingerprint and number of bones.
+compiled_cache: dict[tuple[str, int], callable] = {}
+
+
+def term(coefficient: str, value: float or str) -> str or None:
+    """Multiplies a component by a coefficient, leaving out zero constants.
+
+    Args:
+        coefficient (str): The coefficient expression, may start with a minus.
+        value (float or str): The constant or the variable holding the component.
+
+    Returns:
+        str or None: The product, or None if it is always zero.
+    """
+    if isinstance(value, float):
+        if value == 0.0:
+            return None
+        return f'{coefficient} * {value!r}'
+    if not value.isidentifier():
+        return f'{coefficient} * ({value})'
+    return f'{coefficient} * {value}'
+
+
+def combine(terms: list[str or float or None]) -> float or str:
+    """Sums terms, folding the constant ones.
+
+    Args:
+        terms (list[str or float or None]): The expressions, constants and left-out terms.
+
+    Returns:
+        float or str: The constant sum, or the sum expression.
+    """
+    constant: float = sum(value for value in terms if isinstance(value, float))
+    expressions: list[str] = [ value for value in terms if isinstance(value, str) ]
+    if len(expressions) == 0:
+        return constant
+    if constant != 0.0:
+        expressions.append(repr(constant))
+    return ' + '.join(expressions).replace('+ -', '- ')
+
+
+def generate_fk_source(bones: list[bone_vector]) -> str:
+    """Generates the source of a straight-line FK function for the given bones.
+
+    The function takes the joint angles, from the first bone, and returns the FK Position.
+
+    Args:
+        bones (list[bone_vector]): The bones, from the root to the end effector.
+
+    Returns:
+        str: The Python source.
+    """
+    lines: list[str] = []
+
+    # The end effector position, relative to the bone being processed.
+    position: list[float or str] = [ 0.0, 0.0, 0.0 ]
+
+    # Same as fk, from the end effector back to the root, but with everything we know folded in.
+    for index in range(len(bones) - 1, -1, -1):
+        bone: bone_vector = bones[index]
+        c: str = f'c{index}'
+        s: str = f's{index}'
+
+        # Zero-length bones only rotate.
+        vector: list[float] = [ float(value) * float(bone.vector_length) for value in bone.vector_direction ]
+        position = [ combine([ component, offset ]) for component, offset in zip(position, vector) ]
+
+        axis: tuple[float, float, float] = tuple(float(value) for value in bone.rotation_axis)
+        entries: list[str] = []
+        x, y, z = position
+        if axis == ROTATION_X_AXIS:
+            moved: list[float or str] = [ y, z ]
+            rotated: list[float or str] = [ x, combine([ term(c, y), term(f'-{s}', z) ]), combine([ term(s, y), term(c, z) ]) ]
+        elif axis == ROTATION_Y_AXIS:
+            moved = [ x, z ]
+            rotated = [ combine([ term(c, x), term(s, z) ]), y, combine([ term(f'-{s}', x), term(c, z) ]) ]
+        elif axis == ROTATION_Z_AXIS:
+            moved = [ x, y ]
+            rotated = [ combine([ term(c, x), term(f'-{s}', y) ]), combine([ term(s, x), term(c, y) ]), z ]
+        else:
+            # Rodrigues, with the axis folded into the constant parts of every entry.
+            moved = position
+            rotated = []
+            for row in range(3):
+                terms: list[str or None] = []
+                for column in range(3):
+                    entry: str = f'm{index}_{row}{column}'
+                    identity: float = 1.0 if row == column else 0.0
+                    cross: float = [ [ 0.0, -axis[2], axis[1] ], [ axis[2], 0.0, -axis[0] ], [ -axis[1], axis[0], 0.0 ] ][row][column]
+                    value: float or str = combine([ axis[row] * axis[column], term(c, identity - axis[row] * axis[column]), term(s, cross) ])
+                    entries.append(f'    {entry} = {value!r}' if isinstance(value, float) else f'    {entry} = {value}')
+                    terms.append(term(entry, position[column]))
+                rotated.append(combine(terms))
+
+        # Rotating zeros is a no-op, then the angle is not even needed.
+        if all(isinstance(value, float) and value == 0.0 for value in moved):
+            continue
+
+        lines.append(f'    {c} = cos(thetas[{index}])')
+        lines.append(f'    {s} = sin(thetas[{index}])')
+        lines.extend(entries)
+
+        # Stores every component that is not a plain constant or variable, so the expressions stay small.
+        position = []
+        for name, value in zip('xyz', rotated):
+            if isinstance(value, str) and not value.isidentifier():
+                lines.append(f'    {name}{index} = {value}')
+                value = f'{name}{index}'
+            position.append(value)
+
+    values: str = ', '.join(repr(value) if isinstance(value, float) else value for value in position)
+    return '\n'.join([ f'def {COMPILER_FUNCTION_NAME}(thetas):' ] + lines + [ f'    return np.array([ {values} ])', '' ])
+
+
+def root(bone: bone_vector) -> bone_vector:
+    while bone.prev is not None:
+        bone = bone.prev
+    return bone
+
+
+def compile_fk(end_bone: bone_vector) -> callable:
+    """Compiles the FK of the chain from its root to the given bone.
+
+    Args:
+        end_bone (bone_vector): The last bone.
+
+    Returns:
+        callable: A function that takes the joint angles (from the root) and returns the FK Position, its source is in the source attribute.
+    """
+    bones: list[bone_vector] = [ end_bone ]
+    while bones[-1].prev is not None:
+        bones.append(bones[-1].prev)
+    bones.reverse()
+
+    source: str = generate_fk_source(bones)
+    namespace: dict = { 'cos': math.cos, 'sin': math.sin, 'np': np }
+    exec(compile(source, f'<compiled fk of {len(bones)} bones>', 'exec'), namespace)
+
+    function: callable = namespace[COMPILER_FUNCTION_NAME]
+    function.source = source
+    return function
+
+
+def compiled_fk(end_bone: bone_vector) -> callable:
+    """Gets the compiled FK of the chain up to the given bone, compiles it on the first use of its geometry.
+
+    Args:
+        end_bone (bone_vector): The last bone.
+
+    Returns:
+        callable: The compiled function, see compile_fk.
+    """
+    start: bone_vector = root(end_bone)
+    count: int = 1
+    current: bone_vector = end_bone
+    while current.prev is not None:
+        current = current.prev
+        count += 1
+
+    key: tuple[str, int] = (start.fingerprint(), count)
+    function: callable or None = compiled_cache.get(key)
+    if function is None:
+        function = compiled_cache[key] = compile_fk(end_bone)
+    return function
+
+
+def verify(end_bone: bone_vector, samples: int = 1000, seed: int = 0) -> float:
+    """Compares the compiled FK to fk on random joint angles within the limits, and on the limits themselves.
+
+    Args:
+        end_bone (bone_vector): The last bone.
+        samples (int, optional): The number of random configurations. Defaults to 1000.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        float: The largest difference in position.
+    """
+    # Only needed here, forward needs nothing from us.
+    from forward import fk
+
+    start: bone_vector = root(end_bone)
+    bones: list[bone_vector] = []
+    current: bone_vector or None = start
+    while current is not None:
+        bones.append(current)
+        if current is end_bone:
+            break
+        current = current.next
+
+    # Joints without limits get a full turn.
+    lower: np.array = np.array([ -math.pi if bone.theta_min is None else bone.theta_min for bone in bones ], dtype=float)
+    upper: np.array = np.array([ math.pi if bone.theta_max is None else bone.theta_max for bone in bones ], dtype=float)
+    rng: np.random.Generator = np.random.default_rng(seed)
+    thetas: np.array = rng.uniform(lower, upper, (samples, len(bones)))
+
+    # Every joint at either limit, with the others random, and all of them at the same limit.
+    at_lower: np.array = rng.uniform(lower, upper, (len(bones), len(bones)))
+    at_upper: np.array = rng.uniform(lower, upper, (len(bones), len(bones)))
+    np.fill_diagonal(at_lower, lower)
+    np.fill_diagonal(at_upper, upper)
+    thetas = np.concatenate([ thetas, at_lower, at_upper, [ lower, upper ] ])
+
+    # The generic path, on a copy of the chain that ends at the end bone.
+    copies: list[bone_vector] = [ bone_vector.from_spec(start.to_spec()[:len(bones)]) ]
+    while copies[-1].next is not None:
+        copies.append(copies[-1].next)
+
+    function: callable = compiled_fk(end_bone)
+    deviation: float = 0.0
+    for row in thetas:
+        for copy, theta in zip(copies, row):
+            copy.set_theta(float(theta))
+        deviation = max(deviation, float(np.max(np.abs(function(row.tolist()) - fk(copies[-1])))))
+    return deviation
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Checks the compiled FK of every part of the chain against fk.')
+    parser.add_argument('--samples', type=int, default=1000, help='the number of random configurations per part of the chain')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed')
+    args = parser.parse_args()
+
+    # Only loaded when run, the chain is built on first use.
+    from chain import chain_init
+    current: bone_vector or None = chain_init()['chain_bottom']
+
+    failed: int = 0
+    index: int = 0
+    while current is not None:
+        deviation: float = verify(current, args.samples, args.seed)
+        print(f'bone {index}: {"ok" if deviation <= COMPILER_VERIFY_TOLERANCE else "FAILED"}, deviates by {deviation:.3g}')
+        failed += deviation > COMPILER_VERIFY_TOLERANCE
+        current = current.next
+        index += 1
+
+    return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
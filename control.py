@@ -0,0 +1,234 @@
+from __future__ import annotations
+import threading
+import traceback
+from collections import deque
+from time import perf_counter, sleep
+import numpy as np
+
+from metrics import Histogram, registry
+
+CONTROL_DEFAULT_RATE: float = 100.0
+
+# The loop gives up after this many ticks in a row that raised.
+CONTROL_DEFAULT_MAX_ERRORS: int = 10
+
+
+class Snapshot:
+    """The joint state published by the control thread, for the renderer."""
+
+    __slots__ = ('sequence', 'timestamp', 'thetas', 'points', 'target', 'error', 'arc_visible', 'arc')
+
+    def __init__(self, joints: int) -> None:
+        self.sequence: int = 0
+        self.timestamp: float = 0.0
+        self.thetas: np.array = np.zeros(joints)
+        self.points: np.array = np.zeros((joints + 1, 3))
+        self.target: np.array = np.zeros(3)
+        self.error: float = 0.0
+
+        # The arc being played: position, orientation, radius, start and end angle.
+        self.arc_visible: bool = False
+        self.arc: np.array = np.zeros(9)
+
+    def copy(self) -> Snapshot:
+        result: Snapshot = Snapshot(self.thetas.shape[0])
+        result.sequence = self.sequence
+        result.timestamp = self.timestamp
+        result.thetas[:] = self.thetas
+        result.points[:] = self.points
+        result.target[:] = self.target
+        result.error = self.error
+        result.arc_visible = self.arc_visible
+        result.arc[:] = self.arc
+        return result
+
+
+class SnapshotBuffer:
+    """Two preallocated snapshots, one writer fills the back one while readers copy the front one, without locks.
+
+    The sequence number of a slot is odd while it is being written, a reader retries if the sequence
+    changed (or was odd) while it was copying.
+    """
+
+    def __init__(self, joints: int) -> None:
+        self.slots: tuple[Snapshot, Snapshot] = (Snapshot(joints), Snapshot(joints))
+        self.front: int = 0
+        self.published: int = 0
+
+    def write(self, thetas: np.array, points: np.array, target: np.array, error: float, arc: tuple[np.array, list[float], float, float, float] or None = None) -> None:
+        """Publishes a new state, only one thread may write.
+
+        Args:
+            thetas (np.array): The (J,) joint angles.
+            points (np.array): The (J + 1, 3) joint positions.
+            target (np.array): The IK target.
+            error (float): The remaining IK error.
+            arc (tuple[np.array, list[float], float, float, float] or None, optional): The position, orientation, radius, start and end angle of the arc being played, None if there is none. Defaults to None.
+        """
+        back: Snapshot = self.slots[1 - self.front]
+        back.sequence += 1
+        back.timestamp = perf_counter()
+        back.thetas[:] = thetas
+        back.points[:] = points
+        back.target[:] = target
+        back.error = error
+        back.arc_visible = arc is not None
+        if arc is not None:
+            position, orientation, radius, start, end = arc
+            back.arc[0:3] = position
+            back.arc[3:6] = orientation
+            back.arc[6:9] = (radius, start, end)
+        back.sequence += 1
+
+        # Swapping the index is a single assignment, readers see either the old or the new front.
+        self.front = 1 - self.front
+        self.published += 1
+
+    def read(self) -> Snapshot:
+        """Gets a consistent copy of the latest published state.
+
+        Returns:
+            Snapshot: The copy, owned by the caller.
+        """
+        while True:
+            slot: Snapshot = self.slots[self.front]
+            sequence: int = slot.sequence
+            if sequence % 2 == 0:
+                result: Snapshot = slot.copy()
+                if slot.sequence == sequence:
+                    return result
+
+            # Gives the writer the interpreter, instead of spinning against it.
+            sleep(0)
+
+
+class ControlLoop:
+    """Runs a fixed list of stages at a fixed rate on its own thread, and tracks every deadline."""
+
+    def __init__(self, stages: list[tuple[str, callable]], rate: float = CONTROL_DEFAULT_RATE, name: str = 'control', max_errors: int = CONTROL_DEFAULT_MAX_ERRORS) -> None:
+        """Initializes a new control loop, call start to run it.
+
+        Args:
+            stages (list[tuple[str, callable]]): The name and function of every stage, called in order each tick without arguments.
+            rate (float, optional): The number of ticks per second. Defaults to CONTROL_DEFAULT_RATE.
+            name (str, optional): The thread name and metric prefix. Defaults to 'control'.
+            max_errors (int, optional): The number of ticks in a row that may raise, before the loop stops. Defaults to CONTROL_DEFAULT_MAX_ERRORS.
+        """
+        self.stages = stages
+        self.period = 1.0 / rate
+        self.name = name
+        self.max_errors = max_errors
+
+        # Commands posted by other threads, run at the start of the next tick.
+        self.commands: deque = deque()
+
+        self.ticks: int = 0
+        self.overruns: int = 0
+        self.missed: int = 0
+
+        # The ticks that raised, the last exception, and if the loop stopped because of them.
+        self.errors: int = 0
+        self.error: Exception or None = None
+        self.failed = False
+
+        self.running = False
+        self.thread: threading.Thread or None = None
+
+    def post(self, command: callable) -> None:
+        """Queues a command to run on the control thread, at the start of the next tick.
+
+        Args:
+            command (callable): The function, called without arguments.
+        """
+        self.commands.append(command)
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.loop, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        self.running = False
+        self.thread.join()
+        self.thread = None
+
+    def tick(self) -> None:
+        """Runs the posted commands and all the stages once, timing each of them.
+        """
+        start_time: float = perf_counter()
+        while len(self.commands) > 0:
+            self.commands.popleft()()
+        registry.observe(f'{self.name}.stage.commands', perf_counter() - start_time)
+
+        for stage_name, stage in self.stages:
+            stage_start: float = perf_counter()
+            stage()
+            registry.observe(f'{self.name}.stage.{stage_name}', perf_counter() - stage_start)
+
+        registry.observe(f'{self.name}.tick', perf_counter() - start_time)
+
+    def loop(self) -> None:
+        """The control thread, ticks on a fixed schedule.
+        """
+        deadline: float = perf_counter()
+        consecutive: int = 0
+        while self.running:
+            # How late we woke up compared to the schedule.
+            registry.observe(f'{self.name}.jitter', perf_counter() - deadline)
+
+            # A stage that raises skips the rest of the tick, the loop stops if it keeps happening.
+            try:
+                self.tick()
+                consecutive = 0
+            except Exception as error:
+                consecutive += 1
+                self.errors += 1
+                self.error = error
+                registry.increment(f'{self.name}.errors')
+                print(f'Error in {self.name} tick {self.ticks}:')
+                traceback.print_exception(type(error), error, error.__traceback__)
+                if consecutive >= self.max_errors:
+                    print(f'Stopping {self.name}, {consecutive} ticks in a row failed')
+                    self.failed = True
+                    self.running = False
+                    return
+            self.ticks += 1
+            registry.increment(f'{self.name}.ticks')
+
+            # A tick that ran past the next deadline is an overrun, the ticks it covered are skipped
+            #  instead of being run back to back, so the schedule stays on the same grid.
+            deadline += self.period
+            now: float = perf_counter()
+            if now > deadline:
+                skipped: int = int((now - deadline) / self.period) + 1
+                deadline += skipped * self.period
+                self.overruns += 1
+                self.missed += skipped
+                registry.increment(f'{self.name}.overruns')
+                registry.increment(f'{self.name}.missed', skipped)
+
+            sleep(max(0.0, deadline - perf_counter()))
+
+    def stats(self) -> dict:
+        """Gets the schedule statistics.
+
+        Returns:
+            dict: The ticks, overruns, missed ticks, errors, and the jitter and tick duration statistics.
+        """
+        jitter: Histogram or None = registry.histograms.get(f'{self.name}.jitter')
+        tick: Histogram or None = registry.histograms.get(f'{self.name}.tick')
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'missed': self.missed,
+            'errors': self.errors,
+            'failed': self.failed,
+            'error': None if self.error is None else repr(self.error),
+            'period': self.period,
+            'jitter': {} if jitter is None else jitter.summary(),
+            'tick': {} if tick is None else tick.summary()
+        }
@@ -0,0 +1,230 @@
+"""
+Luke's Inverse Kinematics - Motor controller emulator on a pseudo-terminal, speaks the ASCII and binary PHY protocols.
+"""
+
+from __future__ import annotations
+import argparse
+import math
+import os
+import pty
+import select
+import sys
+import threading
+import tty
+from time import perf_counter, sleep
+
+from metrics import Histogram
+from phy import PHY_BINARY_HEADER, PHY_BINARY_MAGIC, PHY_PROTOCOL_ASCII, PHY_PROTOCOL_BINARY, STEPPER_CONVERSION_DICT, Phy, binary_frame_size, decode_binary
+
+# The fastest the output shafts turn, in revolutions per second.
+EMULATOR_DEFAULT_MAX_RPS: float = 0.5
+
+
+class Stepper:
+    """A stepper that moves towards its target at a fixed pulse rate."""
+
+    __slots__ = ('position', 'target', 'rate', 'updated')
+
+    def __init__(self, rate: float) -> None:
+        self.position: float = 0.0
+        self.target: int = 0
+        self.rate = rate
+        self.updated: float = perf_counter()
+
+    def advance(self, now: float) -> None:
+        step: float = self.rate * (now - self.updated)
+        self.position += max(-step, min(step, self.target - self.position))
+        self.updated = now
+
+    def set_target(self, target: int, now: float) -> None:
+        self.advance(now)
+        self.target = target
+
+
+class Emulator:
+    """Emulates the motor controller on the master side of a pseudo-terminal."""
+
+    def __init__(self, max_rps: float = EMULATOR_DEFAULT_MAX_RPS) -> None:
+        """Initializes a new emulator, and opens the pseudo-terminal.
+
+        Args:
+            max_rps (float, optional): The fastest the output shafts turn, in revolutions per second. Defaults to EMULATOR_DEFAULT_MAX_RPS.
+        """
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port: str = os.ttyname(self.slave)
+
+        self.steppers: list[Stepper] = [ Stepper(abs(conversion) * max_rps) for conversion in STEPPER_CONVERSION_DICT ]
+
+        # Statistics.
+        self.bytes_received: int = 0
+        self.frames: dict[str, int] = { PHY_PROTOCOL_ASCII: 0, PHY_PROTOCOL_BINARY: 0 }
+        self.errors: int = 0
+        self.receive_times: list[float] = []
+
+        self.buffer: bytearray = bytearray()
+        self.running = True
+        self.thread: threading.Thread = threading.Thread(target=self.reader, name='phy-emulator', daemon=True)
+        self.thread.start()
+
+    def reader(self) -> None:
+        while self.running:
+            readable, _, _ = select.select([ self.master ], [], [], 0.05)
+            if len(readable) == 0:
+                continue
+
+            data: bytes = os.read(self.master, 4096)
+            now: float = perf_counter()
+            self.bytes_received += len(data)
+            self.buffer.extend(data)
+            self.parse(now)
+
+    def parse(self, now: float) -> None:
+        """Handles all complete frames in the buffer.
+
+        Args:
+            now (float): The time the data was received.
+        """
+        while len(self.buffer) > 0:
+            # Binary frames start with the magic, text lines never do.
+            if self.buffer[0] == PHY_BINARY_MAGIC[0]:
+                if len(self.buffer) < PHY_BINARY_HEADER.size:
+                    return
+                magic, version, count = PHY_BINARY_HEADER.unpack_from(self.buffer)
+                if magic != PHY_BINARY_MAGIC:
+                    # Not a frame after all, resynchronizes on the next byte.
+                    self.errors += 1
+                    del self.buffer[0]
+                    continue
+
+                size: int = binary_frame_size(count)
+                if len(self.buffer) < size:
+                    return
+
+                frame: bytes = bytes(self.buffer[:size])
+                del self.buffer[:size]
+                try:
+                    pulses: list[int] = decode_binary(frame)
+                except ValueError:
+                    self.errors += 1
+                    continue
+
+                for motor, target in enumerate(pulses[:len(self.steppers)]):
+                    self.steppers[motor].set_target(target, now)
+                self.frames[PHY_PROTOCOL_BINARY] += 1
+                self.receive_times.append(now)
+                continue
+
+            end: int = self.buffer.find(b'\n')
+            if end < 0:
+                return
+
+            line: bytes = bytes(self.buffer[:end])
+            del self.buffer[:end + 1]
+            try:
+                motor, target = (int(value) for value in line.decode().split(','))
+                self.steppers[motor].set_target(target, now)
+            except (ValueError, IndexError, UnicodeDecodeError):
+                self.errors += 1
+                continue
+            self.frames[PHY_PROTOCOL_ASCII] += 1
+            self.receive_times.append(now)
+
+    def positions(self) -> list[float]:
+        """Gets the current position of every stepper.
+
+        Returns:
+            list[float]: The positions, in pulses.
+        """
+        now: float = perf_counter()
+        for stepper in self.steppers:
+            stepper.advance(now)
+        return [ stepper.position for stepper in self.steppers ]
+
+    def close(self) -> None:
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def measure(protocol: str, count: int) -> dict:
+    """Measures throughput and latency of writing chains of targets to the emulator.
+
+    Args:
+        protocol (str): The PHY protocol.
+        count (int): The number of chain writes.
+
+    Returns:
+        dict: The throughput and latency statistics.
+    """
+    emulator: Emulator = Emulator()
+    phy: Phy = Phy(emulator.port, protocol=protocol)
+
+    # Every write is one chain, the frames per chain depend on the protocol.
+    motors: int = len(STEPPER_CONVERSION_DICT)
+    frames_per_write: int = 1 if protocol == PHY_PROTOCOL_BINARY else motors
+    send_times: list[float] = []
+
+    start_time: float = perf_counter()
+    for index in range(count):
+        send_times.append(perf_counter())
+        phy.write({ motor: index * (motor + 1) for motor in range(motors) })
+    duration: float = perf_counter() - start_time
+
+    # Waits for the emulator to catch up.
+    deadline: float = perf_counter() + 5.0
+    while len(emulator.receive_times) < count * frames_per_write and perf_counter() < deadline:
+        sleep(0.01)
+
+    # The last frame of every write marks its arrival.
+    latency: Histogram = Histogram(count)
+    for index, send_time in enumerate(send_times):
+        frame: int = (index + 1) * frames_per_write - 1
+        if frame < len(emulator.receive_times):
+            latency.observe(emulator.receive_times[frame] - send_time)
+
+    result: dict = {
+        'protocol': protocol,
+        'writes': count,
+        'bytes': emulator.bytes_received,
+        'errors': emulator.errors,
+        'writes_per_second': count / duration,
+        'bytes_per_write': emulator.bytes_received / count,
+        'latency': latency.summary()
+    }
+
+    phy.close()
+    emulator.close()
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Emulates the motor controller on a pseudo-terminal.')
+    parser.add_argument('--measure', type=int, metavar='COUNT', help='measure throughput and latency of both protocols with COUNT chain writes, instead of serving')
+    parser.add_argument('--max-rps', type=float, default=EMULATOR_DEFAULT_MAX_RPS, help='the fastest the output shafts turn, in revolutions per second')
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        for protocol in (PHY_PROTOCOL_ASCII, PHY_PROTOCOL_BINARY):
+            result: dict = measure(protocol, args.measure)
+            latency: dict = result['latency']
+            print(f'{protocol}: {result["writes_per_second"]:.0f} writes/s, {result["bytes_per_write"]:.1f} bytes/write, {result["errors"]} errors, latency p50 {latency.get("p50", math.nan) * 1e6:.0f}us p99 {latency.get("p99", math.nan) * 1e6:.0f}us')
+        return 0
+
+    # Serves until interrupted, printing the stepper positions.
+    emulator: Emulator = Emulator(args.max_rps)
+    print(f'Emulating the motor controller on {emulator.port}')
+    try:
+        while True:
+            sleep(1.0)
+            positions: str = ', '.join(f'{position:.0f}' for position in emulator.positions())
+            print(f'frames: {emulator.frames}, errors: {emulator.errors}, positions: {positions}')
+    except KeyboardInterrupt:
+        pass
+    emulator.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 import numpy as np
 
 from bone_vector import bone_vector
+from compact_chain import Chain
+from helpers import rotation
 
 def fk(end: bone_vector) -> np.array:
     """Performs forward kinematics on the given chain.
@@ -12,6 +14,18 @@ def fk(end: bone_vector) -> np.array:
         np.array: The FK Position.
     """
 
+    # If the end is the tip of the chain, combine the cached transforms at the
+    #  last bone whose base-to-bone transform is still valid, after changing a
+    #  single angle this only recomputes the transforms of that bone. Bone-like
+    #  objects without the caches take the walk below.
+    if end.next is None and hasattr(end, 'frame_cache'):
+        current: bone_vector = end
+        while current.frame_cache is None and current.prev is not None:
+            current = current.prev
+
+        frame_rotation, frame_position = current.frame()
+        return np.add(frame_position, np.matmul(frame_rotation, current.tip()))
+
     # Initialize stuff.
     end_effector: np.array = np.array([ 0.0, 0.0, 0.0 ])
 
@@ -32,3 +46,73 @@ def fk(end: bone_vector) -> np.array:
 
     # Returns the result.
     return end_effector
+
+
+def fk_points(end: bone_vector) -> np.array:
+    """Computes the world position of every joint in the chain.
+
+    Args:
+        end (bone_vector): The last bone of the chain.
+
+    Returns:
+        np.array: The (J + 1, 3) joint positions, from the origin to the end effector.
+    """
+
+    # Finds the first bone of the chain.
+    start: bone_vector = end
+    while start.prev is not None:
+        start = start.prev
+
+    # Walks from the base to the end, moving along each bone in its world frame.
+    frame: np.array = np.identity(3)
+    points: list[np.array] = [ np.array([ 0.0, 0.0, 0.0 ]) ]
+    current: bone_vector or None = start
+    while current is not None:
+        frame = np.matmul(frame, current.matrix())
+        points.append(np.add(points[-1], np.matmul(frame, current.vector())))
+
+        if current is end:
+            break
+        current = current.next
+
+    return np.array(points)
+
+
+def fk_batch(chain: bone_vector or Chain, thetas: np.array) -> np.array:
+    """Performs forward kinematics for many joint configurations at once.
+
+    Args:
+        chain (bone_vector or Chain): The first bone of the chain, or a compact chain (its own angles are ignored).
+        thetas (np.array): The (N, J) array of joint angles, one column per bone.
+
+    Returns:
+        np.array: The (N, 3) array of FK Positions.
+    """
+
+    # Collects the bones, so we can index them by column.
+    bones: list[bone_vector] = []
+    current: bone_vector or None = chain.start if isinstance(chain, Chain) else chain
+    while current is not None:
+        bones.append(current)
+        current = current.next
+
+    thetas = np.atleast_2d(np.asarray(thetas, dtype=float))
+    if thetas.shape[1] != len(bones):
+        raise ValueError(f'Expected {len(bones)} joint angles per configuration, got {thetas.shape[1]}')
+
+    # Initialize stuff.
+    end_effectors: np.array = np.zeros((thetas.shape[0], 3))
+
+    # Same as fk, but every step transforms all configurations at once.
+    for index in range(len(bones) - 1, -1, -1):
+        current = bones[index]
+
+        # Gets the current (not-rotated) end effector positions.
+        end_effectors = end_effectors + current.vector()
+
+        # Performs the rotation of every configuration.
+        matrices: np.array = rotation.along_axis(current.rotation_axis, thetas[:, index])
+        end_effectors = np.einsum('nij,nj->ni', matrices, end_effectors)
+
+    # Returns the result.
+    return end_effectors
@@ -0,0 +1,174 @@
+"""
+Luke's Inverse Kinematics - Headless batch solver, never touches pygame or OpenGL.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import numpy as np
+
+from analytic import ik_analytic
+from bone_vector import bone_vector
+from chain import chain_init
+from inverse import IKResult, ik, ik_dls, ik_multistart
+from parallel import PARALLEL_DEFAULT_CHUNK_SIZE, solve_parallel
+
+HEADLESS_FORMATS: tuple[str, ...] = ('csv', 'npy', 'jsonl')
+HEADLESS_SOLVERS: dict[str, callable] = {
+    'ik': ik,
+    'dls': ik_dls,
+    'multistart': ik_multistart,
+    'analytic': ik_analytic
+}
+
+
+def detect_format(path: str, fallback: str or None) -> str:
+    """Determines the file format from the explicit choice or the extension.
+
+    Args:
+        path (str): The file path, '-' for stdin/stdout.
+        fallback (str or None): The explicitly chosen format.
+
+    Returns:
+        str: The format.
+    """
+    if fallback is not None:
+        return fallback
+
+    extension: str = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension == 'json':
+        extension = 'jsonl'
+    if extension not in HEADLESS_FORMATS:
+        raise ValueError(f'Cannot determine the format of \'{path}\', use --input-format/--output-format')
+    return extension
+
+
+def read_targets(path: str, file_format: str) -> iter:
+    """Reads the targets lazily.
+
+    Args:
+        path (str): The file path, '-' for stdin.
+        file_format (str): The file format.
+
+    Yields:
+        np.array: Each target position.
+    """
+    if file_format == 'npy':
+        if path == '-':
+            raise ValueError('NPY input cannot be read from stdin')
+        yield from np.load(path, mmap_mode='r')[:, :3]
+        return
+
+    file = sys.stdin if path == '-' else open(path, newline='')
+    try:
+        if file_format == 'csv':
+            for row in csv.reader(file):
+                # Skips empty lines and a header.
+                if len(row) == 0:
+                    continue
+                try:
+                    yield np.array([ float(value) for value in row[:3] ])
+                except ValueError:
+                    continue
+        elif file_format == 'jsonl':
+            for line in file:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                data = json.loads(line)
+                yield np.array(data['target'] if isinstance(data, dict) else data, dtype=float)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+class ResultWriter:
+    """Writes the solutions in one of the supported formats, streaming where the format allows it."""
+
+    def __init__(self, path: str, file_format: str, joints: int) -> None:
+        self.path = path
+        self.file_format = file_format
+        self.joints = joints
+        self.rows: list[np.array] = []
+
+        if file_format == 'npy':
+            if path == '-':
+                raise ValueError('NPY output cannot be written to stdout')
+            self.file = None
+            return
+
+        self.file = sys.stdout if path == '-' else open(path, 'w', newline='')
+        if file_format == 'csv':
+            self.csv = csv.writer(self.file)
+            self.csv.writerow([ 'x', 'y', 'z' ] + [ f'theta{index}' for index in range(joints) ] + [ 'error' ])
+
+    def write(self, target: np.array, thetas: list[float], result: IKResult) -> None:
+        if self.file_format == 'npy':
+            self.rows.append(np.concatenate([ target, thetas, [ result.error ] ]))
+        elif self.file_format == 'csv':
+            self.csv.writerow([ *target.tolist(), *thetas, result.error ])
+        elif self.file_format == 'jsonl':
+            self.file.write(json.dumps({ 'target': target.tolist(), 'thetas': thetas, 'error': result.error, 'reason': result.reason.name }) + '\n')
+
+    def close(self) -> None:
+        if self.file_format == 'npy':
+            np.save(self.path, np.array(self.rows).reshape(-1, 3 + self.joints + 1))
+        elif self.file is not sys.stdout:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Solves IK targets without a display.')
+    parser.add_argument('input', nargs='?', default='-', help='the targets (CSV, NPY or JSON-lines), - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='where to write the solutions, - for stdout')
+    parser.add_argument('--input-format', choices=HEADLESS_FORMATS, help='the input format, defaults to the extension (jsonl for stdin)')
+    parser.add_argument('--output-format', choices=HEADLESS_FORMATS, help='the output format, defaults to the extension (the input format for stdout)')
+    parser.add_argument('--solver', choices=HEADLESS_SOLVERS.keys(), default='analytic', help='the solver, analytic falls back to ik for other chains')
+    parser.add_argument('--cold', action='store_true', help='reset the chain before every target instead of starting from the previous solution')
+    parser.add_argument('--workers', type=int, help='solve on this many processes, every target then starts from the initial pose (implies --cold)')
+    parser.add_argument('--chunk-size', type=int, default=PARALLEL_DEFAULT_CHUNK_SIZE, help='the number of targets sent to a worker process at once')
+    args = parser.parse_args()
+
+    input_format: str = detect_format(args.input, args.input_format or ('jsonl' if args.input == '-' else None))
+    output_format: str = detect_format(args.output, args.output_format or (input_format if args.output == '-' else None))
+    solver: callable = HEADLESS_SOLVERS[args.solver]
+
+    # Initializes the IK Chain.
+    bones: dict[str, bone_vector] = chain_init()
+    chain_bottom: bone_vector = bones['chain_bottom']
+    chain_top: bone_vector = bones['chain_top']
+    bones: list[bone_vector] = []
+    current: bone_vector or None = chain_bottom
+    while current is not None:
+        bones.append(current)
+        current = current.next
+
+    writer: ResultWriter = ResultWriter(args.output, output_format, len(bones))
+    try:
+        # The process pool needs all the targets up front.
+        if args.workers is not None:
+            targets: np.array = np.array(list(read_targets(args.input, input_format)), dtype=float).reshape(-1, 3)
+            thetas, results = solve_parallel(chain_bottom, targets, solver=solver, workers=args.workers, chunk_size=args.chunk_size)
+            for target, target_thetas, result in zip(targets, thetas, results):
+                writer.write(target, target_thetas.tolist(), result)
+            return 0
+
+        for target in read_targets(args.input, input_format):
+            target = np.array(target, dtype=float)
+            if args.cold:
+                chain_bottom.reset_chain()
+
+            result: IKResult = solver(chain_bottom, chain_top, target)
+            writer.write(target, [ bone.theta for bone in bones ], result)
+    finally:
+        writer.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
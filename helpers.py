@@ -8,6 +8,10 @@ GENERALIZE_UNIT_MULTIPLIERS = {
     'm': 1000.0
 }
 
+ROTATION_X_AXIS: tuple[float, float, float] = (1.0, 0.0, 0.0)
+ROTATION_Y_AXIS: tuple[float, float, float] = (0.0, 1.0, 0.0)
+ROTATION_Z_AXIS: tuple[float, float, float] = (0.0, 0.0, 1.0)
+
 def bounded_theta(theta: float, theta_min: float or None, theta_max: float or None) -> float:
     if theta_min is None or theta_max is None:
         return theta
@@ -23,39 +27,186 @@ def generalize_unit(value: float, unit: str):
     return value * multiplier
 
 class rotation:
-    def x(theta: float) -> np.array:
-        return np.array([
-            [1.0, 0.0, 0.0],
-            [0.0, math.cos(theta), -math.sin(theta)],
-            [0.0, math.sin(theta), math.cos(theta)]
-        ])
-    
-    def y(theta: float) -> np.array:
-        return np.array([
-            [math.cos(theta), 0.0, math.sin(theta)],
-            [0.0, 1.0, 0.0],
-            [-math.sin(theta), 0.0, math.cos(theta)]
-        ])
-    
-    def z(theta: float) -> np.array:
-        return np.array([
-            [math.cos(theta), -math.sin(theta), 0.0],
-            [math.sin(theta), math.cos(theta), 0.0],
-            [0.0, 0.0, 10]
-        ])
-
-    def xyz(x_theta: float, y_theta: float, z_theta: float) -> np.array:
-        x_val: np.array = rotation.x(x_theta)
-        y_val: np.array = rotation.y(y_theta)
-        z_val: np.array = rotation.z(z_theta)
-        return np.matmul(np.matmul(x_val, y_val), z_val)
-
-    def along_axis(u: tuple[float, float, float], theta: float) -> np.array:
-        return np.array([
-            [math.cos(theta) + math.pow(u[0], 2) * (1 - math.cos(theta)), u[0] * u[1] * (1 - math.cos(theta)) - u[2] * math.sin(theta), u[0] * u[2] * (1 - math.cos(theta)) + u[1] * math.sin(theta)],
-            [u[1] * u[0] * (1 - math.cos(theta)) + u[2] * math.sin(theta), math.cos(theta) + math.pow(u[1], 2) * (1 - math.cos(theta)), u[1] * u[2] * (1 - math.cos(theta)) - u[0] * math.sin(theta)],
-            [u[2] * u[0] * (1 - math.cos(theta)) - u[1] * math.sin(theta), u[2] * u[1] * (1 - math.cos(theta)) + u[0] * math.sin(theta), math.cos(theta) + math.pow(u[2], 2) * (1 - math.cos(theta))]
-        ])
+    """Rotation matrices, every function takes either a single angle or an array of angles.
+
+    A single angle gives a (3, 3) matrix, an array of shape S gives an (*S, 3, 3) stack. Passing
+    out writes the result into an existing array of that shape instead of allocating one.
+    """
+
+    def buffer(shape: tuple, out: np.array or None) -> np.array:
+        """Gets the array to write a stack of matrices into.
+
+        Args:
+            shape (tuple): The shape of the angles.
+            out (np.array or None): The caller's buffer, if any.
+
+        Returns:
+            np.array: The (*shape, 3, 3) array.
+        """
+        if out is None:
+            return np.empty(shape + (3, 3))
+        if out.shape != shape + (3, 3):
+            raise ValueError(f'Expected an output buffer of shape {shape + (3, 3)}, got {out.shape}')
+        return out
+
+    def x(theta: float or np.array, out: np.array or None = None) -> np.array:
+        # Single angles are cheapest as a nested list.
+        if out is None and isinstance(theta, (int, float)):
+            c: float = math.cos(theta)
+            s: float = math.sin(theta)
+            return np.array([
+                [1.0, 0.0, 0.0],
+                [0.0, c, -s],
+                [0.0, s, c]
+            ])
+
+        thetas: np.array = np.asarray(theta, dtype=float)
+        c: np.array = np.cos(thetas)
+        s: np.array = np.sin(thetas)
+        result: np.array = rotation.buffer(thetas.shape, out)
+        result[..., 0, :] = (1.0, 0.0, 0.0)
+        result[..., 1, 0] = 0.0
+        result[..., 2, 0] = 0.0
+        result[..., 1, 1] = c
+        result[..., 1, 2] = -s
+        result[..., 2, 1] = s
+        result[..., 2, 2] = c
+        return result
+
+    def y(theta: float or np.array, out: np.array or None = None) -> np.array:
+        # Single angles are cheapest as a nested list.
+        if out is None and isinstance(theta, (int, float)):
+            c: float = math.cos(theta)
+            s: float = math.sin(theta)
+            return np.array([
+                [c, 0.0, s],
+                [0.0, 1.0, 0.0],
+                [-s, 0.0, c]
+            ])
+
+        thetas: np.array = np.asarray(theta, dtype=float)
+        c: np.array = np.cos(thetas)
+        s: np.array = np.sin(thetas)
+        result: np.array = rotation.buffer(thetas.shape, out)
+        result[..., 1, :] = (0.0, 1.0, 0.0)
+        result[..., 0, 1] = 0.0
+        result[..., 2, 1] = 0.0
+        result[..., 0, 0] = c
+        result[..., 0, 2] = s
+        result[..., 2, 0] = -s
+        result[..., 2, 2] = c
+        return result
+
+    def z(theta: float or np.array, out: np.array or None = None) -> np.array:
+        # Single angles are cheapest as a nested list.
+        if out is None and isinstance(theta, (int, float)):
+            c: float = math.cos(theta)
+            s: float = math.sin(theta)
+            return np.array([
+                [c, -s, 0.0],
+                [s, c, 0.0],
+                [0.0, 0.0, 1.0]
+            ])
+
+        thetas: np.array = np.asarray(theta, dtype=float)
+        c: np.array = np.cos(thetas)
+        s: np.array = np.sin(thetas)
+        result: np.array = rotation.buffer(thetas.shape, out)
+        result[..., 2, :] = (0.0, 0.0, 1.0)
+        result[..., 0, 2] = 0.0
+        result[..., 1, 2] = 0.0
+        result[..., 0, 0] = c
+        result[..., 0, 1] = -s
+        result[..., 1, 0] = s
+        result[..., 1, 1] = c
+        return result
+
+    def xyz(x_theta: float or np.array, y_theta: float or np.array, z_theta: float or np.array, out: np.array or None = None) -> np.array:
+        """Generates the rotation x(x_theta) @ y(y_theta) @ z(z_theta), written out instead of multiplied.
+
+        Args:
+            x_theta (float or np.array): The rotation around x.
+            y_theta (float or np.array): The rotation around y.
+            z_theta (float or np.array): The rotation around z.
+            out (np.array or None, optional): The buffer to write into. Defaults to None.
+
+        Returns:
+            np.array: The rotation matrix, or the stack of them for the broadcast shape of the angles.
+        """
+        if out is None and isinstance(x_theta, (int, float)) and isinstance(y_theta, (int, float)) and isinstance(z_theta, (int, float)):
+            ca, sa = math.cos(x_theta), math.sin(x_theta)
+            cb, sb = math.cos(y_theta), math.sin(y_theta)
+            cc, sc = math.cos(z_theta), math.sin(z_theta)
+            return np.array([
+                [cb * cc, -cb * sc, sb],
+                [ca * sc + sa * sb * cc, ca * cc - sa * sb * sc, -sa * cb],
+                [sa * sc - ca * sb * cc, sa * cc + ca * sb * sc, ca * cb]
+            ])
+
+        x_thetas, y_thetas, z_thetas = np.broadcast_arrays(np.asarray(x_theta, dtype=float), np.asarray(y_theta, dtype=float), np.asarray(z_theta, dtype=float))
+        ca, sa = np.cos(x_thetas), np.sin(x_thetas)
+        cb, sb = np.cos(y_thetas), np.sin(y_thetas)
+        cc, sc = np.cos(z_thetas), np.sin(z_thetas)
+        result: np.array = rotation.buffer(x_thetas.shape, out)
+        result[..., 0, 0] = cb * cc
+        result[..., 0, 1] = -cb * sc
+        result[..., 0, 2] = sb
+        result[..., 1, 0] = ca * sc + sa * sb * cc
+        result[..., 1, 1] = ca * cc - sa * sb * sc
+        result[..., 1, 2] = -sa * cb
+        result[..., 2, 0] = sa * sc - ca * sb * cc
+        result[..., 2, 1] = sa * cc + ca * sb * sc
+        result[..., 2, 2] = ca * cb
+        return result
+
+    def along_axis(u: tuple[float, float, float], theta: float or np.array, out: np.array or None = None) -> np.array:
+        """Generates the rotation around an arbitrary unit axis (Rodrigues).
+
+        Args:
+            u (tuple[float, float, float] or np.array): The rotation axis.
+            theta (float or np.array): The angle, or an array of angles.
+            out (np.array or None, optional): The buffer to write into. Defaults to None.
+
+        Returns:
+            np.array: The rotation matrix, or the stack of them.
+        """
+
+        # The bones rotate around the coordinate axes, those have cheaper matrices.
+        if isinstance(u, np.ndarray) and u.shape == (3,):
+            u = tuple(u.tolist())
+        if isinstance(u, tuple):
+            if u == ROTATION_X_AXIS:
+                return rotation.x(theta, out)
+            if u == ROTATION_Y_AXIS:
+                return rotation.y(theta, out)
+            if u == ROTATION_Z_AXIS:
+                return rotation.z(theta, out)
+
+        if out is None and isinstance(theta, (int, float)):
+            c: float = math.cos(theta)
+            s: float = math.sin(theta)
+            t: float = 1.0 - c
+            return np.array([
+                [c + u[0] * u[0] * t, u[0] * u[1] * t - u[2] * s, u[0] * u[2] * t + u[1] * s],
+                [u[1] * u[0] * t + u[2] * s, c + u[1] * u[1] * t, u[1] * u[2] * t - u[0] * s],
+                [u[2] * u[0] * t - u[1] * s, u[2] * u[1] * t + u[0] * s, c + u[2] * u[2] * t]
+            ])
+
+        thetas: np.array = np.asarray(theta, dtype=float)
+        c: np.array = np.cos(thetas)
+        s: np.array = np.sin(thetas)
+        t: np.array = 1.0 - c
+        result: np.array = rotation.buffer(thetas.shape, out)
+        result[..., 0, 0] = c + u[0] * u[0] * t
+        result[..., 0, 1] = u[0] * u[1] * t - u[2] * s
+        result[..., 0, 2] = u[0] * u[2] * t + u[1] * s
+        result[..., 1, 0] = u[1] * u[0] * t + u[2] * s
+        result[..., 1, 1] = c + u[1] * u[1] * t
+        result[..., 1, 2] = u[1] * u[2] * t - u[0] * s
+        result[..., 2, 0] = u[2] * u[0] * t - u[1] * s
+        result[..., 2, 1] = u[2] * u[1] * t + u[0] * s
+        result[..., 2, 2] = c + u[2] * u[2] * t
+        return result
 
 def rad(rad: float) -> float:
     return (rad / 180.0) * math.pi
@@ -1,53 +1,492 @@
 import math
+from enum import Enum
+from time import perf_counter
 import numpy as np
 from bone_vector import bone_vector
+from compact_chain import Chain
+from compiler import compiled_fk
 from forward import fk
-from helpers import bounded_theta
+from helpers import bounded_theta, rotation
+from defs import FLOAT_EPSILON
+from workspace import WorkspaceIndex
 
 
-def ik(start_bone: bone_vector, end_bone: bone_vector, target: np.array, max_it: int = 100, epsilon: float = 0.1, eta: float = 0.1) -> float:
-    error: float = np.linalg.norm(target - fk(end_bone))
+class TerminationReason(Enum):
+    Converged = 0
+    Stalled = 1
+    MaxIterations = 2
+    Analytic = 3
+    Cached = 4
+
+
+class IKResult:
+    """The outcome of a single IK solve."""
+
+    __slots__ = ('error', 'iterations', 'fk_evaluations', 'wall_time', 'reason')
+
+    def __init__(self, error: float, iterations: int = 0, fk_evaluations: int = 0, wall_time: float = 0.0, reason: TerminationReason = TerminationReason.Converged) -> None:
+        """Initializes a new IK result.
+
+        Args:
+            error (float): The remaining error.
+            iterations (int, optional): The number of iterations used. Defaults to 0.
+            fk_evaluations (int, optional): The number of FK evaluations used. Defaults to 0.
+            wall_time (float, optional): The time the solve took, in seconds. Defaults to 0.0.
+            reason (TerminationReason, optional): Why the solver stopped. Defaults to TerminationReason.Converged.
+        """
+        self.error = float(error)
+        self.iterations = iterations
+        self.fk_evaluations = fk_evaluations
+        self.wall_time = wall_time
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f'IKResult(error={self.error}, iterations={self.iterations}, fk_evaluations={self.fk_evaluations}, wall_time={self.wall_time}, reason={self.reason.name})'
+
+
+def ik(start_bone: bone_vector, end_bone: bone_vector, target: np.array, max_it: int = 100, epsilon: float = 0.1, eta: float = 0.1, workspace: WorkspaceIndex or None = None, max_step: float or None = None) -> IKResult:
+    start_time: float = perf_counter()
+
+    # Starts from the closest known configuration, if we have a workspace index.
+    if workspace is not None:
+        workspace.seed(start_bone, end_bone, target)
+
+    # Evaluates FK with the code compiled for this chain, the angles we try only live in a list.
+    function: callable = compiled_fk(end_bone)
+    bones: list[bone_vector] = [ start_bone ]
+    while bones[0].prev is not None:
+        bones.insert(0, bones[0].prev)
+    offset: int = len(bones) - 1
+    while bones[-1].next is not None:
+        bones.append(bones[-1].next)
+    thetas: list[float] = [ bone.theta for bone in bones ]
+
+    error: float = np.linalg.norm(target - function(thetas))
+    fk_evaluations: int = 1
+
+    # The error the chain is actually at, the one above is averaged when neither direction helps and drives the step.
+    remaining: float = error
 
     for i in range(0, max_it):
         moved: bool = False
 
+        # With a ceiling (from ik_trajectory), the step follows the remaining error once per iteration,
+        #  the same for every joint.
+        if max_step is not None:
+            eta = min(max_step, (error / 200) * math.pi)
+
         # Loops over the bones and tweaks the parameters.
-        current: bone_vector = start_bone
-        while current is not None:
+        for index in range(offset, len(bones)):
+            current: bone_vector = bones[index]
+
             # Stores the original theta for possible restoration.
-            original_theta = current.theta
+            original_theta = thetas[index]
 
             # Tries if incrementing or decrementing reduces the error
             #  if both reduce pick the largest reduction, if both increase
             #  just keep the original value.
             error_original = error
-            current.set_theta(bounded_theta(original_theta + eta, current.theta_min, current.theta_max))
-            error_incrementation = np.linalg.norm(target - fk(end_bone))
-            current.set_theta(bounded_theta(original_theta - eta, current.theta_min, current.theta_max))
-            error_decrementation = np.linalg.norm(target - fk(end_bone))
+            thetas[index] = bounded_theta(original_theta + eta, current.theta_min, current.theta_max)
+            error_incrementation = np.linalg.norm(target - function(thetas))
+            thetas[index] = bounded_theta(original_theta - eta, current.theta_min, current.theta_max)
+            error_decrementation = np.linalg.norm(target - function(thetas))
+            fk_evaluations += 2
 
             # Checks which error is the best and what change to keep.
             if error_incrementation > error_original and error_decrementation > error_original:
-                current.set_theta(original_theta)
+                thetas[index] = original_theta
                 error = (error_incrementation + error_decrementation) / 2
                 moved = True
             elif error_incrementation < error_decrementation:
-                current.set_theta(original_theta + eta)
-                error = error_incrementation
+                thetas[index] = bounded_theta(original_theta + eta, current.theta_min, current.theta_max)
+                error = remaining = error_incrementation
                 moved = True
             elif error_decrementation < error_incrementation:
-                current.set_theta(original_theta - eta)
-                error = error_decrementation
+                thetas[index] = bounded_theta(original_theta - eta, current.theta_min, current.theta_max)
+                error = remaining = error_decrementation
                 moved = True
+            else:
+                thetas[index] = original_theta
+
+            # Only the kept angle goes into the bone.
+            if current.theta != thetas[index]:
+                current.set_theta(thetas[index])
 
             # Checks if we should break.
             if error < epsilon:
-                return error
+                return IKResult(remaining, i + 1, fk_evaluations, perf_counter() - start_time, TerminationReason.Converged)
 
-            eta = (error / 200) * math.pi
+            # Without one, every joint adapts the step to the error the previous one left.
+            if max_step is None:
+                eta = (error / 200) * math.pi
 
-            # Goes to the next joint.
-            current = current.next
-        
         if not moved:
-            return error
+            return IKResult(remaining, i + 1, fk_evaluations, perf_counter() - start_time, TerminationReason.Stalled)
+
+    return IKResult(remaining, max_it, fk_evaluations, perf_counter() - start_time, TerminationReason.MaxIterations)
+
+
+def jacobian(start_bone: bone_vector) -> tuple[np.array, np.array]:
+    """Computes the positional jacobian of the chain from its joint axes and frames.
+
+    Args:
+        start_bone (bone_vector): The first bone of the chain.
+
+    Returns:
+        tuple[np.array, np.array]: The (3, J) jacobian and the FK Position.
+    """
+
+    # Initialize stuff.
+    frame: np.array = np.identity(3)
+    position: np.array = np.array([ 0.0, 0.0, 0.0 ])
+    axes: list[np.array] = []
+    origins: list[np.array] = []
+
+    # Walks from the base to the end, keeping track of the world frame of every joint.
+    current: bone_vector or None = start_bone
+    while current is not None:
+        # Stores the world rotation axis and the origin of the joint.
+        axes.append(np.matmul(frame, current.rotation_axis))
+        origins.append(position)
+
+        # Applies the joint rotation and moves to the end of the bone.
+        frame = np.matmul(frame, current.matrix())
+        position = np.add(position, np.matmul(frame, current.vector()))
+
+        current = current.next
+
+    # Each column is the velocity of the end effector caused by rotating one joint.
+    columns: np.array = np.cross(np.array(axes), position - np.array(origins))
+    return columns.T, position
+
+
+def ik_dls(start_bone: bone_vector, end_bone: bone_vector, target: np.array, max_it: int = 20, epsilon: float = 0.1, damping: float = 1.0, max_step: float = 0.5, workspace: WorkspaceIndex or None = None) -> IKResult:
+    """Performs damped-least-squares inverse kinematics on the given chain.
+
+    Args:
+        start_bone (bone_vector): The first bone of the chain.
+        end_bone (bone_vector): The last bone of the chain.
+        target (np.array): The target position.
+        max_it (int, optional): The maximum number of iterations. Defaults to 20.
+        epsilon (float, optional): The error at which we stop. Defaults to 0.1.
+        damping (float, optional): The damping factor, keeps steps sane near singularities. Defaults to 1.0.
+        max_step (float, optional): The maximum change of a single joint per iteration. Defaults to 0.5.
+        workspace (WorkspaceIndex or None, optional): If given, seeds the chain with the closest known configuration. Defaults to None.
+
+    Returns:
+        IKResult: The remaining error and solver statistics.
+    """
+    start_time: float = perf_counter()
+
+    # Starts from the closest known configuration, if we have a workspace index.
+    if workspace is not None:
+        workspace.seed(start_bone, end_bone, target)
+
+    # Collects the bones, so we can apply the step to each of them.
+    bones: list[bone_vector] = []
+    current: bone_vector or None = start_bone
+    while current is not None:
+        bones.append(current)
+        current = current.next
+
+    error: float = np.linalg.norm(target - fk(end_bone))
+    fk_evaluations: int = 1
+
+    for i in range(0, max_it):
+        # Checks if we should break.
+        if error < epsilon:
+            return IKResult(error, i, fk_evaluations, perf_counter() - start_time, TerminationReason.Converged)
+
+        # Computes the damped-least-squares step: J^T (J J^T + lambda^2 I)^-1 e.
+        matrix, position = jacobian(start_bone)
+        fk_evaluations += 1
+        delta: np.array = target - position
+        step: np.array = np.matmul(matrix.T, np.linalg.solve(np.matmul(matrix, matrix.T) + (damping ** 2) * np.identity(3), delta))
+
+        # Scales the step down if a single joint would move too far.
+        largest: float = np.max(np.abs(step))
+        if largest > max_step:
+            step = step * (max_step / largest)
+
+        # Applies the step, within the joint limits.
+        for bone, bone_step in zip(bones, step):
+            bone.set_theta(bounded_theta(bone.theta + bone_step, bone.theta_min, bone.theta_max))
+
+        # Stops if the step did not improve anything (usually a joint limit or unreachable target).
+        new_error: float = np.linalg.norm(target - fk(end_bone))
+        fk_evaluations += 1
+        if abs(error - new_error) < FLOAT_EPSILON:
+            reason: TerminationReason = TerminationReason.Converged if new_error < epsilon else TerminationReason.Stalled
+            return IKResult(new_error, i + 1, fk_evaluations, perf_counter() - start_time, reason)
+
+        error = new_error
+
+    reason: TerminationReason = TerminationReason.Converged if error < epsilon else TerminationReason.MaxIterations
+    return IKResult(error, max_it, fk_evaluations, perf_counter() - start_time, reason)
+
+
+def jacobian_batch(chain: Chain, thetas: np.array) -> tuple[np.array, np.array]:
+    """Computes the positional jacobians of many configurations of the same chain at once.
+
+    Args:
+        chain (Chain): The geometry of the chain, its own angles are ignored.
+        thetas (np.array): The (N, J) joint angles.
+
+    Returns:
+        tuple[np.array, np.array]: The (N, 3, J) jacobians and the (N, 3) FK Positions.
+    """
+    count: int = thetas.shape[0]
+    # Broadcasts against the joint rotations, so the first product gives every configuration its own frame.
+    frames: np.array = np.identity(3)
+    position: np.array = np.zeros((count, 3))
+    axes: np.array = np.empty((count, len(chain), 3))
+    origins: np.array = np.empty((count, len(chain), 3))
+
+    # Same walk as jacobian, every step handles all configurations.
+    for index, axis in enumerate(chain.axes.tolist()):
+        axes[:, index] = frames @ chain.axes[index]
+        origins[:, index] = position
+
+        frames = frames @ rotation.along_axis(tuple(axis), thetas[:, index])
+        position = position + frames @ chain.vectors[index]
+
+    # The cross products of jacobian, written out since np.cross is slow on small stacks.
+    offsets: np.array = position[:, np.newaxis, :] - origins
+    columns: np.array = np.empty((count, 3, len(chain)))
+    columns[:, 0] = axes[..., 1] * offsets[..., 2] - axes[..., 2] * offsets[..., 1]
+    columns[:, 1] = axes[..., 2] * offsets[..., 0] - axes[..., 0] * offsets[..., 2]
+    columns[:, 2] = axes[..., 0] * offsets[..., 1] - axes[..., 1] * offsets[..., 0]
+    return columns, position
+
+
+def ik_dls_batch(chain: Chain, thetas: np.array, targets: np.array, max_it: int = 20, epsilon: float = 0.1, damping: float = 1.0, max_step: float = 0.5, first: bool = False) -> tuple[np.array, list[IKResult]]:
+    """Performs damped-least-squares inverse kinematics on many configurations of the same chain at once.
+
+    Every row behaves like its own ik_dls call, rows that converged or stalled stop moving.
+    With first set, all rows stop as soon as one of them converged.
+
+    Args:
+        chain (Chain): The geometry and joint limits of the chain, its own angles are ignored.
+        thetas (np.array): The (N, J) starting joint angles.
+        targets (np.array): The (N, 3) target positions.
+        max_it (int, optional): The maximum number of iterations. Defaults to 20.
+        epsilon (float, optional): The error at which a row stops. Defaults to 0.1.
+        damping (float, optional): The damping factor, keeps steps sane near singularities. Defaults to 1.0.
+        max_step (float, optional): The maximum change of a single joint per iteration. Defaults to 0.5.
+        first (bool, optional): Whether to stop every row once one converged. Defaults to False.
+
+    Returns:
+        tuple[np.array, list[IKResult]]: The (N, J) solved joint angles, and the result of every row.
+    """
+    start_time: float = perf_counter()
+    thetas = np.array(thetas, dtype=float).reshape(-1, len(chain))
+    targets = np.asarray(targets, dtype=float).reshape(-1, 3)
+    count: int = thetas.shape[0]
+
+    # The per-row solver state, the jacobian pass doubles as the FK pass.
+    matrices, positions = jacobian_batch(chain, thetas)
+    errors: np.array = np.linalg.norm(targets - positions, axis=1)
+    iterations: np.array = np.zeros(count, dtype=int)
+    reasons: list[TerminationReason] = [ TerminationReason.MaxIterations ] * count
+    damping_matrix: np.array = (damping ** 2) * np.identity(3)
+
+    # The rows still moving, the working arrays only hold those and shrink when one stops,
+    #  so an iteration costs no gathers or scatters while every row keeps going.
+    rows: np.array = np.arange(count)
+    angles: np.array = thetas.copy()
+    goals: np.array = targets
+    remaining: np.array = errors.copy()
+
+    for i in range(0, max_it):
+        # Retires the rows that are close enough, with first set all of them once one is.
+        converged: np.array = remaining < epsilon
+        if np.any(converged):
+            for row in rows[converged]:
+                reasons[row] = TerminationReason.Converged
+            if first:
+                break
+            rows, angles, goals, remaining, matrices, positions = rows[~converged], angles[~converged], goals[~converged], remaining[~converged], matrices[~converged], positions[~converged]
+
+        if rows.shape[0] == 0:
+            break
+
+        # Computes the damped-least-squares steps: J^T (J J^T + lambda^2 I)^-1 e.
+        transposed: np.array = matrices.transpose(0, 2, 1)
+        solved: np.array = np.linalg.solve(matrices @ transposed + damping_matrix, (goals - positions)[..., np.newaxis])
+        steps: np.array = (transposed @ solved)[..., 0]
+
+        # Scales the steps down if a single joint would move too far.
+        largest: np.array = np.max(np.abs(steps), axis=1)
+        steps *= np.minimum(1.0, max_step / np.maximum(largest, FLOAT_EPSILON))[:, np.newaxis]
+
+        # Applies the steps, within the joint limits.
+        angles = np.minimum(np.maximum(angles + steps, chain.theta_mins), chain.theta_maxs)
+
+        # The jacobian of the new angles gives the new error, and the next step.
+        matrices, positions = jacobian_batch(chain, angles)
+        new_errors: np.array = np.linalg.norm(goals - positions, axis=1)
+        thetas[rows] = angles
+        errors[rows] = new_errors
+        iterations[rows] = i + 1
+
+        # Stops the rows where the step did not improve anything.
+        stalled: np.array = np.abs(remaining - new_errors) < FLOAT_EPSILON
+        remaining = new_errors
+        if np.any(stalled):
+            for row, error in zip(rows[stalled], new_errors[stalled]):
+                reasons[row] = TerminationReason.Converged if error < epsilon else TerminationReason.Stalled
+            rows, angles, goals, remaining, matrices, positions = rows[~stalled], angles[~stalled], goals[~stalled], remaining[~stalled], matrices[~stalled], positions[~stalled]
+
+    # The rows still moving ran out of iterations (or another row got there first), unless the last step got them there.
+    for row in rows:
+        reasons[row] = TerminationReason.Converged if errors[row] < epsilon else TerminationReason.MaxIterations
+
+    wall_time: float = perf_counter() - start_time
+    return thetas, [ IKResult(errors[row], int(iterations[row]), int(iterations[row]) + 1, wall_time, reasons[row]) for row in range(count) ]
+
+
+def multistart_seeds(chain: Chain, thetas: np.array, count: int, rng: np.random.Generator or None = None) -> np.array:
+    """Generates the starting configurations for ik_multistart.
+
+    Args:
+        chain (Chain): The geometry and joint limits of the chain.
+        thetas (np.array): The (J,) current joint angles.
+        count (int): The number of seeds.
+        rng (np.random.Generator or None, optional): The source of the random seeds, only needed past the branches. Defaults to a fresh generator.
+
+    Returns:
+        np.array: The (count, J) seeds, within the joint limits.
+    """
+    if count < 1:
+        raise ValueError(f'Need at least one seed, got {count}')
+
+    seeds: list[np.array] = [ thetas ]
+
+    # The other elbow branch: bends the last joint the other way, with the joint before it compensating.
+    if len(chain) >= 2:
+        elbow: np.array = thetas.copy()
+        elbow[-2] += thetas[-1]
+        elbow[-1] = -thetas[-1]
+        seeds.append(elbow)
+
+    # The other base branch: turns the base around and leans the rest the other way.
+    if len(chain) >= 2:
+        base: np.array = -thetas
+        base[0] = math.atan2(math.sin(thetas[0] + math.pi), math.cos(thetas[0] + math.pi))
+        seeds.append(base)
+        if len(chain) >= 3:
+            mirrored: np.array = base.copy()
+            mirrored[-2] += base[-1]
+            mirrored[-1] = -base[-1]
+            seeds.append(mirrored)
+
+    # The rest is random, joints without limits get a full turn.
+    seeds = seeds[:count]
+    if len(seeds) == count:
+        return np.clip(np.array(seeds), chain.theta_mins, chain.theta_maxs)
+    rng = np.random.default_rng() if rng is None else rng
+    low: np.array = np.where(np.isinf(chain.theta_mins), -math.pi, chain.theta_mins)
+    high: np.array = np.where(np.isinf(chain.theta_maxs), math.pi, chain.theta_maxs)
+    random: np.array = rng.uniform(low, high, (count - len(seeds), len(chain)))
+
+    return np.clip(np.concatenate([ np.array(seeds).reshape(-1, len(chain)), random ]), chain.theta_mins, chain.theta_maxs)
+
+
+def ik_multistart(start_bone: bone_vector, end_bone: bone_vector, target: np.array, seeds: int = 4, max_it: int = 20, epsilon: float = 0.1, rng: np.random.Generator or None = None, **kwargs) -> IKResult:
+    """Performs damped-least-squares inverse kinematics from several seeds at once, and keeps the best one.
+
+    The seeds are the current pose, its mirrored elbow and base branches and random poses within the
+    joint limits, all solved in a single ik_dls_batch call that stops as soon as one seed converged.
+
+    Args:
+        start_bone (bone_vector): The first bone of the chain.
+        end_bone (bone_vector): The last bone of the chain.
+        target (np.array): The target position.
+        seeds (int, optional): The number of seeds. Defaults to 4.
+        max_it (int, optional): The maximum number of iterations. Defaults to 20.
+        epsilon (float, optional): The error at which we stop. Defaults to 0.1.
+        rng (np.random.Generator or None, optional): The source of the random seeds. Defaults to a fresh generator.
+        **kwargs: Passed to ik_dls_batch.
+
+    Returns:
+        IKResult: The remaining error and solver statistics of the best seed.
+    """
+    if seeds < 1:
+        raise ValueError(f'Need at least one seed, got {seeds}')
+
+    start_time: float = perf_counter()
+    chain: Chain = Chain.from_bones(start_bone)
+
+    starts: np.array = multistart_seeds(chain, chain.thetas, seeds, rng)
+    thetas, results = ik_dls_batch(chain, starts, np.broadcast_to(np.asarray(target, dtype=float), starts.shape[:1] + (3,)), max_it, epsilon, first=True, **kwargs)
+
+    # Of the seeds that made it, takes the one that moves the joints the least, otherwise the closest.
+    errors: np.array = np.array([ result.error for result in results ])
+    best: int = int(np.argmin(errors))
+    converged: np.array = np.flatnonzero(errors < epsilon)
+    if converged.shape[0] > 1:
+        distances: np.array = np.sum(np.abs(np.arctan2(np.sin(thetas[converged] - chain.thetas), np.cos(thetas[converged] - chain.thetas))), axis=1)
+        best = int(converged[np.argmin(distances)])
+
+    chain.thetas[:] = thetas[best]
+    chain.write_bones(start_bone)
+
+    result: IKResult = results[best]
+    return IKResult(result.error, result.iterations, sum(result.fk_evaluations for result in results), perf_counter() - start_time, result.reason)
+
+
+# The keyword argument of each solver that controls its step size.
+ADAPTIVE_STEP_ARGUMENTS: dict[callable, str] = {
+    ik: 'max_step',
+    ik_dls: 'max_step'
+}
+
+
+def ik_trajectory(start_bone: bone_vector, end_bone: bone_vector, targets: iter, solver: callable = ik_dls, min_step: float = 0.05, max_step: float = 0.5, **kwargs) -> iter:
+    """Solves a stream of nearby targets, each one warm-started from the previous solution.
+
+    Args:
+        start_bone (bone_vector): The first bone of the chain.
+        end_bone (bone_vector): The last bone of the chain.
+        targets (iter): An iterable or (N, 3) array of target positions, consumed lazily.
+        solver (callable, optional): The solver to use. Defaults to ik_dls.
+        min_step (float, optional): The smallest step size given to the solver. Defaults to 0.05.
+        max_step (float, optional): The largest step size given to the solver. Defaults to 0.5.
+        **kwargs: Passed to the solver.
+
+    Yields:
+        tuple[np.array, IKResult]: The joint angles and the solver result for each target.
+    """
+
+    # Collects the bones, and the reach of the chain to turn distances into angles.
+    bones: list[bone_vector] = []
+    current: bone_vector or None = start_bone
+    while current is not None:
+        bones.append(current)
+        current = current.next
+
+    reach: float = max(sum(bone.vector_length for bone in bones), FLOAT_EPSILON)
+    step_argument: str or None = ADAPTIVE_STEP_ARGUMENTS.get(solver)
+
+    previous_target: np.array or None = None
+    previous_thetas: list[float] = [bone.theta for bone in bones]
+    for target in targets:
+        target = np.asarray(target, dtype=float)
+
+        # Starts from the previous solution, even if someone touched the chain in between.
+        for bone, theta in zip(bones, previous_thetas):
+            if bone.theta != theta:
+                bone.set_theta(theta)
+
+        # The joints roughly have to move the target delta over the reach of the chain.
+        if step_argument is not None:
+            step: float = max_step
+            if previous_target is not None:
+                step = min(max_step, max(min_step, np.linalg.norm(target - previous_target) / reach))
+            kwargs[step_argument] = step
+
+        result: IKResult = solver(start_bone, end_bone, target, **kwargs)
+
+        previous_target = target
+        previous_thetas = [bone.theta for bone in bones]
+        yield np.array(previous_thetas), result
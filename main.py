@@ -2,11 +2,15 @@
 Luke's Inverse Kinematics - Demo for automated kitchen, Rien Dumore.
 """
 
+import argparse
 from chain import chain_init
-from phy import Phy
-from window import Window
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the IK demo.')
+    parser.add_argument('--record', help='record every control tick to this ring file, see recorder.py to inspect or replay it')
+    parser.add_argument('--no-retime', action='store_true', help='send every solution straight to the PHY, without the joint velocity and acceleration limits')
+    args = parser.parse_args()
+
     # Prompts the user if we want to use a Phy.
     use_phy: bool = False
     while True:
@@ -19,15 +23,23 @@ if __name__ == '__main__':
         else:
             print(f'Invalid input \'{data}\' is not \'y\' or \'n\'')
 
-    # Connects to the phy if needed.
-    phy: Phy or None = None
+    # Connects to the phy if needed, pyserial only gets loaded then.
+    phy = None
     if use_phy:
-        phy = Phy.ask_from_user()
+        from phy import Phy
+        phy = Phy.ask_from_user(asynchronous=True)
 
     # Initializes the IK Chain.
-    chain_init()
+    bones: dict = chain_init()
+
+    # Opens the recording if asked for.
+    recorder = None
+    if args.record is not None:
+        from recorder import Recorder
+        recorder = Recorder(args.record, len(bones))
 
-    # Creates the window.
-    window: Window = Window(phy=phy)
+    # Creates the window, loading pygame and OpenGL.
+    from window import Window
+    window: Window = Window(phy=phy, recorder=recorder, retime=not args.no_retime)
     window.run()
 
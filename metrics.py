@@ -0,0 +1,107 @@
+from __future__ import annotations
+import numpy as np
+
+from inverse import IKResult
+
+METRICS_DEFAULT_WINDOW: int = 1024
+
+
+class Histogram:
+    """Keeps the last window values of a metric, to compute rolling statistics."""
+
+    __slots__ = ('values', 'count')
+
+    def __init__(self, window: int = METRICS_DEFAULT_WINDOW) -> None:
+        self.values = np.zeros(window)
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.values[self.count % self.values.shape[0]] = value
+        self.count += 1
+
+    def summary(self) -> dict[str, float]:
+        """Computes the statistics of the values in the window.
+
+        Returns:
+            dict[str, float]: The total count, and the mean and percentiles of the window.
+        """
+        window: np.array = self.values[:min(self.count, self.values.shape[0])]
+        if window.shape[0] == 0:
+            return { 'count': 0 }
+
+        p50, p90, p99 = np.percentile(window, [50, 90, 99])
+        return {
+            'count': self.count,
+            'mean': float(np.mean(window)),
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'max': float(np.max(window))
+        }
+
+
+class MetricsRegistry:
+    """A registry of named counters and rolling histograms, does nothing at all when disabled."""
+
+    def __init__(self, enabled: bool = True, window: int = METRICS_DEFAULT_WINDOW) -> None:
+        self.enabled = enabled
+        self.window = window
+        self.counters: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float) -> None:
+        if not self.enabled:
+            return
+        histogram: Histogram or None = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(self.window)
+        histogram.observe(value)
+
+    def observe_ik(self, result: IKResult, prefix: str = 'ik') -> None:
+        """Records the statistics of an IK solve.
+
+        Args:
+            result (IKResult): The solver result.
+            prefix (str, optional): The prefix of the metric names. Defaults to 'ik'.
+        """
+        if not self.enabled:
+            return
+        self.increment(f'{prefix}.solves')
+        self.increment(f'{prefix}.reason.{result.reason.name}')
+        self.observe(f'{prefix}.wall_time', result.wall_time)
+        self.observe(f'{prefix}.iterations', result.iterations)
+        self.observe(f'{prefix}.fk_evaluations', result.fk_evaluations)
+        self.observe(f'{prefix}.error', result.error)
+
+    def snapshot(self) -> dict[str, dict]:
+        """Gets the current value of all metrics.
+
+        Returns:
+            dict[str, dict]: The counters, and the summaries of the histograms.
+        """
+        return {
+            'counters': dict(self.counters),
+            'histograms': { name: histogram.summary() for name, histogram in list(self.histograms.items()) }
+        }
+
+    def dump(self) -> None:
+        """Prints all metrics.
+        """
+        snapshot: dict[str, dict] = self.snapshot()
+        for name, value in sorted(snapshot['counters'].items()):
+            print(f'{name}: {value}')
+        for name, summary in sorted(snapshot['histograms'].items()):
+            print(f'{name}: ' + ', '.join(f'{key}={value:.6g}' for key, value in summary.items()))
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+
+
+# The registry used by the application.
+registry: MetricsRegistry = MetricsRegistry()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from analytic import ik_analytic
+from bone_vector import bone_vector
+from inverse import IKResult
+
+PARALLEL_DEFAULT_CHUNK_SIZE: int = 256
+
+# The chain of the worker process, built once by worker_init.
+worker_state: dict = {}
+
+
+def worker_init(spec: list[dict], solver: callable, kwargs: dict) -> None:
+    """Builds the private chain of a worker process.
+
+    Args:
+        spec (list[dict]): The chain snapshot, from bone_vector.to_spec.
+        solver (callable): The IK solver.
+        kwargs (dict): Passed to the solver.
+    """
+    start: bone_vector = bone_vector.from_spec(spec)
+    bones: list[bone_vector] = []
+    current: bone_vector or None = start
+    while current is not None:
+        bones.append(current)
+        current = current.next
+
+    worker_state['bones'] = bones
+    worker_state['thetas'] = [ values['theta'] for values in spec ]
+    worker_state['solver'] = solver
+    worker_state['kwargs'] = kwargs
+
+
+def solve_chunk(targets: np.array) -> tuple[np.array, list[IKResult]]:
+    """Solves a chunk of targets on the chain of this worker.
+
+    Args:
+        targets (np.array): The (K, 3) targets.
+
+    Returns:
+        tuple[np.array, list[IKResult]]: The (K, J) joint angles, and the result of every target.
+    """
+    bones: list[bone_vector] = worker_state['bones']
+    solver: callable = worker_state['solver']
+    kwargs: dict = worker_state['kwargs']
+
+    thetas: np.array = np.empty((targets.shape[0], len(bones)))
+    results: list[IKResult] = []
+    for index, target in enumerate(targets):
+        # Every target starts from the snapshot pose, so the answers do not depend on the chunking.
+        for bone, theta in zip(bones, worker_state['thetas']):
+            bone.set_theta(theta)
+
+        results.append(solver(bones[0], bones[-1], target, **kwargs))
+        thetas[index] = [ bone.theta for bone in bones ]
+
+    return thetas, results
+
+
+def solve_parallel(start_bone: bone_vector, targets: np.array, solver: callable = ik_analytic, workers: int or None = None, chunk_size: int = PARALLEL_DEFAULT_CHUNK_SIZE, **kwargs) -> tuple[np.array, list[IKResult]]:
+    """Solves many independent targets on a pool of processes, each with its own copy of the chain.
+
+    The chain itself is only read, so it is safe to keep using it meanwhile.
+
+    Args:
+        start_bone (bone_vector): The first bone of the chain, the last bone is the end effector.
+        targets (np.array): The (N, 3) targets.
+        solver (callable, optional): The IK solver, must be a module level function. Defaults to ik_analytic.
+        workers (int or None, optional): The number of processes, 1 solves in this process. Defaults to the number of CPUs.
+        chunk_size (int, optional): The number of targets sent to a worker at once. Defaults to PARALLEL_DEFAULT_CHUNK_SIZE.
+        **kwargs: Passed to the solver.
+
+    Returns:
+        tuple[np.array, list[IKResult]]: The (N, J) joint angles, and the result of every target, both in input order.
+    """
+    targets = np.asarray(targets, dtype=float).reshape(-1, 3)
+    spec: list[dict] = start_bone.to_spec()
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if chunk_size < 1:
+        raise ValueError(f'The chunk size must be positive, got {chunk_size}')
+
+    if targets.shape[0] == 0:
+        return np.empty((0, len(spec))), []
+
+    chunks: list[np.array] = [ targets[index:index + chunk_size] for index in range(0, targets.shape[0], chunk_size) ]
+
+    # A single worker does not need a pool, but still gets its own chain.
+    if workers <= 1:
+        worker_init(spec, solver, kwargs)
+        solved: list[tuple[np.array, list[IKResult]]] = [ solve_chunk(chunk) for chunk in chunks ]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=worker_init, initargs=(spec, solver, kwargs)) as executor:
+            solved = list(executor.map(solve_chunk, chunks))
+
+    thetas: np.array = np.concatenate([ chunk_thetas for chunk_thetas, _ in solved ])
+    results: list[IKResult] = [ result for _, chunk_results in solved for result in chunk_results ]
+    return thetas, results
@@ -1,11 +1,13 @@
 from __future__ import annotations
+import binascii
 import math
-from time import sleep
-import serial
-import serial.tools.list_ports as list_ports
+import struct
+import threading
+from time import perf_counter, sleep
 
 from bone_vector import bone_vector
 from helpers import rad
+from metrics import Histogram
 
 STEPPER_CONVERSION_DICT = [
     49.0 * 1600.0,    
@@ -13,31 +15,191 @@ STEPPER_CONVERSION_DICT = [
     49.0 * 400.0
 ]
 
+PHY_DEFAULT_RATE: float = 100.0
+
+# The background writer gives up after this many failed writes in a row.
+PHY_MAX_WRITE_ERRORS: int = 10
+
+PHY_PROTOCOL_ASCII: str = 'ascii'
+PHY_PROTOCOL_BINARY: str = 'binary'
+
+# Binary frame: magic, version and motor count, a little-endian int32 per motor, and a CRC-16 of all of it.
+PHY_BINARY_MAGIC: bytes = b'\xa5\x5a'
+PHY_BINARY_VERSION: int = 1
+PHY_BINARY_HEADER: struct.Struct = struct.Struct('<2sBB')
+PHY_BINARY_CHECKSUM: struct.Struct = struct.Struct('<H')
+
+
+def encode_ascii(targets: dict[int, int]) -> bytes:
+    """Encodes motor targets as text lines.
+
+    Args:
+        targets (dict[int, int]): The number of pulses per motor index.
+
+    Returns:
+        bytes: One 'motor,pulses' line per motor.
+    """
+    return b''.join(f'{motor},{pulses}\n'.encode() for motor, pulses in sorted(targets.items()))
+
+
+def encode_binary(pulses: list[int]) -> bytes:
+    """Encodes the targets of all motors as a binary frame.
+
+    Args:
+        pulses (list[int]): The number of pulses of every motor, by index.
+
+    Returns:
+        bytes: The frame.
+    """
+    body: bytes = PHY_BINARY_HEADER.pack(PHY_BINARY_MAGIC, PHY_BINARY_VERSION, len(pulses)) + struct.pack(f'<{len(pulses)}i', *pulses)
+    return body + PHY_BINARY_CHECKSUM.pack(binascii.crc_hqx(body, 0xFFFF))
+
+
+def binary_frame_size(count: int) -> int:
+    return PHY_BINARY_HEADER.size + 4 * count + PHY_BINARY_CHECKSUM.size
+
+
+def decode_binary(frame: bytes) -> list[int]:
+    """Decodes a binary frame.
+
+    Args:
+        frame (bytes): The complete frame.
+
+    Returns:
+        list[int]: The number of pulses of every motor, by index.
+    """
+    magic, version, count = PHY_BINARY_HEADER.unpack_from(frame)
+    if magic != PHY_BINARY_MAGIC or version != PHY_BINARY_VERSION:
+        raise ValueError('Invalid binary frame header')
+    if len(frame) != binary_frame_size(count):
+        raise ValueError(f'Invalid binary frame size {len(frame)} for {count} motors')
+
+    body: bytes = frame[:-PHY_BINARY_CHECKSUM.size]
+    checksum, = PHY_BINARY_CHECKSUM.unpack_from(frame, len(body))
+    if checksum != binascii.crc_hqx(body, 0xFFFF):
+        raise ValueError('Invalid binary frame checksum')
+
+    return list(struct.unpack_from(f'<{count}i', frame, PHY_BINARY_HEADER.size))
+
+
 class Phy:
-    def __init__(self, port: str) -> None:
+    def __init__(self, port: str or None = None, ser: any = None, asynchronous: bool = False, rate: float = PHY_DEFAULT_RATE, protocol: str = PHY_PROTOCOL_ASCII) -> None:
         """Initialzies a new Phy class instance.
 
         Args:
-            port (str): the device path.
+            port (str or None, optional): the device path. Defaults to None.
+            ser (any, optional): An already opened serial port (or anything with a write method), used instead of the port. Defaults to None.
+            asynchronous (bool, optional): If the writes should happen on a background thread. Defaults to False.
+            rate (float, optional): The maximum number of writes per second of the background thread. Defaults to PHY_DEFAULT_RATE.
+            protocol (str, optional): PHY_PROTOCOL_ASCII for text lines, PHY_PROTOCOL_BINARY for binary frames. Defaults to PHY_PROTOCOL_ASCII.
         """
-        self.ser = serial.Serial(port=port, baudrate=115200)
-    
-    def move(self, motor: int, theta: float) -> None:
-        """Moves the motor to the given angle.
+        if protocol not in (PHY_PROTOCOL_ASCII, PHY_PROTOCOL_BINARY):
+            raise ValueError(f'Unknown PHY protocol \'{protocol}\'')
+
+        # Only loads pyserial when we actually open a port.
+        if ser is None:
+            import serial
+            ser = serial.Serial(port=port, baudrate=115200)
+
+        self.ser = ser
+        self.asynchronous = asynchronous
+        self.protocol = protocol
+        self.period = 1.0 / rate
+
+        # The latest target of each motor that has not been written yet, and the last written ones.
+        self.pending: dict[int, int] = {}
+        self.sent: dict[int, int] = {}
+
+        # Statistics of the background writer.
+        self.dropped: int = 0
+        self.skipped: int = 0
+        self.frames: int = 0
+        self.write_latency: Histogram = Histogram()
+
+        # Failed writes of the background writer, the last error, and if it is still running.
+        self.errors: int = 0
+        self.error: Exception or None = None
+        self.alive = False
+
+        self.running = False
+        self.condition = threading.Condition()
+        self.thread: threading.Thread or None = None
+        if asynchronous:
+            self.running = True
+            self.alive = True
+            self.thread = threading.Thread(target=self.writer, name='phy-writer', daemon=True)
+            self.thread.start()
+
+    def pulses(motor: int, theta: float) -> int:
+        """Converts an angle into the stepper position of a motor.
 
         Args:
             motor (int): The motor index.
             theta (float): The angle.
+
+        Returns:
+            int: The number of pulses.
         """
 
         # Gets the number of full rotations to perform.
         rotations: float = theta / (math.pi * 2)
 
         # Calculates the number of pulses.
-        pulses: int = int(rotations * STEPPER_CONVERSION_DICT[motor])
+        return int(rotations * STEPPER_CONVERSION_DICT[motor])
+
+    def motors(self, targets: dict[int, int]) -> int:
+        return max(len(STEPPER_CONVERSION_DICT), max(targets) + 1)
+
+    def complete(self, targets: dict[int, int]) -> bool:
+        """Checks if every motor has a target, given or written before, binary frames always carry all of them.
+
+        Args:
+            targets (dict[int, int]): The number of pulses per motor index.
+
+        Returns:
+            bool: If the targets can be written.
+        """
+        if self.protocol == PHY_PROTOCOL_ASCII:
+            return True
+        return all(motor in targets or motor in self.sent for motor in range(self.motors(targets)))
+
+    def frame(self, targets: dict[int, int]) -> bytes:
+        """Encodes motor targets in our protocol, binary frames also carry the last written target of the other motors.
+
+        Args:
+            targets (dict[int, int]): The number of pulses per motor index.
+
+        Returns:
+            bytes: The data to write.
+        """
+        if self.protocol == PHY_PROTOCOL_ASCII:
+            return encode_ascii(targets)
+
+        # A motor that was never written has no target to repeat, guessing one would move it.
+        if not self.complete(targets):
+            raise ValueError('The first binary frame needs a target for every motor, write the whole chain first')
+        return encode_binary([ targets.get(motor, self.sent.get(motor)) for motor in range(self.motors(targets)) ])
+
+    def write(self, targets: dict[int, int]) -> None:
+        self.ser.write(self.frame(targets))
+        self.sent.update(targets)
+
+    def move(self, motor: int, theta: float) -> None:
+        """Moves the motor to the given angle.
+
+        Args:
+            motor (int): The motor index.
+            theta (float): The angle.
+        """
+        pulses: int = Phy.pulses(motor, theta)
+
+        # Leaves the writing to the background thread.
+        if self.asynchronous:
+            self.submit({ motor: pulses })
+            return
 
         # Writes the target position.
-        self.ser.write(f'{motor},{pulses}\n'.encode())
+        self.write({ motor: pulses })
 
     def write_chain(self, start: bone_vector) -> None:
         """Writes an entire bone chain of values to the PHY.
@@ -45,22 +207,154 @@ class Phy:
         Args:
             start (bone_vector): The first bone.
         """
-
-        index: int = 0
+        thetas: list[float] = []
         current: bone_vector = start
         while current is not None:
-            self.move(index, current.theta)
-            index += 1
+            thetas.append(current.theta)
             current = current.next
 
-    def ask_from_user() -> Phy:
+        self.write_thetas(thetas)
+
+    def write_thetas(self, thetas: list[float]) -> None:
+        """Writes the angles of all motors, from the first one.
+
+        Args:
+            thetas (list[float]): The angle of every motor, by index.
+        """
+
+        # Queues all motors at once, so they end up in the same write.
+        if self.asynchronous:
+            self.submit({ index: Phy.pulses(index, theta) for index, theta in enumerate(thetas) })
+            return
+
+        # Binary frames hold all motors anyway.
+        if self.protocol == PHY_PROTOCOL_BINARY:
+            self.write({ index: Phy.pulses(index, theta) for index, theta in enumerate(thetas) })
+            return
+
+        for index, theta in enumerate(thetas):
+            self.move(index, theta)
+
+    def submit(self, targets: dict[int, int]) -> None:
+        """Queues motor targets for the background writer, newer targets replace unwritten older ones.
+
+        Args:
+            targets (dict[int, int]): The number of pulses per motor index.
+        """
+        # Nothing would ever write them.
+        if not self.alive:
+            raise RuntimeError(f'The PHY writer stopped: {self.error!r}')
+
+        with self.condition:
+            for motor, pulses in targets.items():
+                if motor in self.pending:
+                    self.dropped += 1
+                self.pending[motor] = pulses
+            self.condition.notify()
+
+    def writer(self) -> None:
+        """The background writer, writes the pending targets at most once per period.
+        """
+        try:
+            self.write_pending()
+        finally:
+            self.alive = False
+
+    def write_pending(self) -> None:
+        """Writes until closed, or until the port keeps failing.
+        """
+        next_tick: float = perf_counter()
+        consecutive: int = 0
+        while True:
+            # Waits for something to write, and takes all of it.
+            with self.condition:
+                while len(self.pending) == 0 and self.running:
+                    self.condition.wait()
+                if len(self.pending) == 0 and not self.running:
+                    return
+                # Partial binary frames wait until every motor has a target.
+                if not self.complete(self.pending):
+                    if not self.running:
+                        return
+                    self.condition.wait()
+                    continue
+                batch: dict[int, int] = self.pending
+                self.pending = {}
+
+            # Skips the motors that are already at the target.
+            changed: dict[int, int] = { motor: pulses for motor, pulses in batch.items() if self.sent.get(motor) != pulses }
+            self.skipped += len(batch) - len(changed)
+
+            # Writes all the motors in a single frame.
+            if len(changed) > 0:
+                start_time: float = perf_counter()
+                try:
+                    self.write(changed)
+                    consecutive = 0
+                except OSError as error:
+                    # Serial errors (unplugged, timed out) are OSErrors, the batch is retried unless something newer came in.
+                    consecutive += 1
+                    self.errors += 1
+                    self.error = error
+                    print(f'PHY write failed: {error!r}')
+                    if consecutive >= PHY_MAX_WRITE_ERRORS:
+                        print(f'Stopping the PHY writer, {consecutive} writes in a row failed')
+                        return
+                    with self.condition:
+                        self.pending = { **changed, **self.pending }
+                else:
+                    self.write_latency.observe(perf_counter() - start_time)
+                    self.frames += 1
+
+            # Waits for the next tick, newer targets keep replacing the pending ones meanwhile.
+            next_tick = max(next_tick + self.period, perf_counter())
+            sleep(max(0.0, next_tick - perf_counter()))
+
+    def stats(self) -> dict:
+        """Gets the statistics of the background writer.
+
+        Returns:
+            dict: The queue depth, dropped and skipped updates, written frames, failed writes, if the writer is alive, and the write latency.
+        """
+        with self.condition:
+            queue_depth: int = len(self.pending)
+        return {
+            'queue_depth': queue_depth,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'frames': self.frames,
+            'errors': self.errors,
+            'error': None if self.error is None else repr(self.error),
+            'alive': self.alive,
+            'write_latency': self.write_latency.summary()
+        }
+
+    def close(self) -> None:
+        """Writes whatever is pending, stops the background writer and closes the port.
+        """
+        if self.thread is not None:
+            with self.condition:
+                self.running = False
+                self.condition.notify()
+            self.thread.join()
+            self.thread = None
+
+        if hasattr(self.ser, 'close'):
+            self.ser.close()
+
+    def ask_from_user(asynchronous: bool = False, protocol: str = PHY_PROTOCOL_ASCII) -> Phy:
         """Gives the user an list of all devices, and makes him select one.
 
+        Args:
+            asynchronous (bool, optional): If the writes should happen on a background thread. Defaults to False.
+            protocol (str, optional): The protocol the controller speaks. Defaults to PHY_PROTOCOL_ASCII.
+
         Returns:
             Phy: The result PHY.
         """
 
         # Gets a list of all the comports.
+        import serial.tools.list_ports as list_ports
         comports = list_ports.comports()
 
         # Prints the comports.
@@ -91,4 +385,4 @@ class Phy:
             break
         
         # Returns the phy.
-        return Phy(comports[index].device)
\ No newline at end of file
+        return Phy(comports[index].device, asynchronous=asynchronous, protocol=protocol)
\ No newline at end of file
@@ -0,0 +1,269 @@
+"""
+Luke's Inverse Kinematics - Ring-buffer recorder of targets and joint states, and a headless replayer.
+"""
+
+from __future__ import annotations
+import argparse
+import os
+import sys
+from time import perf_counter, sleep
+import numpy as np
+
+from bone_vector import bone_vector
+from headless import HEADLESS_SOLVERS
+from inverse import IKResult, ik
+
+RECORDER_MAGIC: bytes = b'LIKREC01'
+RECORDER_VERSION: int = 1
+
+# An hour at the default control rate.
+RECORDER_DEFAULT_CAPACITY: int = 360000
+
+# The header, padded so the records start on a 64 byte boundary.
+RECORDER_HEADER_DTYPE: np.dtype = np.dtype([ ('magic', 'S8'), ('version', '<u4'), ('joints', '<u4'), ('capacity', '<u8'), ('count', '<u8'), ('padding', 'V32') ])
+
+
+def record_dtype(joints: int) -> np.dtype:
+    """Gets the layout of a single record.
+
+    Args:
+        joints (int): The number of joints of the chain.
+
+    Returns:
+        np.dtype: The structured record type, all little-endian float64 fields.
+    """
+    return np.dtype([ ('timestamp', '<f8'), ('target', '<f8', (3,)), ('thetas', '<f8', (joints,)), ('error', '<f8'), ('solve_time', '<f8') ])
+
+
+class Recorder:
+    """Appends one fixed-size record per control tick to a preallocated memory-mapped ring file."""
+
+    def __init__(self, path: str, joints: int, capacity: int = RECORDER_DEFAULT_CAPACITY) -> None:
+        """Creates (or truncates) the ring file, and maps it.
+
+        Args:
+            path (str): The file path.
+            joints (int): The number of joints of the chain.
+            capacity (int, optional): The number of records before the oldest ones get overwritten. Defaults to RECORDER_DEFAULT_CAPACITY.
+        """
+        self.path = path
+        self.joints = joints
+        self.capacity = capacity
+
+        self.header: np.memmap = np.memmap(path, dtype=RECORDER_HEADER_DTYPE, mode='w+', shape=(1,))
+        self.header['magic'] = RECORDER_MAGIC
+        self.header['version'] = RECORDER_VERSION
+        self.header['joints'] = joints
+        self.header['capacity'] = capacity
+        self.header['count'] = 0
+        self.header.flush()
+
+        self.records: np.memmap = np.memmap(path, dtype=record_dtype(joints), mode='r+', offset=RECORDER_HEADER_DTYPE.itemsize, shape=(capacity,))
+
+        # Every record is a row of float64, so appending is a few slice assignments, on plain arrays
+        #  since indexing a memmap goes through its subclass machinery.
+        self.rows: np.array = self.records.view(np.ndarray).view(np.float64).reshape(capacity, -1)
+        self.written: np.array = self.header.view(np.ndarray)['count']
+        self.count: int = 0
+
+    def append(self, timestamp: float, target: np.array, thetas: list[float], error: float, solve_time: float) -> None:
+        """Writes a record over the oldest one once the ring is full.
+
+        Args:
+            timestamp (float): The time of the tick.
+            target (np.array): The IK target.
+            thetas (list[float]): The solved joint angles.
+            error (float): The remaining IK error.
+            solve_time (float): The time the solve took, in seconds.
+        """
+        row: np.array = self.rows[self.count % self.capacity]
+        row[0] = timestamp
+        row[1:4] = target
+        row[4:4 + self.joints] = thetas
+        row[4 + self.joints] = error
+        row[5 + self.joints] = solve_time
+
+        self.count += 1
+        self.written[0] = self.count
+
+    def flush(self) -> None:
+        self.records.flush()
+        self.header.flush()
+
+    def close(self) -> None:
+        self.flush()
+        del self.rows
+        del self.written
+        del self.records
+        del self.header
+
+
+class Recording:
+    """A read-only view on a ring file, the records are never copied unless asked for in order across the wrap."""
+
+    def __init__(self, path: str) -> None:
+        """Maps a ring file.
+
+        Args:
+            path (str): The file path.
+        """
+        header: np.memmap = np.memmap(path, dtype=RECORDER_HEADER_DTYPE, mode='r', shape=(1,))
+        if header['magic'][0] != RECORDER_MAGIC or header['version'][0] != RECORDER_VERSION:
+            raise ValueError(f'\'{path}\' is not a recording')
+
+        self.path = path
+        self.joints: int = int(header['joints'][0])
+        self.capacity: int = int(header['capacity'][0])
+        self.count: int = int(header['count'][0])
+        self.ring: np.memmap = np.memmap(path, dtype=record_dtype(self.joints), mode='r', offset=RECORDER_HEADER_DTYPE.itemsize, shape=(self.capacity,))
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def segments(self) -> list[np.array]:
+        """Gets the records in chronological order, as zero-copy views.
+
+        Returns:
+            list[np.array]: One view, or two once the ring wrapped (oldest first).
+        """
+        if self.count <= self.capacity:
+            return [ self.ring[:self.count] ]
+
+        head: int = self.count % self.capacity
+        return [ self.ring[head:], self.ring[:head] ]
+
+    def records(self) -> np.array:
+        """Gets the records in chronological order, a view unless the ring wrapped.
+
+        Returns:
+            np.array: The structured records.
+        """
+        segments: list[np.array] = self.segments()
+        return segments[0] if len(segments) == 1 else np.concatenate(segments)
+
+
+class Replayer:
+    """Feeds a recording back through an IK solver, and optionally a Phy, without a window."""
+
+    def __init__(self, recording: Recording, start_bone: bone_vector, end_bone: bone_vector, solver: callable = ik, phy: any = None) -> None:
+        """Initializes a new replayer.
+
+        Args:
+            recording (Recording): The recording.
+            start_bone (bone_vector): The first bone of a chain with the same number of joints.
+            end_bone (bone_vector): The last bone of the chain.
+            solver (callable, optional): The IK solver. Defaults to ik.
+            phy (any, optional): The Phy to write every solution to. Defaults to None.
+        """
+        self.recording = recording
+        self.start = start_bone
+        self.end = end_bone
+        self.solver = solver
+        self.phy = phy
+
+        self.bones: list[bone_vector] = []
+        current: bone_vector or None = start_bone
+        while current is not None:
+            self.bones.append(current)
+            current = current.next
+        if len(self.bones) != recording.joints:
+            raise ValueError(f'The recording has {recording.joints} joints, the chain has {len(self.bones)}')
+
+    def run(self, realtime: bool = False) -> iter:
+        """Replays every record, each solve starts from the previously recorded pose like it did live.
+
+        Args:
+            realtime (bool, optional): If the records should be replayed at their recorded pace, instead of at full speed. Defaults to False.
+
+        Yields:
+            tuple[np.array, np.array, IKResult]: The record, the replayed joint angles and the solver result.
+        """
+        start_time: float = perf_counter()
+        first: float or None = None
+        previous: np.array or None = None
+        for segment in self.recording.segments():
+            for record in segment:
+                # Waits until the record is due.
+                if realtime:
+                    first = record['timestamp'] if first is None else first
+                    sleep(max(0.0, (record['timestamp'] - first) - (perf_counter() - start_time)))
+
+                if previous is not None:
+                    for bone, theta in zip(self.bones, previous):
+                        if bone.theta != theta:
+                            bone.set_theta(float(theta))
+
+                result: IKResult = self.solver(self.start, self.end, record['target'])
+                if self.phy is not None:
+                    self.phy.write_chain(self.start)
+
+                previous = record['thetas']
+                yield record, np.array([ bone.theta for bone in self.bones ]), result
+
+    def summary(self, realtime: bool = False) -> dict:
+        """Replays everything, and compares the outcome to the recording.
+
+        Args:
+            realtime (bool, optional): If the records should be replayed at their recorded pace. Defaults to False.
+
+        Returns:
+            dict: The number of records, the replay time, and how far the replayed errors and angles are from the recorded ones.
+        """
+        start_time: float = perf_counter()
+        count: int = 0
+        error_differences: list[float] = []
+        theta_differences: list[float] = []
+        for record, thetas, result in self.run(realtime):
+            count += 1
+            error_differences.append(abs(result.error - float(record['error'])))
+
+            # Angles a full turn apart are the same pose.
+            difference: np.array = np.remainder(thetas - record['thetas'] + np.pi, 2 * np.pi) - np.pi
+            theta_differences.append(float(np.max(np.abs(difference))))
+
+        return {
+            'records': count,
+            'duration': perf_counter() - start_time,
+            'error_difference_max': max(error_differences, default=0.0),
+            'theta_difference_max': max(theta_differences, default=0.0),
+            'theta_difference_mean': float(np.mean(theta_differences)) if count > 0 else 0.0
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Inspects or replays a recording.')
+    parser.add_argument('recording', help='the ring file written by main.py --record')
+    parser.add_argument('--replay', action='store_true', help='feed the recording back through the IK solver')
+    parser.add_argument('--realtime', action='store_true', help='replay at the recorded pace instead of full speed')
+    parser.add_argument('--solver', choices=HEADLESS_SOLVERS.keys(), default='ik', help='the solver to replay with, see headless.py (the window solves analytically)')
+    parser.add_argument('--port', help='also write the replayed angles to the PHY on this port')
+    args = parser.parse_args()
+
+    recording: Recording = Recording(args.recording)
+    records: np.array = recording.records()
+    print(f'{args.recording}: {len(recording)} records of {recording.joints} joints ({recording.count} written, capacity {recording.capacity}, {os.path.getsize(args.recording)} bytes)')
+    if len(recording) > 0:
+        print(f'span {records["timestamp"][-1] - records["timestamp"][0]:.1f}s, error mean {np.mean(records["error"]):.4f} max {np.max(records["error"]):.4f}, solve time p50 {np.median(records["solve_time"]) * 1e6:.0f}us max {np.max(records["solve_time"]) * 1e6:.0f}us')
+
+    if not args.replay:
+        return 0
+
+    # Only loaded for a replay, the chain is built on first use.
+    from chain import chain_init
+    bones: dict[str, bone_vector] = chain_init()
+
+    phy = None
+    if args.port is not None:
+        from phy import Phy
+        phy = Phy(args.port)
+
+    summary: dict = Replayer(recording, bones['chain_bottom'], bones['chain_top'], solver=HEADLESS_SOLVERS[args.solver], phy=phy).summary(args.realtime)
+    print(', '.join(f'{key}: {value:.6g}' for key, value in summary.items()))
+
+    if phy is not None:
+        phy.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
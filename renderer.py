@@ -0,0 +1,164 @@
+from __future__ import annotations
+import ctypes
+import math
+import numpy as np
+
+from arc import arc_points
+
+# The axis gizmo: a unit line along each axis, interleaved position and RGBA color.
+RENDERER_AXIS_VERTICES: np.array = np.array([
+    [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.7], [1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.7],
+    [0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.7], [0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.7],
+    [0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.7], [0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.7]
+], dtype=np.float32)
+
+RENDERER_MAX_CHAIN_POINTS: int = 64
+
+
+class VertexBuffer:
+    """A vertex buffer object, with the number of vertices currently in it."""
+
+    def __init__(self, capacity: int, stride: int = 3, usage: int or None = None) -> None:
+        """Allocates a new vertex buffer.
+
+        Args:
+            capacity (int): The maximum number of vertices.
+            stride (int, optional): The number of floats per vertex. Defaults to 3.
+            usage (int or None, optional): The usage hint. Defaults to GL_DYNAMIC_DRAW.
+        """
+        # OpenGL only gets loaded once something is drawn, importing this module stays cheap.
+        from OpenGL.GL import GL_ARRAY_BUFFER, GL_DYNAMIC_DRAW, glBindBuffer, glBufferData, glGenBuffers
+        usage = GL_DYNAMIC_DRAW if usage is None else usage
+
+        self.id = glGenBuffers(1)
+        self.capacity = capacity
+        self.stride = stride
+        self.usage = usage
+        self.count: int = 0
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.id)
+        glBufferData(GL_ARRAY_BUFFER, capacity * stride * 4, None, usage)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def upload(self, vertices: np.array) -> None:
+        """Replaces the contents of the buffer, grows it if needed.
+
+        Args:
+            vertices (np.array): The (N, stride) vertices.
+        """
+        from OpenGL.GL import GL_ARRAY_BUFFER, glBindBuffer, glBufferData, glBufferSubData
+        data: np.array = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, self.stride)
+        glBindBuffer(GL_ARRAY_BUFFER, self.id)
+        if data.shape[0] > self.capacity:
+            self.capacity = data.shape[0]
+            glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, self.usage)
+        elif data.shape[0] > 0:
+            glBufferSubData(GL_ARRAY_BUFFER, 0, data.nbytes, data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.count = data.shape[0]
+
+    def draw(self, mode: int, first: int = 0, count: int or None = None, colors: bool = False) -> None:
+        """Draws (part of) the buffer.
+
+        Args:
+            mode (int): The primitive type.
+            first (int, optional): The first vertex. Defaults to 0.
+            count (int or None, optional): The number of vertices. Defaults to all from the first.
+            colors (bool, optional): If the vertices are interleaved with RGBA colors. Defaults to False.
+        """
+        count = self.count - first if count is None else count
+        if count <= 0:
+            return
+
+        from OpenGL.GL import GL_ARRAY_BUFFER, GL_COLOR_ARRAY, GL_FLOAT, GL_VERTEX_ARRAY, glBindBuffer, glColorPointer, glDisableClientState, glDrawArrays, glEnableClientState, glVertexPointer
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.id)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, self.stride * 4, ctypes.c_void_p(0))
+        if colors:
+            glEnableClientState(GL_COLOR_ARRAY)
+            glColorPointer(4, GL_FLOAT, self.stride * 4, ctypes.c_void_p(3 * 4))
+
+        glDrawArrays(mode, first, count)
+
+        if colors:
+            glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+
+class Renderer:
+    """Draws the chain, the arc and the axes from vertex buffers, needs a current OpenGL context."""
+
+    def __init__(self) -> None:
+        from OpenGL.GL import GL_STATIC_DRAW
+
+        # The axis never changes.
+        self.axis: VertexBuffer = VertexBuffer(RENDERER_AXIS_VERTICES.shape[0], stride=7, usage=GL_STATIC_DRAW)
+        self.axis.upload(RENDERER_AXIS_VERTICES)
+
+        # The joints, followed by the line from the origin to the end effector.
+        self.chain: VertexBuffer = VertexBuffer(RENDERER_MAX_CHAIN_POINTS + 2)
+        self.chain_vertices: np.array = np.zeros((RENDERER_MAX_CHAIN_POINTS + 2, 3), dtype=np.float32)
+
+        # The arc only gets uploaded when it changes.
+        self.arc: VertexBuffer = VertexBuffer(256, usage=GL_STATIC_DRAW)
+        self.arc_parameters: tuple or None = None
+
+    def draw_axis(self, position: np.array, size: float = 5.0, width: float = 2.0) -> None:
+        from OpenGL.GL import GL_LINES, GL_MODELVIEW, glLineWidth, glMatrixMode, glPopMatrix, glPushMatrix, glScalef, glTranslatef
+        glLineWidth(width)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glTranslatef(position[0], position[1], position[2])
+        glScalef(size, size, size)
+        self.axis.draw(GL_LINES, colors=True)
+        glPopMatrix()
+
+    def draw_chain(self, points: np.array) -> None:
+        """Draws the chain, its joints, the line to the end effector and the end effector axes.
+
+        Args:
+            points (np.array): The (J + 1, 3) joint positions, from the origin to the end effector.
+        """
+        from OpenGL.GL import GL_LINE_STIPPLE, GL_LINE_STRIP, GL_LINES, GL_POINTS, glColor4f, glDisable, glEnable, glLineStipple, glLineWidth, glPointSize
+        count: int = points.shape[0]
+        if count + 2 > self.chain_vertices.shape[0]:
+            self.chain_vertices = np.zeros((count + 2, 3), dtype=np.float32)
+
+        # Fills the preallocated vertices, and uploads them in one go.
+        self.chain_vertices[:count] = points
+        self.chain_vertices[count] = 0.0
+        self.chain_vertices[count + 1] = points[-1]
+        self.chain.upload(self.chain_vertices[:count + 2])
+
+        # The joints, the origin does not get a dot.
+        glColor4f(1.0, 1.0, 1.0, 1.0)
+        glPointSize(5)
+        self.chain.draw(GL_POINTS, 1, count - 1)
+
+        # The bones, and the line to the end effector.
+        glEnable(GL_LINE_STIPPLE)
+        glLineStipple(1, 0x0101)
+        glLineWidth(10.0)
+        glColor4f(1.0, 0.5, 1.0, 1.0)
+        self.chain.draw(GL_LINE_STRIP, 0, count)
+        glColor4f(1.0, 0.5, 0.5, 1.0)
+        self.chain.draw(GL_LINES, count, 2)
+        glDisable(GL_LINE_STIPPLE)
+
+        self.draw_axis(points[-1], size=5.0)
+
+    def draw_arc(self, position: np.array, orientation: list[float], radius: float, width: float = 5.0, start: float = 0.0, end: float = 2 * math.pi) -> None:
+        from OpenGL.GL import GL_LINES, glLineWidth
+
+        # Recomputes and uploads the vertices only when the arc changed.
+        parameters: tuple = (tuple(float(value) for value in position), tuple(float(value) for value in orientation), float(radius), float(start), float(end))
+        if parameters != self.arc_parameters:
+            steps: int = int((abs(end - start) / math.pi) * 30)
+            angles: np.array = start + ((end - start) / max(steps, 1)) * np.arange(steps)
+            self.arc.upload(arc_points(angles, position, orientation, radius))
+            self.arc_parameters = parameters
+
+        glLineWidth(width)
+        self.arc.draw(GL_LINES)
@@ -0,0 +1,225 @@
+"""
+Luke's Inverse Kinematics - Retiming of joint space paths to the stepper velocity and acceleration limits, one setpoint per tick.
+"""
+
+from __future__ import annotations
+import math
+import numpy as np
+
+from defs import FLOAT_EPSILON
+from helpers import rad
+from phy import PHY_DEFAULT_RATE, STEPPER_CONVERSION_DICT
+
+# What the stepper drivers can follow without stalling, in pulses per second and pulses per second squared.
+RETIMING_MAX_PULSE_RATE: float = 40000.0
+RETIMING_MAX_PULSE_ACCELERATION: float = 80000.0
+
+RETIMING_DEFAULT_RATE: float = PHY_DEFAULT_RATE
+
+# The part of the joint acceleration limits that goes to changing direction, next to corners.
+RETIMING_CORNER_SHARE: float = 0.5
+
+# Paths get subdivided until no joint moves more than this between two points.
+RETIMING_DEFAULT_RESOLUTION: float = rad(1.0)
+
+
+def joint_limits(pulse_rate: float = RETIMING_MAX_PULSE_RATE, pulse_acceleration: float = RETIMING_MAX_PULSE_ACCELERATION) -> tuple[np.array, np.array]:
+    """Derives the joint velocity and acceleration limits from the pulses per rotation of every stepper.
+
+    Args:
+        pulse_rate (float, optional): The maximum number of pulses per second. Defaults to RETIMING_MAX_PULSE_RATE.
+        pulse_acceleration (float, optional): The maximum change of the pulse rate per second. Defaults to RETIMING_MAX_PULSE_ACCELERATION.
+
+    Returns:
+        tuple[np.array, np.array]: The (J,) velocity limits in radians per second, and the (J,) acceleration limits.
+    """
+    radians_per_pulse: np.array = (math.pi * 2) / np.abs(np.array(STEPPER_CONVERSION_DICT))
+    return radians_per_pulse * pulse_rate, radians_per_pulse * pulse_acceleration
+
+
+def densify(path: np.array, resolution: float) -> np.array:
+    """Subdivides every segment of a joint space path, and drops repeated points.
+
+    Args:
+        path (np.array): The (N, J) joint angles.
+        resolution (float): The largest joint change between two points.
+
+    Returns:
+        np.array: The (M, J) joint angles, with the same first and last point.
+    """
+    steps: np.array = np.diff(path, axis=0)
+    moving: np.array = np.any(steps != 0.0, axis=1)
+    steps = steps[moving]
+    starts: np.array = path[:-1][moving]
+    if steps.shape[0] == 0:
+        return path[:1]
+
+    # Splits segment k in pieces[k] equal pieces, all at once.
+    pieces: np.array = np.maximum(1, np.ceil(np.max(np.abs(steps), axis=1) / resolution)).astype(int)
+    segment: np.array = np.repeat(np.arange(steps.shape[0]), pieces)
+    fraction: np.array = (np.arange(segment.shape[0]) - np.repeat(np.cumsum(pieces) - pieces, pieces)) / np.repeat(pieces, pieces)
+    return np.vstack([ starts[segment] + fraction[:, np.newaxis] * steps[segment], path[-1:] ])
+
+
+def retime(path: np.array, velocity: np.array, acceleration: np.array, rate: float = RETIMING_DEFAULT_RATE, start_velocity: np.array or None = None, resolution: float = RETIMING_DEFAULT_RESOLUTION) -> tuple[np.array, np.array]:
+    """Follows a joint space path as fast as the joint limits allow, ending at rest, and samples it at a fixed rate.
+
+    The path speed gets limited at every point, by the joint velocities along the path and by how fast the
+    joints change direction at corners. A forward pass then limits the acceleration and a backward pass the
+    deceleration, both are prefix minimums over the whole path. The time between points follows from the
+    constant acceleration between them.
+
+    Args:
+        path (np.array): The (N, J) joint angles to pass through, from the current ones.
+        velocity (np.array): The (J,) joint velocity limits.
+        acceleration (np.array): The (J,) joint acceleration limits.
+        rate (float, optional): The number of setpoints per second. Defaults to RETIMING_DEFAULT_RATE.
+        start_velocity (np.array or None, optional): The (J,) joint velocities at the start, None for at rest. Defaults to None.
+        resolution (float, optional): The largest joint change between two points of the path. Defaults to RETIMING_DEFAULT_RESOLUTION.
+
+    Returns:
+        tuple[np.array, np.array]: The (S,) setpoint times after the start, and the (S, J) setpoints, the last one is the end of the path.
+
+    A start velocity that can not be kept, because the path turns away or is too short to stop on, gets
+    lowered at once, Retimer brakes before calling us in that case.
+    """
+    path = np.atleast_2d(np.asarray(path, dtype=np.float64))
+    joints: int = path.shape[1]
+    velocity = np.asarray(velocity, dtype=np.float64)[:joints]
+    acceleration = np.asarray(acceleration, dtype=np.float64)[:joints]
+
+    points: np.array = densify(path, resolution)
+    if points.shape[0] == 1:
+        return np.zeros(0), np.zeros((0, joints))
+
+    # The path parameter is the distance in joint space, every piece is a straight line.
+    deltas: np.array = np.diff(points, axis=0)
+    lengths: np.array = np.linalg.norm(deltas, axis=1)
+    directions: np.array = deltas / lengths[:, np.newaxis]
+
+    # The squared path speed limits at every point, from the joint velocities along the pieces on both sides.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed: np.array = np.min(velocity / np.abs(directions), axis=1)
+        limit: np.array = np.empty(points.shape[0])
+        limit[1:-1] = np.minimum(speed[:-1], speed[1:]) ** 2
+
+        # Turning accelerates the joints too, every corner gets a share of the acceleration: the velocity jump
+        #  must fit in one sample, and the jumps along a curve must add up to at most the share per second.
+        turns: np.array = np.abs(directions[1:] - directions[:-1])
+        turns[turns < FLOAT_EPSILON] = 0.0
+        share: np.array = RETIMING_CORNER_SHARE * acceleration
+        spacing: np.array = (lengths[:-1] + lengths[1:]) / 2.0
+        limit[1:-1] = np.minimum(limit[1:-1], np.min((share / (rate * turns)) ** 2, axis=1))
+        limit[1:-1] = np.minimum(limit[1:-1], np.min(share * spacing[:, np.newaxis] / turns, axis=1))
+
+        # The pieces next to a corner keep the rest of the acceleration for speeding up and slowing down.
+        corner: np.array = np.any(turns > 0.0, axis=1)
+        bent: np.array = np.concatenate((corner, [ False ])) | np.concatenate(([ False ], corner))
+        gain: np.array = 2.0 * np.min(acceleration / np.abs(directions), axis=1) * np.where(bent, 1.0 - RETIMING_CORNER_SHARE, 1.0) * lengths
+    limit[-1] = 0.0
+    limit[0] = 0.0 if start_velocity is None else np.clip(np.dot(start_velocity[:joints], directions[0]), 0.0, speed[0]) ** 2
+
+    # Forward pass u[i + 1] = min(limit[i + 1], u[i] + gain[i]), unrolled into a prefix minimum.
+    reach: np.array = np.concatenate(([ 0.0 ], np.cumsum(gain)))
+    squared: np.array = np.minimum.accumulate(limit - reach) + reach
+
+    # Backward pass, the same from the end.
+    reach = np.concatenate(([ 0.0 ], np.cumsum(gain[::-1])))
+    squared = (np.minimum.accumulate(squared[::-1] - reach) + reach)[::-1]
+    speeds: np.array = np.sqrt(np.maximum(squared, 0.0))
+
+    # Constant acceleration between points, a piece between two stops accelerates and brakes half way.
+    accelerations: np.array = (speeds[1:] ** 2 - speeds[:-1] ** 2) / (2.0 * lengths)
+    total: np.array = speeds[:-1] + speeds[1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        durations: np.array = np.where(total > 0.0, 2.0 * lengths / total, 2.0 * lengths * np.sqrt(2.0 / gain))
+    times: np.array = np.concatenate(([ 0.0 ], np.cumsum(durations)))
+
+    # Samples the profile exactly, the last setpoint lands on the end of the path.
+    samples: np.array = np.minimum(np.arange(1, math.ceil(times[-1] * rate - 1e-9) + 1) / rate, times[-1])
+    piece: np.array = np.clip(np.searchsorted(times, samples, side='right') - 1, 0, lengths.shape[0] - 1)
+    elapsed: np.array = samples - times[piece]
+
+    # Pieces between two stops have no single acceleration, they get the same distance from both ends.
+    stopped: np.array = total[piece] == 0.0
+    half: np.array = durations[piece] / 2.0
+    braking: np.array = np.maximum(elapsed - half, 0.0)
+    ramp: np.array = lengths[piece] / (2.0 * np.where(stopped, half, 1.0) ** 2)
+    distance: np.array = np.where(
+        stopped,
+        ramp * (np.minimum(elapsed, half) ** 2 + 2.0 * half * braking - braking ** 2),
+        speeds[piece] * elapsed + 0.5 * accelerations[piece] * elapsed ** 2
+    )
+    distance = np.clip(distance, 0.0, lengths[piece])
+    return samples, points[piece] + directions[piece] * distance[:, np.newaxis]
+
+
+class Retimer:
+    """Sits between the solver and the Phy, turns every new solution into limited setpoints, one per tick."""
+
+    def __init__(self, rate: float = RETIMING_DEFAULT_RATE, velocity: np.array or None = None, acceleration: np.array or None = None, position: np.array or None = None) -> None:
+        """Initializes a new retimer.
+
+        Args:
+            rate (float, optional): The number of setpoints per second, the rate of whoever calls next. Defaults to RETIMING_DEFAULT_RATE.
+            velocity (np.array or None, optional): The joint velocity limits, None for the stepper limits. Defaults to None.
+            acceleration (np.array or None, optional): The joint acceleration limits, None for the stepper limits. Defaults to None.
+            position (np.array or None, optional): The joint angles the motors start at, None for the reset pose. Defaults to None.
+        """
+        limits: tuple[np.array, np.array] = joint_limits()
+        self.rate = rate
+        self.velocity_limit: np.array = limits[0] if velocity is None else np.asarray(velocity, dtype=np.float64)
+        self.acceleration_limit: np.array = limits[1] if acceleration is None else np.asarray(acceleration, dtype=np.float64)
+
+        # The last commanded setpoint and joint velocities, the motors start at rest.
+        self.position: np.array or None = None if position is None else np.array(position, dtype=np.float64)
+        self.velocity: np.array or None = None if position is None else np.zeros(self.position.shape[0])
+
+        self.setpoints: np.array = np.zeros((0, 0))
+        self.index: int = 0
+
+    def plan(self, path: np.array) -> None:
+        """Replaces the remaining setpoints by a path from the last commanded setpoint, keeping its velocity.
+
+        Args:
+            path (np.array): The (J,) joint angles to move to, or the (N, J) ones to move through.
+        """
+        path = np.atleast_2d(np.asarray(path, dtype=np.float64))
+
+        # Nothing was commanded yet and no start was given, the motors sit at the reset pose.
+        if self.position is None:
+            self.position = np.zeros(path.shape[1])
+            self.velocity = np.zeros(path.shape[1])
+
+        _, self.setpoints = retime(np.vstack([ self.position, path ]), self.velocity_limit, self.acceleration_limit, self.rate, self.velocity)
+        self.index = 0
+
+        # The path turns away too sharply, or is too short to stop on, brakes along the current direction first then.
+        acceleration: np.array = self.acceleration_limit[:path.shape[1]]
+        if self.setpoints.shape[0] > 0 and np.any(self.velocity != 0.0) and np.any(np.abs((self.setpoints[0] - self.position) * self.rate - self.velocity) * self.rate > acceleration * (1.0 + FLOAT_EPSILON)):
+            # Every joint brakes at its own limit and holds once stopped, the slowest one sets the duration.
+            stops: np.array = np.abs(self.velocity) / acceleration
+            duration: float = np.max(stops)
+            elapsed: np.array = np.minimum(np.arange(1, math.ceil(duration * self.rate - 1e-9) + 1) / self.rate, duration)
+            braked: np.array = np.minimum(elapsed[:, np.newaxis], stops)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                braking: np.array = self.position + self.velocity * np.where(stops > 0.0, braked - braked ** 2 / (2.0 * stops), 0.0)
+            _, setpoints = retime(np.vstack([ braking[-1], path ]), self.velocity_limit, self.acceleration_limit, self.rate)
+            self.setpoints = np.vstack([ braking, setpoints ])
+
+    def next(self) -> np.array or None:
+        """Gets the setpoint for this tick.
+
+        Returns:
+            np.array or None: The joint angles, or None when the motors are where they should be.
+        """
+        if self.index >= self.setpoints.shape[0]:
+            if self.velocity is not None:
+                self.velocity[:] = 0.0
+            return None
+
+        setpoint: np.array = self.setpoints[self.index]
+        self.index += 1
+        self.velocity = (setpoint - self.position) * self.rate
+        self.position = setpoint.copy()
+        return setpoint
@@ -0,0 +1,122 @@
+from __future__ import annotations
+from collections import OrderedDict
+from time import perf_counter
+import numpy as np
+
+from bone_vector import bone_vector
+from forward import fk
+from inverse import IKResult, TerminationReason, ik
+
+SOLUTION_CACHE_DEFAULT_MAX_SIZE: int = 1024
+SOLUTION_CACHE_DEFAULT_RESOLUTION: float = 0.1
+SOLUTION_CACHE_DEFAULT_EPSILON: float = 0.1
+
+
+class SolutionCache:
+    """A bounded LRU cache of IK solutions, keyed by the quantized target, the chain geometry and the solver."""
+
+    def __init__(self, max_size: int = SOLUTION_CACHE_DEFAULT_MAX_SIZE, resolution: float = SOLUTION_CACHE_DEFAULT_RESOLUTION, epsilon: float = SOLUTION_CACHE_DEFAULT_EPSILON) -> None:
+        """Initializes a new solution cache.
+
+        Args:
+            max_size (int, optional): The maximum number of stored solutions. Defaults to SOLUTION_CACHE_DEFAULT_MAX_SIZE.
+            resolution (float, optional): The grid size the targets get quantized to. Defaults to SOLUTION_CACHE_DEFAULT_RESOLUTION.
+            epsilon (float, optional): The maximum error of a stored solution for it to be used. Defaults to SOLUTION_CACHE_DEFAULT_EPSILON.
+        """
+        self.max_size = max_size
+        self.resolution = resolution
+        self.epsilon = epsilon
+
+        # The joint angles and the FK position they reach, by key.
+        self.entries: OrderedDict[tuple, tuple[tuple[float, ...], np.array]] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def key(self, start_bone: bone_vector, target: np.array, solver: callable = ik) -> tuple:
+        """Generates the cache key of a target.
+
+        Args:
+            start_bone (bone_vector): The first bone of the chain.
+            target (np.array): The target position.
+            solver (callable, optional): The solver that produces the solution, others may pick another branch. Defaults to ik.
+
+        Returns:
+            tuple: The key.
+        """
+        cell: tuple[int, ...] = tuple(round(float(value) / self.resolution) for value in target)
+        return (start_bone.fingerprint(), solver, cell)
+
+    def solve(self, start_bone: bone_vector, end_bone: bone_vector, target: np.array, solver: callable = ik, **kwargs) -> IKResult:
+        """Solves the target, using a stored solution if it is close enough.
+
+        Args:
+            start_bone (bone_vector): The first bone of the chain.
+            end_bone (bone_vector): The last bone of the chain.
+            target (np.array): The target position.
+            solver (callable, optional): The solver used on a miss. Defaults to ik.
+            **kwargs: Passed to the solver.
+
+        Returns:
+            IKResult: The remaining error and solver statistics.
+        """
+        start_time: float = perf_counter()
+        key: tuple = self.key(start_bone, target, solver)
+
+        # Tries the stored solution, a miss still starts the solver from it.
+        entry: tuple[tuple[float, ...], np.array] or None = self.entries.get(key)
+        if entry is not None:
+            thetas, position = entry
+            current: bone_vector or None = start_bone
+            for theta in thetas:
+                if current.theta != theta:
+                    current.set_theta(theta)
+                current = current.next
+
+            # The stored position is where these angles end up, no need for FK.
+            error: float = float(np.linalg.norm(target - position))
+            if error <= self.epsilon:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return IKResult(error, 0, 0, perf_counter() - start_time, TerminationReason.Cached)
+
+        self.misses += 1
+
+        result: IKResult = solver(start_bone, end_bone, target, **kwargs)
+
+        # Only stores solutions that actually reached the target.
+        if result.error <= self.epsilon:
+            solution: list[float] = []
+            current: bone_vector or None = start_bone
+            while current is not None:
+                solution.append(current.theta)
+                current = current.next
+
+            self.entries[key] = (tuple(solution), np.array(fk(end_bone)))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+        return result
+
+    def clear(self) -> None:
+        """Removes all stored solutions, and resets the counters.
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        """Gets the counters of the cache.
+
+        Returns:
+            dict[str, int]: The size, hits, misses and evictions.
+        """
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
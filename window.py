@@ -1,17 +1,23 @@
+from __future__ import annotations
 import math
 import sys
-from time import time
+from time import perf_counter, time
 import numpy as np
-import pygame
 from enum import Enum
-from OpenGL.GL import *
-from OpenGL.GLU import *
 from bone_vector import bone_vector
 from defs import DEFAULT_IK_TARGET, FLOAT_EPSILON, MOTION_MODE_ARC__END_ANGLE, MOTION_MODE_ARC__ORIENTATION, MOTION_MODE_ARC__POSITION, MOTION_MODE_ARC__PRESCALAR, MOTION_MODE_ARC__RADIUS, MOTION_MODE_ARC__START_ANGLE
-from chain import chain_bottom, chain_top
-from helpers import rad, rotation
-from inverse import ik
+from chain import chain_build
+from control import CONTROL_DEFAULT_RATE, ControlLoop, Snapshot, SnapshotBuffer
+from forward import fk_points
+from helpers import rad
+from analytic import ik_analytic
+from arc import ArcTable
+from inverse import IKResult, ik_multistart
+from metrics import registry
 from phy import Phy
+from recorder import Recorder
+from retiming import Retimer
+from solution_cache import SolutionCache
 
 
 class MotionMode(Enum):
@@ -39,10 +45,16 @@ class JoystickButton(Enum):
 
 
 class Window:
-    def __init__(self, width: int = 512, height: int = 512, phy: Phy or None = None) -> None:
+    def __init__(self, width: int = 512, height: int = 512, phy: Phy or None = None, control_rate: float = CONTROL_DEFAULT_RATE, recorder: Recorder or None = None, retime: bool = True) -> None:
         self.width = width
         self.height = height
         self.phy = phy
+        self.recorder = recorder
+
+        # Only loads pygame and OpenGL when a window actually opens, importing this module stays cheap.
+        import pygame
+        from OpenGL.GL import GL_BLEND, GL_DEPTH_TEST, GL_ONE_MINUS_SRC_ALPHA, GL_SRC_ALPHA, glBlendFunc, glEnable
+        from renderer import Renderer
 
         # Initializes pygame, with the joystick.
         pygame.init()
@@ -64,6 +76,9 @@ class Window:
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
+        # Creates the vertex buffers.
+        self.renderer: Renderer = Renderer()
+
         # Initializes the camera state.
         self.camera_rotation = [45, -45, 0]
         self.camera_position = [0, 0, -160]
@@ -78,6 +93,7 @@ class Window:
         self.ik_target: np.array = DEFAULT_IK_TARGET
         self.ik_had_previous_large_error = False
         self.motion_mode = MotionMode.Arc
+        self.solution_cache = SolutionCache()
 
         # Initializes the joystick stuff.
         self.joystick_left_arrow_pressed = False
@@ -103,18 +119,47 @@ class Window:
         self.arc_radius: float = MOTION_MODE_ARC__RADIUS
         self.arc_position: np.array = MOTION_MODE_ARC__POSITION
         self.arc_orientation: list[float] = MOTION_MODE_ARC__ORIENTATION
+        self.arc_table: ArcTable = ArcTable()
+
+        # The control thread does target generation, IK and PHY output, the render loop only draws its snapshots.
+        self.pending_target: np.array or None = None
+        self.pending_updates: int = 0
+        self.arc_angle: float or None = None
+        self.ik_error: float = 0.0
+        self.ik_solve_time: float = 0.0
+        self.chain_changed = False
+        self.rumble_requested = False
+        self.bones: list[bone_vector] = []
+        bones: dict[str, bone_vector] = chain_build()
+        self.start_bone: bone_vector = bones['chain_bottom']
+        self.end_bone: bone_vector = bones['chain_top']
+        current: bone_vector or None = self.start_bone
+        while current is not None:
+            self.bones.append(current)
+            current = current.next
+        self.snapshots: SnapshotBuffer = SnapshotBuffer(len(self.bones))
+
+        # Spreads every jump of the solution over as many ticks as the steppers need, one setpoint per tick,
+        #  starting from the reset pose the chain is built in, where the motors are at launch.
+        self.retimer: Retimer or None = Retimer(rate=control_rate, position=[ bone.theta for bone in self.bones ]) if phy is not None and retime else None
+        stages: list[tuple[str, callable]] = [
+            ('target', self.control_target),
+            ('ik', self.control_ik),
+            ('phy', self.control_phy),
+            ('publish', self.control_publish)
+        ]
+        if recorder is not None:
+            stages.append(('record', self.control_record))
+        self.control: ControlLoop = ControlLoop(stages, rate=control_rate)
 
     def handle_joystick_button_down(self, button: JoystickButton) -> None:
         if button == JoystickButton.Cross:
-            # Resets the chain.
-            chain_bottom.reset_chain()
-
-            # Recomputes.
-            self.solve_ik_target()
+            # Resets the chain, and recomputes.
+            self.control.post(self.reset_chain)
             return
         elif button == JoystickButton.Circle:
             # Sets the default target.
-            self.update_ik_target(DEFAULT_IK_TARGET)
+            self.control.post(lambda: self.queue_ik_target(DEFAULT_IK_TARGET))
             return
         elif button == JoystickButton.ArrowLeft:
             self.joystick_left_arrow_pressed = True
@@ -135,11 +180,7 @@ class Window:
             self.joystick_back_right_pressed = True
             return
         elif button == JoystickButton.Options:
-            if self.motion_mode == MotionMode.Manual:
-                self.motion_mode = MotionMode.Arc
-            elif self.motion_mode == MotionMode.Arc:
-                self.motion_mode = MotionMode.Manual
-            print(f'Changed motion mode to {self.motion_mode}')
+            self.control.post(self.toggle_motion_mode)
         elif button == JoystickButton.LeftJoyStick:
             self.joystick_left_stick_pressed = True
             return
@@ -174,6 +215,8 @@ class Window:
             return
 
     def handle_key_down(self, event: pygame.event) -> None:
+        import pygame
+
         # Arrow Keys
         if event.key == pygame.K_LEFT:
             self.left_key_pressed = True
@@ -187,10 +230,15 @@ class Window:
         elif event.key == pygame.K_DOWN:
             self.down_key_pressed = True
             return
+        elif event.key == pygame.K_m:
+            registry.dump()
         elif event.key == pygame.K_q:
+            self.stop()
             sys.exit(0)
 
     def handle_key_up(self, event: pygame.event) -> None:
+        import pygame
+
         # Arrow Keys
         if event.key == pygame.K_LEFT:
             self.left_key_pressed = False
@@ -213,8 +261,11 @@ class Window:
         self.height = event.y
 
     def handle_events(self) -> None:
+        import pygame
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                self.stop()
                 sys.exit()
             elif event.type == pygame.KEYDOWN:
                 self.handle_key_down(event)
@@ -233,72 +284,18 @@ class Window:
                 self.handle_window_resize(event)
 
     def set_color(self, r: float, g: float, b: float, a=1.0) -> None:
+        from OpenGL.GL import glColor4f
         glColor4f(r, g, b, a)
 
-    def draw_arc(self, position: np.array = np.array([ 0.0, 0.0, 0.0 ]), transform: np.array = np.identity(3), radius: float = 1.0, width: float = 5.0, start: float = 0.0, end: float = 2 * math.pi) -> None:
-        # Sets the line width.
-        glLineWidth(width)
-
-        # Starts drawing the lines.
-        glBegin(GL_LINES)
-        steps: int = int((abs(end - start) / math.pi) * 30)
-        for i in range(0, steps):
-            angle: float = start + ((end - start) / float(steps)) * i
-            vertex_x, vertex_y = math.cos(angle) * radius, math.sin(angle) * radius
-            vertex_position = np.matmul(
-                transform, np.array([vertex_x, vertex_y, 0.0]))
-            vertex_position = np.add(vertex_position, position)
-            glVertex3f(vertex_position[0], vertex_position[1], vertex_position[2])
-
-        glEnd()
+    def draw_arc(self, position: np.array = np.array([ 0.0, 0.0, 0.0 ]), orientation: list[float] = [ 0.0, 0.0, 0.0 ], radius: float = 1.0, width: float = 5.0, start: float = 0.0, end: float = 2 * math.pi) -> None:
+        self.renderer.draw_arc(position, orientation, radius, width, start, end)
 
     def draw_chain(self, start: bone_vector, end: bone_vector) -> None:
-        # Initialize stuff.
-        end_effector: np.array = np.array([0.0, 0.0, 0.0])
-
-        # Contains an array of points which will be the end-points of the joints.
-        lines = []
-
-        # Performs something similar to forward kinematics.
-        current: bone_vector or None = end
-        while current is not None:
-            # Gets the current (not-rotated) end effector position.
-            current_end_effector = np.add(end_effector, current.vector())
-
-            # Performs the rotation to the current_end_effector.
-            current_end_effector = np.matmul(
-                current.matrix(), current_end_effector)
-
-            # Performs some requirements for the visualization.
-            for i in range(0, len(lines)):
-                lines[i] = np.add(lines[i], current.vector())
-                lines[i] = np.matmul(current.matrix(), lines[i])
-            lines.append(np.matmul(current.matrix(), current.vector()))
-
-            # Sets the end_effector position to the current end effector position,
-            #  and goes to the (next) previous chain element, so we can apply it's
-            #  transformations to the current one.
-            end_effector = current_end_effector
-            current = current.prev
-
-        # Adds the origin.
-        lines.append(np.array([0, 0, 0]))
-
-        # Draws the lines.
-        for i in range(0, len(lines) - 1):
-            self.set_color(1.0, 1.0, 1.0)
-            self.draw_dot(lines[i], 5)
-            self.set_color(1.0, 0.5, 1.0)
-            self.draw_line(lines[i], lines[i + 1], dotted=True)
-
-        # Draws a dotted line to the end effector.
-        self.set_color(1.0, 0.5, 0.5)
-        self.draw_line([0, 0, 0], end_effector, dotted=True)
-
-        # Dras the axis.
-        self.draw_axis(position=end_effector, size=5.0)
+        self.renderer.draw_chain(fk_points(end))
 
     def draw_dot(self, position: np.array = np.array([0.0, 0.0, 0.0]), size: float = 20) -> None:
+        from OpenGL.GL import GL_POINTS, glBegin, glEnd, glPointSize, glVertex3f
+
         # Sets the point size.
         glPointSize(size)
 
@@ -308,6 +305,8 @@ class Window:
         glEnd()
 
     def draw_line(self, start: any, end: any, width=10.0, dotted=False) -> None:
+        from OpenGL.GL import GL_LINE_STIPPLE, GL_LINES, glBegin, glDisable, glEnable, glEnd, glLineStipple, glLineWidth, glVertex3f
+
         # Checks if we need to enable line stippling.
         if dotted:
             glEnable(GL_LINE_STIPPLE)
@@ -327,19 +326,12 @@ class Window:
             glDisable(GL_LINE_STIPPLE)
 
     def draw_axis(self, position: np.array = np.array([0, 0, 0]), size: float = 5.0, width: float = 2.0) -> None:
-        # X
-        self.set_color(1.0, 0.0, 0.0, 0.7)
-        self.draw_line(position, np.add(position, [size, 0.0, 0.0]), width)
-
-        # Y
-        self.set_color(0.0, 1.0, 0.0, 0.7)
-        self.draw_line(position, np.add(position, [0.0, size, 0.0]), width)
-
-        # Z
-        self.set_color(0.0, 0.0, 1.0, 0.7)
-        self.draw_line(position, np.add(position, [0.0, 0.0, size]), width)
+        self.renderer.draw_axis(position, size, width)
 
     def render_camera(self) -> None:
+        from OpenGL.GL import GL_PROJECTION, glLoadIdentity, glMatrixMode, glRotatef, glTranslatef
+        from OpenGL.GLU import gluPerspective
+
         # Sets the matrix mode to the projection matrix, and loads the identity matrix.
         glMatrixMode(GL_PROJECTION)
         glLoadIdentity()
@@ -355,10 +347,14 @@ class Window:
         glRotatef(self.camera_rotation[2], 0.0, 0.0, 1.0)
 
     def clear_screen(self) -> None:
+        from OpenGL.GL import GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, glClear, glClearColor
         glClearColor(0.1, 0.1, 0.1, 0.0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
     def render(self) -> None:
+        # Takes the latest state of the control thread, the chain itself belongs to that thread.
+        snapshot: Snapshot = self.snapshots.read()
+
         # Clears the screen.
         self.clear_screen()
 
@@ -368,18 +364,18 @@ class Window:
 
         # Draws the IK Target.
         self.set_color(0.2, 1.0, 0.2, 0.9)
-        self.draw_dot(position=self.ik_target, size=10)
-        self.draw_chain(chain_bottom, chain_top)
+        self.draw_dot(position=snapshot.target, size=10)
+        self.renderer.draw_chain(snapshot.points)
 
         # Renders the arc.
-        if self.motion_mode == MotionMode.Arc:
+        if snapshot.arc_visible:
             self.set_color(1.0, 1.0, 1.0, 0.7)
             self.draw_arc(
-                position=self.arc_position,
-                transform=rotation.xyz(self.arc_orientation[0], self.arc_orientation[1], self.arc_orientation[2]),
-                radius=self.arc_radius,
-                start=self.arc_start,
-                end=self.arc_end
+                position=snapshot.arc[0:3],
+                orientation=snapshot.arc[3:6].tolist(),
+                radius=snapshot.arc[6],
+                start=snapshot.arc[7],
+                end=snapshot.arc[8]
             )
 
     def update_ik_target(self, new_target: np.array) -> None:
@@ -389,31 +385,205 @@ class Window:
         # Solves the target.
         self.solve_ik_target()
 
-    def solve_ik_target(self) -> None:
-        # Performs the IK Solving.
-        start_time = time()
-        error: float = ik(start_bone=chain_bottom, end_bone=chain_top, target=self.ik_target)
-        end_time = time()
-        print(f'Solved new IK target with error: {error} in {end_time - start_time}')
+    def handle_ik_error(self, error: float) -> None:
+        self.ik_error = error
 
-        # Vibrates if the error is large
-        if error == None or error > 1.0:
+        # Vibrates once when the error becomes large, the render loop owns the joystick.
+        if error > 1.0:
             if not self.ik_had_previous_large_error:
                 self.ik_had_previous_large_error = True
-                if self.joystick is not None:
-                    self.joystick.rumble(60.0, 70.0, 100)
+                self.rumble_requested = True
         else:
             self.ik_had_previous_large_error = False
-        
-        # Updates the Phy.
-        if self.phy is not None:
-            self.phy.write_chain(chain_bottom)
+
+    def reset_chain(self) -> None:
+        self.start_bone.reset_chain()
+        self.solve_ik_target()
+
+    def toggle_motion_mode(self) -> None:
+        if self.motion_mode == MotionMode.Manual:
+            self.motion_mode = MotionMode.Arc
+        elif self.motion_mode == MotionMode.Arc:
+            self.motion_mode = MotionMode.Manual
+        print(f'Changed motion mode to {self.motion_mode}')
+
+    def play_arc(self, angle: float) -> None:
+        # Looks up the joint angles, the table gets rebuilt first if the arc changed.
+        start_time: float = perf_counter()
+        thetas, target, error = self.arc_table.lookup(self.start_bone, self.end_bone, angle, self.arc_position, self.arc_orientation, self.arc_radius)
+        self.ik_solve_time = perf_counter() - start_time
+        self.ik_target = target
+        self.handle_ik_error(error)
+
+        # Applies the joint angles.
+        current: bone_vector or None = self.start_bone
+        for theta in thetas:
+            current.set_theta(float(theta))
+            current = current.next
+        self.chain_changed = True
+
+    def solve_ik_target(self) -> None:
+        # Performs the IK Solving.
+        result: IKResult = self.solution_cache.solve(self.start_bone, self.end_bone, self.ik_target, solver=ik_analytic, fallback=ik_multistart)
+        registry.observe_ik(result)
+        self.ik_solve_time = result.wall_time
+
+        # Vibrates if the error is large
+        self.handle_ik_error(result.error)
+        self.chain_changed = True
+
+    def control_target(self) -> None:
+        """The target stage of the control loop, turns the inputs into targets (manual) or an angle on the arc.
+        """
+        self.arc_angle = None
+
+        # Checks how to Interpret the inputs.
+        if self.motion_mode == MotionMode.Manual:
+            # Does something with the axis data, all axes add up to a single move.
+            delta: np.array = np.zeros(3)
+            updates: int = 0
+            if abs(self.axis_data[0]) > 0.1:
+                delta[0] += self.axis_data[0] / 4.0
+                updates += 1
+            if abs(self.axis_data[1]) > 0.1:
+                delta[2] += self.axis_data[1] / 4.0
+                updates += 1
+            if abs(self.axis_data[3]) > 0.1:
+                delta[1] -= self.axis_data[3] / 4.0
+                updates += 1
+
+            if updates > 0:
+                self.queue_ik_target(np.add(self.ik_target if self.pending_target is None else self.pending_target, delta), updates)
+        elif self.motion_mode == MotionMode.Arc:
+            arc_modified: bool = False
+
+            # Checks if we need to modify shit.
+            if self.joystick_left_stick_pressed:
+                if abs(self.axis_data[0]) > 0.1:
+                    self.arc_orientation[1] += self.axis_data[0] / 40.0
+                    arc_modified = True
+                if abs(self.axis_data[1]) > 0.1:
+                    self.arc_orientation[0] += self.axis_data[1] / 40.0
+                    arc_modified = True
+            else:
+                if abs(self.axis_data[0]) > 0.1:
+                    self.arc_position = np.add(self.arc_position, [self.axis_data[0] / 4.0, 0.0, 0.0])
+                    arc_modified = True
+                if abs(self.axis_data[1]) > 0.1:
+                    self.arc_position = np.add(self.arc_position, [0.0, 0.0, self.axis_data[1] / 4.0])
+                    arc_modified = True
+
+            if self.joystick_right_stick_pressed:
+                if abs(self.axis_data[2]) > 0.1:
+                    self.arc_radius += self.axis_data[2]
+                    arc_modified = True
+            else:
+                if abs(self.axis_data[3]) > 0.1:
+                    self.arc_position = np.add(self.arc_position, [0.0, - self.axis_data[3] / 4.0, 0.0])
+                    arc_modified = True
+
+            if self.axis_data[4] > 0.4:
+                self.arc_start -= rad(self.axis_data[4] / 2.0)
+                if self.arc_start < rad(0.0):
+                    self.arc_start = rad(0.0)
+                arc_modified = True
+
+            if self.axis_data[5] > 0.4:
+                self.arc_start += rad(self.axis_data[5] / 2.0)
+                if self.arc_start > rad(360.0):
+                    self.arc_start = rad(360.0)
+                arc_modified = True
+
+            if arc_modified:
+                self.arc_table.invalidate()
+            else:
+                # Clamps the time between two values.
+                delta: float = abs(self.arc_end - self.arc_start)
+                t: float = time() / ((MOTION_MODE_ARC__PRESCALAR / (math.pi * 2)) * delta)
+                clamped: float = t % 2 * delta
+
+                # Determines the angle, moves forward and backwards.
+                angle: float = 0.0
+                if clamped <= delta:
+                    angle = self.arc_start + clamped
+                elif clamped > delta:
+                    angle = self.arc_end - clamped - self.arc_start
+                self.arc_angle = angle
+
+    def queue_ik_target(self, target: np.array, updates: int = 1) -> None:
+        """Replaces the target to solve on the next IK stage, older unsolved targets are dropped.
+
+        Args:
+            target (np.array): The new target.
+            updates (int, optional): The number of target updates it combines. Defaults to 1.
+        """
+        self.pending_target = target
+        self.pending_updates += updates
+        registry.increment('manual.target_updates', updates)
+
+    def control_ik(self) -> None:
+        # Solves only the latest target, however many updates led up to it.
+        if self.pending_target is not None:
+            registry.increment('manual.solves')
+            registry.increment('manual.solves_saved', self.pending_updates - 1)
+            target: np.array = self.pending_target
+            self.pending_target = None
+            self.pending_updates = 0
+            self.update_ik_target(target)
+
+        # Plays back the precomputed joint angles.
+        if self.arc_angle is not None:
+            self.play_arc(self.arc_angle)
+
+    def control_phy(self) -> None:
+        if self.phy is None:
+            self.chain_changed = False
+            return
+
+        # Updates the Phy, only when the chain moved.
+        if self.retimer is None:
+            if self.chain_changed:
+                self.phy.write_chain(self.start_bone)
+            self.chain_changed = False
+            return
+
+        # Replans from the last setpoint when the chain moved, and writes the setpoint of this tick.
+        if self.chain_changed:
+            self.retimer.plan([ bone.theta for bone in self.bones ])
+        self.chain_changed = False
+
+        setpoint: np.array or None = self.retimer.next()
+        if setpoint is not None:
+            self.phy.write_thetas(setpoint)
+
+    def control_publish(self) -> None:
+        points: np.array = fk_points(self.end_bone)
+        arc: tuple[np.array, list[float], float, float, float] or None = None
+        if self.motion_mode == MotionMode.Arc:
+            arc = (self.arc_position, self.arc_orientation, self.arc_radius, self.arc_start, self.arc_end)
+        self.snapshots.write([ bone.theta for bone in self.bones ], points, self.ik_target, self.ik_error, arc)
+
+    def control_record(self) -> None:
+        # Records what was asked and what was solved this tick, from the snapshot that was just published.
+        snapshot: Snapshot = self.snapshots.slots[self.snapshots.front]
+        self.recorder.append(snapshot.timestamp, snapshot.target, snapshot.thetas, snapshot.error, self.ik_solve_time)
+
+    def stop(self) -> None:
+        # Stops the control thread first, so nothing gets recorded while the recording is closed.
+        self.control.stop()
+        if self.recorder is not None:
+            self.recorder.close()
 
     def run(self) -> None:
-        # Initial target solve.
+        import pygame
+
+        # Initial target solve, then the chain belongs to the control thread.
         self.solve_ik_target()
+        self.control_phy()
+        self.control_publish()
+        self.control.start()
 
-        # Event loop.
+        # Render loop.
         while True:
             # Handles the events.
             self.handle_events()
@@ -434,77 +604,17 @@ class Window:
             if self.joystick_back_left_pressed:
                 self.camera_position[2] -= 0.5
 
-            # Checks how to Interpret the inputs.
-            if self.motion_mode == MotionMode.Manual:
-                # Does something with the axis data.
-                if abs(self.axis_data[0]) > 0.1:
-                    self.update_ik_target(
-                        np.add(self.ik_target, [self.axis_data[0] / 4.0, 0.0, 0.0]))
-                if abs(self.axis_data[1]) > 0.1:
-                    self.update_ik_target(
-                        np.add(self.ik_target, [0.0, 0.0, self.axis_data[1] / 4.0]))
-                if abs(self.axis_data[3]) > 0.1:
-                    self.update_ik_target(
-                        np.add(self.ik_target, [0.0, - self.axis_data[3] / 4.0, 0.0]))
-            elif self.motion_mode == MotionMode.Arc:
-                arc_modified: bool = False
-
-                # Checks if we need to modify shit.
-                if self.joystick_left_stick_pressed:
-                    if abs(self.axis_data[0]) > 0.1:
-                        self.arc_orientation[1] += self.axis_data[0] / 40.0
-                        arc_modified = True
-                    if abs(self.axis_data[1]) > 0.1:
-                        self.arc_orientation[0] += self.axis_data[1] / 40.0
-                        arc_modified = True
-                else:
-                    if abs(self.axis_data[0]) > 0.1:
-                        self.arc_position = np.add(self.arc_position, [self.axis_data[0] / 4.0, 0.0, 0.0])
-                        arc_modified = True
-                    if abs(self.axis_data[1]) > 0.1:
-                        self.arc_position = np.add(self.arc_position, [0.0, 0.0, self.axis_data[1] / 4.0])
-                        arc_modified = True
-                
-                if self.joystick_right_stick_pressed:
-                    if abs(self.axis_data[2]) > 0.1:
-                        self.arc_radius += self.axis_data[2]
-                        arc_modified = True
-                else:
-                    if abs(self.axis_data[3]) > 0.1:
-                        self.arc_position = np.add(self.arc_position, [0.0, - self.axis_data[3] / 4.0, 0.0])
-                        arc_modified = True
-
-                if self.axis_data[4] > 0.4:
-                    self.arc_start -= rad(self.axis_data[4] / 2.0)
-                    if self.arc_start < rad(0.0):
-                        self.arc_start = rad(0.0)
-                    arc_modified = True
-                
-                if self.axis_data[5] > 0.4:
-                    self.arc_start += rad(self.axis_data[5] / 2.0)
-                    if self.arc_start > rad(360.0):
-                        self.arc_start = rad(360.0)
-                    arc_modified = True
+            # Nothing gets solved or sent to the arm anymore once the control thread gave up.
+            if self.control.failed:
+                print(f'Control loop stopped after {self.control.errors} errors, last: {self.control.error!r}')
+                self.stop()
+                sys.exit(1)
 
-                if not arc_modified:
-                    # Clamps the time between two values.
-                    delta: float = abs(self.arc_end - self.arc_start)
-                    t: float = time() / ((MOTION_MODE_ARC__PRESCALAR / (math.pi * 2)) * delta)
-                    clamped: float = t % 2 * delta
-                    
-                    # Determines the angle, moves forward and backwards.
-                    angle: float = 0.0
-                    if clamped <= delta:
-                        angle = self.arc_start + clamped
-                    elif clamped > delta:
-                        angle = self.arc_end - clamped - self.arc_start
-
-                    # Performs the computation.
-                    x: float = math.cos(angle) * self.arc_radius
-                    y: float = math.sin(angle) * self.arc_radius
-                    target: np.array = np.matmul(rotation.xyz(self.arc_orientation[0], self.arc_orientation[1], self.arc_orientation[2]), np.array([ x, y, 0.0 ]))
-                    target = np.add(self.arc_position, target)
-                    self.update_ik_target(target)
+            # Vibrates when the control thread asked for it.
+            if self.rumble_requested:
+                self.rumble_requested = False
+                if self.joystick is not None:
+                    self.joystick.rumble(60.0, 70.0, 100)
 
             # Renders.
             self.render()
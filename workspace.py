@@ -0,0 +1,193 @@
+from __future__ import annotations
+import math
+import numpy as np
+
+from bone_vector import bone_vector
+from forward import fk, fk_batch
+
+WORKSPACE_DEFAULT_SAMPLES: int = 20000
+WORKSPACE_LEAF_SIZE: int = 32
+
+
+class WorkspaceIndex:
+    """A KD-tree over the end effector positions of sampled joint configurations, used to seed IK."""
+
+    def __init__(self, thetas: np.array, positions: np.array, fingerprint: str, leaf_size: int = WORKSPACE_LEAF_SIZE) -> None:
+        """Initializes a new workspace index, and builds the tree.
+
+        Args:
+            thetas (np.array): The (N, J) sampled joint angles.
+            positions (np.array): The (N, 3) end effector positions of the samples.
+            fingerprint (str): The fingerprint of the chain the samples belong to.
+            leaf_size (int, optional): The maximum number of samples in a leaf. Defaults to WORKSPACE_LEAF_SIZE.
+        """
+        self.thetas = np.ascontiguousarray(thetas, dtype=float)
+        self.positions = np.ascontiguousarray(positions, dtype=float)
+        self.fingerprint = fingerprint
+        self.leaf_size = leaf_size
+
+        self.build_tree()
+
+    def build_tree(self) -> None:
+        """Builds the KD-tree, the nodes are stored in flat arrays and leaves point to ranges of self.order.
+        """
+
+        # Node arrays, leaves have a split dimension of -1.
+        split_dims: list[int] = []
+        split_values: list[float] = []
+        children: list[list[int]] = []
+        ranges: list[tuple[int, int]] = []
+
+        self.order = np.arange(self.positions.shape[0])
+
+        # Splits every node on the median of its widest dimension.
+        stack: list[tuple[int, int, int]] = [ (0, self.positions.shape[0], -1) ]
+        while len(stack) > 0:
+            start, end, parent = stack.pop()
+
+            node: int = len(split_dims)
+            split_dims.append(-1)
+            split_values.append(0.0)
+            children.append([ -1, -1 ])
+            ranges.append((start, end))
+
+            # Links the node to its parent, the left child is always created first.
+            if parent >= 0:
+                children[parent][0 if children[parent][0] < 0 else 1] = node
+
+            if end - start <= self.leaf_size:
+                continue
+
+            points: np.array = self.positions[self.order[start:end]]
+            dim: int = int(np.argmax(np.ptp(points, axis=0)))
+            middle: int = (end - start) // 2
+            partition: np.array = np.argpartition(points[:, dim], middle)
+            self.order[start:end] = self.order[start:end][partition]
+
+            split_dims[node] = dim
+            split_values[node] = float(self.positions[self.order[start + middle], dim])
+
+            # Pushes the right half first, so the left one gets popped (and created) first.
+            stack.append((start + middle, end, node))
+            stack.append((start, start + middle, node))
+
+        self.split_dims = np.array(split_dims)
+        self.split_values = np.array(split_values)
+        self.children = np.array(children)
+        self.ranges = np.array(ranges)
+
+    def nearest(self, target: np.array) -> tuple[int, float]:
+        """Finds the sample whose end effector is closest to the target.
+
+        Args:
+            target (np.array): The target position.
+
+        Returns:
+            tuple[int, float]: The index of the sample, and its distance to the target.
+        """
+
+        best_index: int = -1
+        best_distance: float = math.inf
+
+        stack: list[tuple[int, float]] = [ (0, 0.0) ]
+        while len(stack) > 0:
+            node, bound = stack.pop()
+
+            # Skips the node if it cannot contain anything closer.
+            if bound >= best_distance:
+                continue
+
+            dim: int = self.split_dims[node]
+            if dim < 0:
+                start, end = self.ranges[node]
+                indices: np.array = self.order[start:end]
+                distances: np.array = np.sum((self.positions[indices] - target) ** 2, axis=1)
+                leaf_best: int = int(np.argmin(distances))
+                if distances[leaf_best] < best_distance:
+                    best_distance = float(distances[leaf_best])
+                    best_index = int(indices[leaf_best])
+                continue
+
+            # Visits the side of the target first, the other side only when the split plane is close enough.
+            offset: float = target[dim] - self.split_values[node]
+            near, far = (self.children[node][0], self.children[node][1]) if offset < 0.0 else (self.children[node][1], self.children[node][0])
+            stack.append((far, max(bound, offset ** 2)))
+            stack.append((near, bound))
+
+        return best_index, math.sqrt(best_distance)
+
+    def seed(self, start_bone: bone_vector, end_bone: bone_vector, target: np.array) -> bool:
+        """Moves the chain to the stored configuration closest to the target, if it is better than the current one.
+
+        Args:
+            start_bone (bone_vector): The first bone of the chain.
+            end_bone (bone_vector): The last bone of the chain.
+            target (np.array): The target position.
+
+        Returns:
+            bool: True if the chain was seeded.
+        """
+        index, distance = self.nearest(target)
+        if distance >= np.linalg.norm(target - fk(end_bone)):
+            return False
+
+        current: bone_vector or None = start_bone
+        for theta in self.thetas[index]:
+            current.set_theta(float(theta))
+            current = current.next
+
+        return True
+
+    def build(start_bone: bone_vector, samples: int = WORKSPACE_DEFAULT_SAMPLES, seed: int = 0) -> WorkspaceIndex:
+        """Builds a workspace index by sampling the joint space within the limits of the chain.
+
+        Args:
+            start_bone (bone_vector): The first bone of the chain.
+            samples (int, optional): The number of configurations to sample. Defaults to WORKSPACE_DEFAULT_SAMPLES.
+            seed (int, optional): The random seed. Defaults to 0.
+
+        Returns:
+            WorkspaceIndex: The resulting index.
+        """
+
+        # Gets the limits of each joint, unlimited joints can turn all the way around.
+        lower: list[float] = []
+        upper: list[float] = []
+        current: bone_vector or None = start_bone
+        while current is not None:
+            lower.append(-math.pi if current.theta_min is None else current.theta_min)
+            upper.append(math.pi if current.theta_max is None else current.theta_max)
+            current = current.next
+
+        # Samples the joint space, and runs FK on all of it at once.
+        rng: np.random.Generator = np.random.default_rng(seed)
+        thetas: np.array = rng.uniform(lower, upper, size=(samples, len(lower)))
+        positions: np.array = fk_batch(start_bone, thetas)
+
+        return WorkspaceIndex(thetas, positions, start_bone.fingerprint())
+
+    def save(self, path: str) -> None:
+        """Saves the samples to a .npz file, the tree gets rebuilt on load.
+
+        Args:
+            path (str): The file path.
+        """
+        np.savez(path, thetas=self.thetas, positions=self.positions, fingerprint=np.array(self.fingerprint))
+
+    def load(path: str, start_bone: bone_vector or None = None) -> WorkspaceIndex:
+        """Loads a workspace index from a .npz file.
+
+        Args:
+            path (str): The file path.
+            start_bone (bone_vector or None, optional): If given, the chain the index must belong to. Defaults to None.
+
+        Returns:
+            WorkspaceIndex: The resulting index.
+        """
+        with np.load(path) as data:
+            index: WorkspaceIndex = WorkspaceIndex(data['thetas'], data['positions'], str(data['fingerprint']))
+
+        if start_bone is not None and start_bone.fingerprint() != index.fingerprint:
+            raise ValueError(f'Workspace index {path} was built for another chain')
+
+        return index